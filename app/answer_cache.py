@@ -0,0 +1,166 @@
+"""
+Semantic answer cache
+---------------------
+Sits in front of the Groq call. An entry is reused when
+  • the new question embedding is within ANSWER_CACHE_THRESHOLD cosine similarity
+    of a cached question, and
+  • retrieval returned the same set of chunk IDs (same evidence → same answer).
+
+Entries expire after ANSWER_CACHE_TTL seconds, the least recently used ones are
+evicted beyond ANSWER_CACHE_MAX_ENTRIES, and everything is dropped whenever
+rag_pipeline changes the vector store.
+
+Entries live in one SQLite database per namespace (WAL mode): a store writes
+only its own row, and several processes can share the file without overwriting
+each other's answers.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+CACHE_DIR = os.getenv("ANSWER_CACHE_DIR", ".cache")
+SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+STORE_MANIFEST = os.path.join("vectorstore", "rag_docs_final_manifest.json")
+# A sharded store versions all shards together in its registry
+SHARD_REGISTRY = os.path.join("vectorstore", "shards.json")
+
+
+def version_path():
+    return SHARD_REGISTRY if os.path.exists(SHARD_REGISTRY) else STORE_MANIFEST
+
+
+def store_version(manifest_path=None):
+    """Content version written by rag_pipeline; changes whenever the indexed chunks change."""
+    manifest_path = manifest_path or version_path()
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("version")
+    except (OSError, ValueError):
+        return None
+
+
+def chunk_fingerprint(chunk_ids, namespace=""):
+    """Order-independent hash of the retrieved evidence (plus the prompt namespace)."""
+    joined = namespace + "\n" + "\n".join(sorted(chunk_ids))
+    return hashlib.sha256(joined.encode("utf-8")).hexdigest()[:32]
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+
+class SemanticAnswerCache:
+    def __init__(self, namespace, cache_dir=CACHE_DIR, threshold=SIMILARITY_THRESHOLD,
+                 ttl=TTL_SECONDS, max_entries=MAX_ENTRIES, manifest_path=None):
+        # One database per namespace: each entry point has its own prompt
+        self.namespace = namespace
+        self.path = os.path.join(cache_dir, f"answers_{namespace}.sqlite")
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.manifest_path = manifest_path or version_path()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._manifest_mtime = None
+        os.makedirs(cache_dir or ".", exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, fingerprint TEXT, question TEXT, "
+            "vector BLOB, answer TEXT, created REAL, used REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_fingerprint ON entries (fingerprint)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_used ON entries (used)")
+        self._db.commit()
+        with self._lock:
+            self._check_store()
+
+    # ---------------- persistence ---------------- #
+    def _check_store(self):
+        """Drop every entry once the vector store has been rebuilt with different content (caller holds the lock)."""
+        try:
+            mtime = os.path.getmtime(self.manifest_path)
+        except OSError:
+            mtime = None
+        if mtime == self._manifest_mtime:
+            return
+        self._manifest_mtime = mtime
+        version = store_version(self.manifest_path)
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'store_version'").fetchone()
+        if (row[0] if row else None) != version:
+            if self._db.execute("DELETE FROM entries").rowcount:
+                print("♻️ Vector store changed — answer cache invalidated")
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('store_version', ?)", (version,))
+            self._db.commit()
+
+    def _evict(self, now):
+        """Expired entries, then the least recently used ones beyond max_entries."""
+        self._db.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl,))
+        excess = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self._db.execute("DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY used LIMIT ?)",
+                             (excess,))
+
+    # ---------------- public API ---------------- #
+    def lookup(self, question_vector, chunk_ids):
+        """Return a cached answer for a semantically equivalent question over the same chunks, or None."""
+        fingerprint = chunk_fingerprint(chunk_ids, self.namespace)
+        query = _unit(question_vector)
+        now = time.time()
+        with self._lock:
+            self._check_store()
+            # Only questions over the same evidence are candidates (indexed lookup, not a scan)
+            rows = self._db.execute(
+                "SELECT key, vector FROM entries WHERE fingerprint = ? AND created >= ?", (fingerprint, now - self.ttl)
+            ).fetchall()
+            best_key, best_score = None, self.threshold
+            for key, vector in rows:
+                score = float(np.dot(query, np.frombuffer(vector, dtype=np.float32)))
+                if score >= best_score:
+                    best_key, best_score = key, score
+
+            if best_key is None:
+                self.misses += 1
+                return None
+            answer = self._db.execute("SELECT answer FROM entries WHERE key = ?", (best_key,)).fetchone()[0]
+            self._db.execute("UPDATE entries SET used = ? WHERE key = ?", (now, best_key))
+            self._db.commit()
+            self.hits += 1
+            return answer
+
+    def store(self, question, question_vector, chunk_ids, answer):
+        fingerprint = chunk_fingerprint(chunk_ids, self.namespace)
+        key = hashlib.sha256(f"{fingerprint}\n{question}".encode("utf-8")).hexdigest()[:32]
+        now = time.time()
+        with self._lock:
+            self._check_store()
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, fingerprint, question, vector, answer, created, used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, fingerprint, question, _unit(question_vector).tobytes(), answer, now, now),
+            )
+            self._evict(now)
+            self._db.commit()
+
+    def _count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": self._count(),
+        }
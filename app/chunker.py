@@ -0,0 +1,266 @@
+"""
+Structure-aware chunker
+-----------------------
+Cuts documents on paragraph and sentence boundaries into chunks of at most
+CHUNK_TOKENS tokens, counted with the embedding model's own tokenizer
+(encode_batch over many sentences at a time). Every chunk carries provenance,
+stored as vector-store metadata:
+
+    source      file the chunk came from
+    page_start  first / last page the chunk spans (only when the text has page
+    page_end    breaks: hybrid_extract_all.py writes a form feed between pages)
+    section     the most recent heading before the chunk
+    char_start  character offsets of the chunk in the source file
+    char_end
+    tokens      chunk length in tokenizer tokens
+
+A new section always starts a new chunk, a sentence longer than the limit is
+split on token boundaries, and the last sentence of a chunk is repeated at the
+start of the next one for continuity (CHUNK_OVERLAP_SENTENCES).
+"""
+
+import os
+import re
+
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "200"))
+CHUNK_OVERLAP_SENTENCES = int(os.getenv("CHUNK_OVERLAP_SENTENCES", "1"))
+PAGE_BREAK = "\f"
+TOKENIZE_BATCH = 512
+MAX_PARAGRAPH_CHARS = 1 << 16  # text without blank lines is still streamed, cut at the last newline
+MAX_SECTION_CHARS = 120
+CHUNKER_VERSION = "structure-v1"
+
+# Paragraph boundary: a blank line or a page break
+PARAGRAPH_RE = re.compile(r"\n[ \t]*\n|\f")
+# Sentence = text up to terminal punctuation followed by whitespace (or the end)
+SENTENCE_RE = re.compile(r"\S.*?(?:[.!?][\"')\]]*(?=\s)|$)", re.S)
+# Headings: markdown "# Title", a short standalone line in Title/UPPER case,
+# or a line of nothing but 3+ upper-case words as OCR produces ("01 INTRODUCTION TO LLMS").
+# Upper-case runs inside a sentence ("the BM25 RAG LLM pipeline") are acronyms, not headings.
+HEADING_RE = re.compile(
+    r"^#{1,6}[ \t]+(?P<md>[^\n]+)$"
+    r"|^(?P<line>(?:\d+(?:\.\d+)*\.?[ \t]+)?[A-Z][^\n.!?;:]{2,80})$"
+    r"|^[ \t]*(?P<caps>(?:\d{1,2}(?:\.\d+)*[ \t]+)?[A-Z][A-Z0-9'&/-]+(?:[ \t,]+[A-Z][A-Z0-9'&/-]*){2,})[ \t]*$",
+    re.M,
+)
+
+
+def copy_tokenizer(tokenizer):
+    """Independent copy without truncation/padding (the embedder's own copy truncates at its max length)."""
+    from tokenizers import Tokenizer
+
+    copy = Tokenizer.from_str(tokenizer.to_str())
+    copy.no_truncation()
+    copy.no_padding()
+    return copy
+
+
+def embedder_tokenizer(embedder):
+    """
+    The tokenizers.Tokenizer behind an Embedder (ONNX or SentenceTransformer), else loaded by model name.
+    None (4 characters per token) for stand-in embedders such as the benchmark's HashingEmbedder, whose
+    made-up model names must not send the Hub loader into offline retries.
+    """
+    from embedder import BACKENDS
+
+    tokenizer = getattr(embedder, "tokenizer", None)
+    if tokenizer is None and hasattr(embedder, "model"):
+        tokenizer = getattr(embedder.model.tokenizer, "backend_tokenizer", None)
+    if tokenizer is not None:
+        return copy_tokenizer(tokenizer)
+    if getattr(embedder, "backend", None) not in BACKENDS:
+        return None
+    from context_packer import load_tokenizer
+    return load_tokenizer(embedder.model_name)
+
+
+def has_page_breaks(blocks):
+    return any(PAGE_BREAK in block for block in blocks)
+
+
+def iter_paragraphs(blocks):
+    """Stream (page, start_offset, text) paragraphs out of text blocks; pages count form feeds from 1."""
+    buffer, base, page = "", 0, 1
+    for block in blocks:
+        buffer += block
+        consumed = 0
+        for match in PARAGRAPH_RE.finditer(buffer):
+            if buffer[consumed:match.start()].strip():
+                yield page, base + consumed, buffer[consumed:match.start()]
+            if match.group() == PAGE_BREAK:
+                page += 1
+            consumed = match.end()
+        buffer = buffer[consumed:]
+        base += consumed
+        if len(buffer) > MAX_PARAGRAPH_CHARS:
+            cut = buffer.rfind("\n") + 1 or len(buffer)
+            if buffer[:cut].strip():
+                yield page, base, buffer[:cut]
+            buffer = buffer[cut:]
+            base += cut
+    if buffer.strip():
+        yield page, base, buffer
+
+
+def heading_text(match):
+    text = match.group("md") or match.group("line") or match.group("caps")
+    return " ".join(text.split())[:MAX_SECTION_CHARS]
+
+
+def is_heading_line(match):
+    """Standalone lines only count as headings when they look like titles, not like prose."""
+    if match.group("caps") is not None:
+        return len(match.group("caps")) <= MAX_SECTION_CHARS
+    if match.group("line") is None:
+        return True
+    words = match.group("line").split()
+    return len(words) <= 12 and sum(w[:1].isupper() or w[:1].isdigit() for w in words) >= len(words) * 0.6
+
+
+def paragraph_units(page, start, text):
+    """Sentences of one paragraph as dicts; a heading starts its own unit and carries the new section."""
+    cuts = [(m.start(), heading_text(m)) for m in HEADING_RE.finditer(text) if is_heading_line(m)]
+    bounds = [0] + [pos for pos, _ in cuts if pos > 0] + [len(text)]
+    headings = dict(cuts)
+    units = []
+    for seg_start, seg_end in zip(bounds, bounds[1:]):
+        heading = headings.get(seg_start)
+        for i, m in enumerate(SENTENCE_RE.finditer(text, seg_start, seg_end)):
+            sentence = m.group().strip()
+            if sentence:
+                units.append({"page": page, "start": start + m.start(), "end": start + m.start() + len(m.group().rstrip()),
+                              "text": sentence, "heading": heading if i == 0 else None})
+    if units:
+        units[0]["paragraph_start"] = True
+    return units
+
+
+class StructureChunker:
+    def __init__(self, tokenizer=None, max_tokens=CHUNK_TOKENS, overlap_sentences=CHUNK_OVERLAP_SENTENCES):
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.overlap_sentences = overlap_sentences
+
+    def _tokenize(self, units):
+        """Token counts (and offsets for splitting) for a batch of units, in one encode_batch call."""
+        if self.tokenizer is None:
+            for unit in units:
+                unit["tokens"] = (len(unit["text"]) + 3) // 4
+                unit["offsets"] = None
+            return
+        encodings = self.tokenizer.encode_batch([u["text"] for u in units], add_special_tokens=False)
+        for unit, encoding in zip(units, encodings):
+            unit["tokens"] = len(encoding.ids)
+            unit["offsets"] = encoding.offsets
+
+    def _split_long(self, unit):
+        """Cut a sentence longer than the limit at token boundaries, preferring whitespace."""
+        text, pieces, pos = unit["text"], [], 0
+        while pos < len(text):
+            if unit["offsets"]:
+                window = [end for _, end in unit["offsets"] if end > pos]
+                cut = window[self.max_tokens - 1] if len(window) > self.max_tokens else len(text)
+            else:
+                cut = min(len(text), pos + self.max_tokens * 4)
+            space = text.rfind(" ", pos + 1, cut)
+            if cut < len(text) and space > pos:
+                cut = space
+            piece = text[pos:cut].strip()
+            if piece:
+                offset = unit["start"] + pos + (len(text[pos:cut]) - len(text[pos:cut].lstrip()))
+                pieces.append(dict(unit, text=piece, start=offset, end=offset + len(piece), heading=unit["heading"] if pos == 0 else None))
+            pos = cut
+        self._tokenize(pieces)
+        return pieces
+
+    def _units(self, blocks):
+        batch = []
+        for page, start, text in iter_paragraphs(blocks):
+            batch.extend(paragraph_units(page, start, text))
+            if len(batch) >= TOKENIZE_BATCH:
+                yield from self._prepared(batch)
+                batch = []
+        if batch:
+            yield from self._prepared(batch)
+
+    def _prepared(self, units):
+        self._tokenize(units)
+        for unit in units:
+            if unit["tokens"] > self.max_tokens:
+                yield from self._split_long(unit)
+            else:
+                yield unit
+
+    def chunks(self, blocks, source, paged=True):
+        """Yield (text, metadata) for one document given as a stream of text blocks."""
+        current, tokens, section = [], 0, None
+
+        def emit(units, section):
+            text = units[0]["text"]
+            for unit in units[1:]:
+                text += ("\n" if unit.get("paragraph_start") else " ") + unit["text"]
+            metadata = {"source": source, "char_start": units[0]["start"], "char_end": units[-1]["end"],
+                        "tokens": sum(u["tokens"] for u in units)}
+            if paged:
+                metadata["page_start"], metadata["page_end"] = units[0]["page"], units[-1]["page"]
+            if section:
+                metadata["section"] = section
+            return text, metadata
+
+        for unit in self._units(blocks):
+            new_section = unit["heading"] is not None
+            # Back-to-back headings (or a heading right after a tiny fragment) share one chunk
+            section_break = new_section and tokens >= self.max_tokens // 8
+            if current and (section_break or tokens + unit["tokens"] > self.max_tokens):
+                yield emit(current, section)
+                # Carry the tail sentence(s) over, unless a new section starts or they would crowd the chunk
+                carry = current[-self.overlap_sentences:] if self.overlap_sentences and not section_break else []
+                carry_tokens = sum(u["tokens"] for u in carry)
+                if carry_tokens + unit["tokens"] > self.max_tokens or carry_tokens > self.max_tokens // 4:
+                    carry = []
+                current, tokens = list(carry), carry_tokens
+            if new_section:
+                section = unit["heading"]
+            current.append(unit)
+            tokens += unit["tokens"]
+        if current:
+            yield emit(current, section)
+
+
+def metadata_filter(pages=None, section=None):
+    """
+    Chroma ``where`` filter for chunks overlapping a page range (first, last) and/or
+    in one section; None when nothing is restricted.
+    """
+    conditions = []
+    if pages:
+        first, last = pages
+        conditions += [{"page_start": {"$lte": int(last)}}, {"page_end": {"$gte": int(first)}}]
+    if section:
+        conditions.append({"section": section})
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def citation(metadata):
+    """Short provenance label such as 'guide.txt p. 4–5'; '' without metadata."""
+    if not metadata:
+        return ""
+    label = metadata.get("source", "")
+    start, end = metadata.get("page_start"), metadata.get("page_end")
+    if start is not None:
+        label += f" p. {start}" if start == end else f" p. {start}–{end}"
+    return label.strip()
+
+
+def store_outline(collection):
+    """Section headings (first-seen order) and the last page number in a collection, for filter pickers."""
+    sections, last_page = {}, 0
+    for metadata in collection.get(include=["metadatas"])["metadatas"]:
+        if not metadata:
+            continue
+        if metadata.get("section"):
+            sections.setdefault(metadata["section"], None)
+        last_page = max(last_page, metadata.get("page_end", 0))
+    return list(sections), last_page
@@ -0,0 +1,202 @@
+"""
+Token-budgeted context packing
+------------------------------
+Retrieved chunks overlap (the chunker repeats the last sentence of a chunk at
+the start of the next) and the top hits are often neighbours, so joining them
+verbatim puts the same text into the prompt twice. The packer:
+
+  • stitches chunks whose end overlaps another's start back into one
+    contiguous span, and drops chunks already contained in a span
+  • counts tokens with a real tokenizer (CONTEXT_TOKENIZER, by default the
+    embedding model's) and fills CONTEXT_TOKEN_BUDGET in relevance order —
+    a chunk that does not fit is skipped and later, smaller ones still get in
+  • emits spans ordered by their best-ranked chunk; given the chunks'
+    metadata, each span is headed by a citation label ("[guide.txt p. 4–5]",
+    counted against the budget) so the model can cite pages
+
+    packer = get_packer()
+    context, info = packer.pack(docs, metadatas=metas)   # info: tokens, spans, citations, chunks used/dropped, chars saved
+"""
+
+import os
+import threading
+from chunker import citation
+from tracing import stage
+
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", os.getenv("EMBEDDING_MODEL", "BAAI/bge-small-en"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+MIN_OVERLAP_CHARS = 20
+SEPARATOR = "\n\n"
+
+
+def load_tokenizer(name=CONTEXT_TOKENIZER):
+    """tokenizers.Tokenizer from a local ONNX export if present, else the Hugging Face hub; None if unavailable."""
+    from tokenizers import Tokenizer
+    from embedder import onnx_model_dir
+
+    local = os.path.join(onnx_model_dir(name), "tokenizer.json")
+    try:
+        tokenizer = Tokenizer.from_file(local) if os.path.exists(local) else Tokenizer.from_pretrained(name)
+    except Exception as e:
+        print(f"⚠️ Tokenizer '{name}' unavailable ({e}) — estimating 4 characters per token")
+        return None
+    tokenizer.no_truncation()
+    tokenizer.no_padding()
+    return tokenizer
+
+
+def suffix_prefix_overlap(left, right, min_overlap=MIN_OVERLAP_CHARS):
+    """Length of the longest suffix of ``left`` that is a prefix of ``right`` (0 if shorter than min_overlap)."""
+    if len(left) < min_overlap or len(right) < min_overlap:
+        return 0
+    probe = right[:min_overlap]
+    start = max(0, len(left) - len(right))
+    pos = left.find(probe, start)
+    while pos != -1:
+        if right.startswith(left[pos:]):
+            return len(left) - pos
+        pos = left.find(probe, pos + 1)
+    return 0
+
+
+def merge_text(a, b, min_overlap=MIN_OVERLAP_CHARS):
+    """a and b as one contiguous text if one contains or overlaps the other, else None."""
+    if b in a:
+        return a
+    if a in b:
+        return b
+    overlap = suffix_prefix_overlap(a, b, min_overlap)
+    if overlap:
+        return a + b[overlap:]
+    overlap = suffix_prefix_overlap(b, a, min_overlap)
+    if overlap:
+        return b + a[overlap:]
+    return None
+
+
+class ContextPacker:
+    def __init__(self, tokenizer=None, budget=CONTEXT_TOKEN_BUDGET, separator=SEPARATOR):
+        self.tokenizer = tokenizer
+        self.budget = budget
+        self.separator = separator
+        self._separator_tokens = self.count(separator)
+
+    def count(self, text):
+        if self.tokenizer is None:
+            return (len(text) + 3) // 4
+        return len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+
+    def truncate(self, text, max_tokens):
+        """Longest prefix of text that fits in max_tokens."""
+        if self.tokenizer is None:
+            return text[:max_tokens * 4]
+        encoding = self.tokenizer.encode(text, add_special_tokens=False)
+        if len(encoding.ids) <= max_tokens:
+            return text
+        return text[:encoding.offsets[max_tokens - 1][1]] if max_tokens > 0 else ""
+
+    def _absorb(self, spans, text, metadata=None):
+        """Spans after adding text, merging transitively (a new chunk can bridge two spans)."""
+        spans = [dict(span) for span in spans]
+        merged = {"text": text, "rank": None, "metadatas": [metadata] if metadata else []}
+        changed = True
+        while changed:
+            changed = False
+            for i, span in enumerate(spans):
+                joined = merge_text(span["text"], merged["text"])
+                if joined is not None:
+                    rank = span["rank"] if merged["rank"] is None else min(span["rank"], merged["rank"])
+                    merged = {"text": joined, "rank": rank, "metadatas": span["metadatas"] + merged["metadatas"]}
+                    del spans[i]
+                    changed = True
+                    break
+        return spans, merged
+
+    @staticmethod
+    def _label(span):
+        """Citation for a span: its chunks' source with the page range they cover together."""
+        metadatas = span["metadatas"]
+        if not metadatas:
+            return ""
+        combined = dict(metadatas[0])
+        pages = [m["page_start"] for m in metadatas if "page_start" in m] + [m["page_end"] for m in metadatas if "page_end" in m]
+        if pages:
+            combined["page_start"], combined["page_end"] = min(pages), max(pages)
+        return citation(combined)
+
+    def _render(self, span):
+        return f"[{span['label']}]\n{span['text']}" if span["label"] else span["text"]
+
+    def _measure(self, span):
+        span["label"] = self._label(span)
+        span["tokens"] = self.count(self._render(span))
+
+    def _total(self, spans):
+        return sum(span["tokens"] for span in spans) + self._separator_tokens * max(len(spans) - 1, 0)
+
+    def pack(self, documents, budget=None, metadatas=None):
+        """Return (context, info) for chunks given best first; metadatas (parallel to documents) add citations."""
+        budget = budget or self.budget
+        metadatas = metadatas or [None] * len(documents)
+        with stage("pack_context", chunks=len(documents), budget=budget) as trace_span:
+            spans, used, dropped, used_chars = [], 0, 0, 0
+            for rank, (doc, metadata) in enumerate(zip(documents, metadatas)):
+                doc = doc.strip()
+                if not doc:
+                    continue
+                rest, merged = self._absorb(spans, doc, metadata)
+                if merged["rank"] is None:
+                    merged["rank"] = rank
+                self._measure(merged)
+                candidate = rest + [merged]
+                if self._total(candidate) <= budget:
+                    spans = candidate
+                    used += 1
+                    used_chars += len(doc)
+                elif not spans:
+                    # Even the best chunk alone is over budget: keep as much of it as fits
+                    label_tokens = self.count(self._render(dict(merged, text=""))) if merged["label"] else 0
+                    merged["text"] = self.truncate(merged["text"], max(budget - label_tokens, 0))
+                    self._measure(merged)
+                    spans = [merged]
+                    used += 1
+                    used_chars += len(merged["text"])
+                else:
+                    dropped += 1
+
+            spans.sort(key=lambda span: span["rank"])
+            context = self.separator.join(self._render(span) for span in spans)
+            info = {
+                "tokens": self._total(spans),
+                "budget": budget,
+                "spans": len(spans),
+                "citations": [span["label"] for span in spans if span["label"]],
+                "chunks_used": used,
+                "chunks_dropped": dropped,
+                "chars_saved": used_chars - sum(len(span["text"]) for span in spans),
+            }
+            for key, value in info.items():
+                trace_span.set_attribute(key, value)
+        return context, info
+
+
+_packer = None
+_packer_lock = threading.Lock()
+
+
+def get_packer():
+    """The process-wide packer (tokenizer loaded once)."""
+    global _packer
+    with _packer_lock:
+        if _packer is None:
+            _packer = ContextPacker(load_tokenizer())
+        return _packer
+
+
+def format_packing(info):
+    """One-line summary, e.g. 'context 812/1500 tokens | 5 chunks → 3 spans | 240 chars deduplicated'."""
+    line = (f"context {info['tokens']}/{info['budget']} tokens | "
+            f"{info['chunks_used']} chunks → {info['spans']} spans | {info['chars_saved']} chars deduplicated")
+    if info["chunks_dropped"]:
+        line += f" | {info['chunks_dropped']} over budget"
+    return line
@@ -0,0 +1,223 @@
+"""
+Page-indexed columnar document store
+------------------------------------
+Every extractor writes its output here instead of loose text files, and
+ingestion streams from it. One Parquet file per (document, extractor) under
+DOC_STORE_DIR, rows sorted by page and block:
+
+    doc          source file name, e.g. "mastering_rag.pdf"
+    page         1-based page number
+    block        position of the block on its page
+    block_type   text / title / table / list / figure / page
+    text         block text
+    method       how it was extracted (text_layer, structured, fallback, layout, ...)
+    source_hash  sha256 of the source file the rows came from
+
+The file's schema metadata repeats doc, extractor, source_hash and page_count,
+so checking whether a document is up to date never reads its rows: extractors
+skip unchanged sources and rewrite only the documents whose hash changed.
+
+    store = DocumentStore()
+    if not store.is_current("guide.pdf", "hybrid", file_hash("input/guide.pdf")):
+        store.write("guide.pdf", "hybrid", source_hash, rows, page_count)
+    for block in store.iter_text("guide.pdf"):   # form feed between pages, for the chunker
+        ...
+"""
+
+import os
+import re
+import json
+import hashlib
+
+DOC_STORE_DIR = os.getenv("DOC_STORE_DIR", "data/doc_store")
+# When several extractors processed the same document, ingestion reads the first available
+EXTRACTOR_PREFERENCE = [e for e in os.getenv("DOC_STORE_EXTRACTORS", "hybrid,layout,text").split(",") if e]
+# Block types that carry document text; figure OCR and other noise stay in the store only
+INGEST_BLOCK_TYPES = ("text", "title", "list", "table", "table_caption", "figure_caption", "page")
+READ_BATCH_ROWS = 1024
+PAGE_BREAK = "\f"
+STORE_VERSION = "1"
+
+
+def file_hash(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("doc", pa.string()),
+        ("page", pa.int32()),
+        ("block", pa.int32()),
+        ("block_type", pa.string()),
+        ("text", pa.string()),
+        ("method", pa.string()),
+        ("source_hash", pa.string()),
+    ])
+
+
+def is_doc_store(path):
+    """True for a directory holding document store files (rag_pipeline accepts it as a source)."""
+    return os.path.isdir(path) and any(name.endswith(".parquet") for name in os.listdir(path))
+
+
+def layout_block_text(block):
+    """Plain text of one PaddleOCR PPStructure block: OCR lines joined, tables flattened to 'a | b' rows."""
+    res = block.get("res")
+    if isinstance(res, dict):  # table: recognised structure as HTML
+        rows = re.findall(r"<tr>(.*?)</tr>", res.get("html", ""), re.S)
+        return "\n".join(" | ".join(re.sub(r"<[^>]+>", "", cell).strip()
+                                    for cell in re.findall(r"<td[^>]*>(.*?)</td>", row, re.S)) for row in rows)
+    lines = []
+    for item in res or []:
+        if isinstance(item, dict):
+            lines.append(item.get("text", "").strip())
+        elif isinstance(item, list):  # older table format: rows of cells
+            lines.append(" | ".join(cell.get("text", "").strip() for cell in item))
+    return " ".join(line for line in lines if line)
+
+
+def layout_rows(page, blocks, method="layout"):
+    """Store rows for one page of PPStructure blocks, in the order the layout engine returned them."""
+    return [(page, i, block["type"], layout_block_text(block), method) for i, block in enumerate(blocks)]
+
+
+class DocumentStore:
+    def __init__(self, root=DOC_STORE_DIR):
+        self.root = root
+
+    def path_for(self, doc, extractor):
+        safe = re.sub(r"[^a-zA-Z0-9_.-]", "_", doc)
+        return os.path.join(self.root, f"{safe}.{extractor}.parquet")
+
+    @staticmethod
+    def _read_info(path):
+        import pyarrow.parquet as pq
+
+        try:
+            metadata = pq.read_schema(path).metadata or {}
+        except (OSError, ValueError):
+            return None
+        raw = metadata.get(b"doc_store")
+        return json.loads(raw) if raw else None
+
+    def info(self, doc, extractor):
+        """The file's metadata (doc, extractor, source_hash, page_count, complete), or None."""
+        return self._read_info(self.path_for(doc, extractor))
+
+    def is_current(self, doc, extractor, source_hash):
+        info = self.info(doc, extractor)
+        return bool(info and info["source_hash"] == source_hash and info.get("complete", True)
+                    and info.get("version") == STORE_VERSION)
+
+    def write(self, doc, extractor, source_hash, rows, page_count, complete=True):
+        """
+        Replace one document's rows atomically. ``rows`` are (page, block, block_type, text, method)
+        tuples in any order; ``complete=False`` marks a partial extraction that reruns should redo.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        rows = sorted(rows, key=lambda row: (row[0], row[1]))
+        columns = list(zip(*rows)) if rows else [[]] * 5
+        info = {"doc": doc, "extractor": extractor, "source_hash": source_hash, "page_count": page_count,
+                "complete": complete, "version": STORE_VERSION}
+        schema = _schema().with_metadata({"doc_store": json.dumps(info)})
+        table = pa.Table.from_arrays([
+            pa.array([doc] * len(rows), pa.string()),
+            pa.array(columns[0], pa.int32()),
+            pa.array(columns[1], pa.int32()),
+            pa.array(columns[2], pa.string()),
+            pa.array(columns[3], pa.string()),
+            pa.array(columns[4], pa.string()),
+            pa.array([source_hash] * len(rows), pa.string()),
+        ], schema=schema)
+
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path_for(doc, extractor)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        # Repeated doc / hash / type values cost next to nothing with dictionary encoding
+        pq.write_table(table, tmp_path, compression="zstd", use_dictionary=True)
+        os.replace(tmp_path, path)
+        return path
+
+    def documents(self):
+        """{doc: [info, ...]} for every file in the store."""
+        docs = {}
+        if not os.path.isdir(self.root):
+            return docs
+        for name in sorted(os.listdir(self.root)):
+            if name.endswith(".parquet"):
+                info = self._read_info(os.path.join(self.root, name))
+                if info:
+                    docs.setdefault(info["doc"], []).append(info)
+        return docs
+
+    def preferred(self, preference=None):
+        """(doc, extractor) pairs to ingest: per document the first extractor in the preference order."""
+        preference = preference or EXTRACTOR_PREFERENCE
+        chosen = []
+        for doc, infos in self.documents().items():
+            available = {info["extractor"] for info in infos}
+            ranked = [e for e in preference if e in available] or sorted(available)
+            chosen.append((doc, ranked[0]))
+        return chosen
+
+    def iter_rows(self, doc, extractor, columns=("page", "block", "block_type", "text", "method")):
+        """Stream row dicts in page order, one record batch at a time."""
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(self.path_for(doc, extractor))
+        for batch in parquet.iter_batches(batch_size=READ_BATCH_ROWS, columns=list(columns)):
+            yield from batch.to_pylist()
+
+    def iter_text(self, doc, extractor=None, block_types=INGEST_BLOCK_TYPES):
+        """
+        Text blocks for the chunker: blocks of one page separated by blank lines, pages by a
+        form feed (empty pages included, so page numbers stay exact). Titles become markdown
+        headings so the chunker picks them up as sections.
+        """
+        extractor = extractor or dict(self.preferred()).get(doc)
+        info = self.info(doc, extractor) or {}
+        page = 1
+        first_on_page = True
+        for row in self.iter_rows(doc, extractor, ("page", "block_type", "text")):
+            if row["block_type"] not in block_types or not (row["text"] or "").strip():
+                continue
+            while page < row["page"]:
+                yield PAGE_BREAK
+                page += 1
+                first_on_page = True
+            text = row["text"].strip()
+            if row["block_type"] == "title":
+                text = "# " + " ".join(text.split())
+            yield text if first_on_page else "\n\n" + text
+            first_on_page = False
+        while page < info.get("page_count", page):
+            yield PAGE_BREAK
+            page += 1
+
+    def export_text(self, doc, path, extractor=None):
+        """Write one document as flat text (form feed between pages) for tools that want a file."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for block in self.iter_text(doc, extractor):
+                f.write(block)
+        return path
+
+
+if __name__ == "__main__":
+    store = DocumentStore()
+    docs = store.documents()
+    if not docs:
+        print(f"📭 Document store is empty: {DOC_STORE_DIR}")
+    for doc, infos in docs.items():
+        for info in infos:
+            state = "" if info.get("complete", True) else " (incomplete)"
+            print(f"📄 {doc} [{info['extractor']}] {info['page_count']} pages, "
+                  f"sha256 {info['source_hash'][:12]}{state}")
@@ -0,0 +1,269 @@
+"""
+Shared embedding backend
+------------------------
+One embedder per process for every script and the Streamlit app, with a
+selectable CPU backend (EMBEDDING_BACKEND):
+
+    torch      SentenceTransformer in full precision (default)
+    onnx       the same transformer exported to ONNX, run with onnxruntime
+    onnx-int8  the ONNX export with dynamically quantized int8 weights
+
+The ONNX backends only need onnxruntime + tokenizers at query time; torch is
+imported once, to export the model. Run this file to export both ONNX variants
+and check that every backend returns equivalent embeddings.
+"""
+
+import os
+import re
+import json
+import time
+import threading
+import functools
+import numpy as np
+from embedding_cache import get_cache
+from tracing import stage
+
+MODEL_NAME = os.getenv("EMBEDDING_MODEL", "BAAI/bge-small-en")
+BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+BACKENDS = ("torch", "onnx", "onnx-int8")
+ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", ".cache/onnx")
+BATCH_SIZE = 32
+
+# Minimum per-text cosine similarity to the torch backend for the equivalence check
+EQUIVALENCE_THRESHOLDS = {"torch": 0.9999, "onnx": 0.999, "onnx-int8": 0.98}
+
+
+def onnx_model_dir(model_name=MODEL_NAME):
+    return os.path.join(ONNX_DIR, re.sub(r"[^a-zA-Z0-9_.-]", "_", model_name))
+
+
+def export_onnx(model_name=MODEL_NAME, quantize=True):
+    """Export the SentenceTransformer's transformer to ONNX (+ int8 variant) with its tokenizer and pooling config."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    out_dir = onnx_model_dir(model_name)
+    os.makedirs(out_dir, exist_ok=True)
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0]
+    module_names = [m.__class__.__name__ for m in st_model]
+    pooling = next(m for m in st_model if m.__class__.__name__ == "Pooling")
+    if pooling.pooling_mode_cls_token:
+        pooling_mode = "cls"
+    elif pooling.pooling_mode_mean_tokens:
+        pooling_mode = "mean"
+    else:
+        raise ValueError(f"❌ Unsupported pooling for ONNX export: {pooling.get_pooling_mode_str()}")
+
+    transformer.tokenizer.save_pretrained(out_dir)
+    sample = transformer.tokenizer(["export sample"], return_tensors="pt")
+    input_names = [k for k in ("input_ids", "attention_mask", "token_type_ids") if k in sample]
+
+    class LastHiddenState(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs))).last_hidden_state
+
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]}
+    fp32_path = os.path.join(out_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            LastHiddenState(transformer.auto_model.eval()),
+            tuple(sample[k] for k in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+            dynamo=False,
+        )
+    print(f"📦 Exported ONNX model → {fp32_path}")
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        int8_path = os.path.join(out_dir, "model_int8.onnx")
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        print(f"📦 Quantized int8 model → {int8_path}")
+
+    with open(os.path.join(out_dir, "embedder.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "pooling": pooling_mode,
+            "normalize": "Normalize" in module_names,
+            "max_seq_length": st_model.max_seq_length,
+            "dim": st_model.get_sentence_embedding_dimension(),
+        }, f, indent=2)
+    return out_dir
+
+
+class Embedder:
+    def __init__(self, model_name=MODEL_NAME, backend=BACKEND):
+        if backend not in BACKENDS:
+            raise ValueError(f"❌ Unknown embedding backend '{backend}', expected one of {BACKENDS}")
+        self.model_name = model_name
+        self.backend = backend
+        # Backends produce slightly different vectors, so they never share cache entries
+        self.cache = get_cache(model_name if backend == "torch" else f"{model_name}#{backend}")
+        if backend == "torch":
+            self._load_torch()
+        else:
+            self._load_onnx()
+        print(f"🧬 Embedder ready: {model_name} [{backend}]")
+
+    def _load_torch(self):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(self.model_name, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def _load_onnx(self):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_dir = onnx_model_dir(self.model_name)
+        model_file = "model_int8.onnx" if self.backend == "onnx-int8" else "model.onnx"
+        if not os.path.exists(os.path.join(model_dir, model_file)):
+            print(f"⚙️ No ONNX export found for {self.model_name}, exporting once...")
+            export_onnx(self.model_name, quantize=self.backend == "onnx-int8")
+
+        with open(os.path.join(model_dir, "embedder.json"), "r", encoding="utf-8") as f:
+            config = json.load(f)
+        self.pooling = config["pooling"]
+        self.normalize = config["normalize"]
+        self.dim = config["dim"]
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=config["max_seq_length"])
+        self.tokenizer.no_padding()  # batches are padded to their own longest sequence
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def _encode_onnx(self, texts, batch_size):
+        encodings = self.tokenizer.encode_batch(texts)
+        # Length-sorted batches keep padding (and wasted FLOPs) to a minimum
+        order = np.argsort([len(e.ids) for e in encodings], kind="stable")
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            batch = [encodings[i] for i in idx]
+            max_len = max(len(e.ids) for e in batch)
+            feeds = {name: np.zeros((len(batch), max_len), dtype=np.int64) for name in self.input_names}
+            for row, enc in enumerate(batch):
+                n = len(enc.ids)
+                feeds["input_ids"][row, :n] = enc.ids
+                feeds["attention_mask"][row, :n] = enc.attention_mask
+                if "token_type_ids" in feeds:
+                    feeds["token_type_ids"][row, :n] = enc.type_ids
+            hidden = self.session.run(None, feeds)[0]
+            if self.pooling == "cls":
+                pooled = hidden[:, 0]
+            else:
+                mask = feeds["attention_mask"][..., None].astype(np.float32)
+                pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if self.normalize:
+                pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            out[idx] = pooled
+        return out
+
+    def encode_uncached(self, texts, batch_size=BATCH_SIZE, show_progress_bar=False):
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        if self.backend == "torch":
+            # SentenceTransformer already length-sorts its batches internally
+            return self.model.encode(texts, batch_size=batch_size, convert_to_numpy=True,
+                                     show_progress_bar=show_progress_bar).astype(np.float32)
+        return self._encode_onnx(texts, batch_size)
+
+    def encode(self, texts, batch_size=BATCH_SIZE):
+        """Embed texts through the persistent cache; only misses reach the model."""
+        texts = list(texts)
+        with stage("embed", texts=len(texts), backend=self.backend) as span:
+            def encode_misses(misses):
+                span.set_attribute("cache_misses", len(misses))
+                return self.encode_uncached(misses, batch_size)
+
+            return self.cache.encode(texts, encode_misses)
+
+    def chroma_function(self):
+        return embedder_function_class()(self)
+
+
+@functools.lru_cache(maxsize=None)
+def embedder_function_class():
+    """Defined on first use: importing chromadb costs about a second and the local backend never needs it."""
+    from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+
+    class EmbedderFunction(SentenceTransformerEmbeddingFunction):
+        """
+        Chroma embedding function backed by the shared Embedder. It presents itself
+        as Chroma's SentenceTransformer function (same name and config) so existing
+        collections still open, but never loads a second copy of the model.
+        """
+
+        def __init__(self, embedder):
+            self.model_name = embedder.model_name
+            self.device = "cpu"
+            self.normalize_embeddings = False
+            self.kwargs = {}
+            self._embedder = embedder
+
+        def __call__(self, input):
+            return [np.asarray(v, dtype=np.float32) for v in self._embedder.encode(list(input))]
+
+    return EmbedderFunction
+
+
+_embedders = {}
+_embedders_lock = threading.Lock()
+
+
+def get_embedder(model_name=MODEL_NAME, backend=BACKEND):
+    """The process-wide embedder for (model, backend); loaded on first use."""
+    with _embedders_lock:
+        key = (model_name, backend)
+        if key not in _embedders:
+            _embedders[key] = Embedder(model_name, backend)
+        return _embedders[key]
+
+
+def check_backends(texts, backends=BACKENDS, model_name=MODEL_NAME):
+    """Compare every backend against torch: per-text cosine similarity and latency."""
+    reference = None
+    report = {}
+    for backend in backends:
+        embedder = get_embedder(model_name, backend)
+        embedder.encode_uncached(texts[:2])  # warm-up
+        started = time.perf_counter()
+        vectors = embedder.encode_uncached(texts)
+        elapsed = time.perf_counter() - started
+        unit = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        if reference is None:
+            reference = unit
+        cosine = (unit * reference).sum(axis=1)
+        passed = bool(cosine.min() >= EQUIVALENCE_THRESHOLDS[backend])
+        report[backend] = {
+            "ms_per_text": 1000 * elapsed / len(texts),
+            "min_cosine": float(cosine.min()),
+            "mean_cosine": float(cosine.mean()),
+            "equivalent": passed,
+        }
+        print(f"{'✅' if passed else '❌'} {backend:<10} {report[backend]['ms_per_text']:.2f} ms/text, "
+              f"cosine vs torch min={cosine.min():.5f} mean={cosine.mean():.5f}")
+    return report
+
+
+if __name__ == "__main__":
+    export_onnx(MODEL_NAME)
+    with open("input/clean_text.txt", "r", encoding="utf-8") as f:
+        paragraphs = [p.strip() for p in f.read(400_000).split("\n\n")]
+    sample_texts = [p for p in paragraphs if len(p) > 40][:256]
+    results = check_backends(sample_texts)
+    if not all(r["equivalent"] for r in results.values()):
+        raise SystemExit("❌ Embedding backends are not equivalent")
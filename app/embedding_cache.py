@@ -0,0 +1,209 @@
+"""
+Persistent embedding cache
+--------------------------
+On-disk cache of text embeddings keyed by (model name, text hash), shared by
+ingestion (rag_pipeline), the Chroma query paths (assistant + Streamlit) and
+rag_retrieve.
+
+Layout per model under EMBEDDING_CACHE_DIR:
+    vectors.f32   memory-mapped float32 matrix, one row per cached text
+    index.sqlite  text hash → row slot + last-use tick (LRU bookkeeping)
+
+The cache is bounded by EMBEDDING_CACHE_MB; when full, the least recently used
+rows are evicted and their slots reused. One process should write at a time.
+"""
+
+import os
+import re
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", ".cache/embeddings")
+MAX_CACHE_MB = float(os.getenv("EMBEDDING_CACHE_MB", "512"))
+INITIAL_CAPACITY = 1024
+EVICT_FRACTION = 0.10  # free this share of the cache at once when it is full
+
+
+def text_key(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, model_name, cache_dir=CACHE_DIR, max_mb=MAX_CACHE_MB):
+        self.model_name = model_name
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.dir = os.path.join(cache_dir, re.sub(r"[^a-zA-Z0-9_.-]", "_", model_name))
+        self.vectors_path = os.path.join(self.dir, "vectors.f32")
+        os.makedirs(self.dir, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(self.dir, "index.sqlite"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, slot INTEGER, last_used INTEGER)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+        self._db.commit()
+
+        meta = dict(self._db.execute("SELECT name, value FROM meta"))
+        self.dim = meta.get("dim")
+        self.capacity = meta.get("capacity", 0)
+        self._tick = self._db.execute("SELECT COALESCE(MAX(last_used), 0) FROM entries").fetchone()[0]
+        self._matrix = None
+        self._free = []
+        if self.dim:
+            self._open_matrix()
+
+    # ---------------- storage ---------------- #
+    @property
+    def max_entries(self):
+        return max(1, self.max_bytes // (self.dim * 4))
+
+    def _open_matrix(self):
+        used = {row[0] for row in self._db.execute("SELECT slot FROM entries")}
+        self._free = sorted(set(range(self.capacity)) - used, reverse=True)
+        if self.capacity:
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+
+    def _set_meta(self, name, value):
+        self._db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, int(value)))
+
+    def _grow(self, needed):
+        """Extend the memory-mapped file (doubling, capped by the size budget)."""
+        new_capacity = max(self.capacity * 2, INITIAL_CAPACITY, self.capacity + needed)
+        new_capacity = min(new_capacity, self.max_entries)
+        if new_capacity <= self.capacity:
+            return
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self._free = list(range(new_capacity - 1, self.capacity - 1, -1)) + self._free
+        self.capacity = new_capacity
+        self._set_meta("capacity", new_capacity)
+        self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+
+    def _evict(self, needed):
+        """Drop the least recently used rows until ``needed`` slots are free."""
+        count = max(needed - len(self._free), int(self.capacity * EVICT_FRACTION), 1)
+        rows = self._db.execute("SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (count,)).fetchall()
+        self._db.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k, _ in rows])
+        self._free.extend(slot for _, slot in rows)
+        self.evictions += len(rows)
+
+    def _allocate(self, needed):
+        if len(self._free) < needed:
+            self._grow(needed - len(self._free))
+        if len(self._free) < needed:
+            self._evict(needed)
+        return [self._free.pop() for _ in range(min(needed, len(self._free)))]
+
+    # ---------------- public API ---------------- #
+    def get_many(self, texts):
+        """Return a list aligned with ``texts``: cached vectors (copied out of the map) or None."""
+        with self._lock:
+            if self._matrix is None:
+                self.misses += len(texts)
+                return [None] * len(texts)
+            keys = [text_key(t) for t in texts]
+            found = {}
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                marks = ",".join("?" * len(part))
+                found.update(self._db.execute(f"SELECT key, slot FROM entries WHERE key IN ({marks})", part))
+            self._tick += 1
+            self._db.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(self._tick, k) for k in found])
+            self._db.commit()
+            results = [np.array(self._matrix[found[k]]) if k in found else None for k in keys]
+            hit_count = sum(r is not None for r in results)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+            return results
+
+    def put_many(self, texts, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(texts) == 0:
+            return
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                self._set_meta("dim", self.dim)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"❌ Embedding dim {vectors.shape[1]} does not match cache dim {self.dim}")
+
+            pending = {}
+            for text, vector in zip(texts, vectors):
+                pending[text_key(text)] = vector
+            existing = set()
+            for key in pending:
+                if self._db.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone():
+                    existing.add(key)
+            pending = {k: v for k, v in pending.items() if k not in existing}
+            if not pending:
+                return
+
+            slots = self._allocate(len(pending))
+            self._tick += 1
+            rows = []
+            for slot, (key, vector) in zip(slots, pending.items()):
+                self._matrix[slot] = vector
+                rows.append((key, slot, self._tick))
+            # Vectors hit the file before the index points at them
+            self._matrix.flush()
+            self._db.executemany("INSERT OR REPLACE INTO entries (key, slot, last_used) VALUES (?, ?, ?)", rows)
+            self._db.commit()
+
+    def encode(self, texts, encode_fn):
+        """
+        Embed ``texts`` through the cache: only misses are passed (in one call) to
+        ``encode_fn``. Returns an (n, dim) float32 array in input order.
+        """
+        texts = list(texts)
+        cached = self.get_many(texts)
+        missing = [i for i, v in enumerate(cached) if v is None]
+        if missing:
+            miss_texts = list(dict.fromkeys(texts[i] for i in missing))
+            fresh = np.asarray(encode_fn(miss_texts), dtype=np.float32)
+            self.put_many(miss_texts, fresh)
+            by_text = dict(zip(miss_texts, fresh))
+            for i in missing:
+                cached[i] = by_text[texts[i]]
+        if not cached:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.vstack(cached)
+
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "size_mb": self.capacity * (self.dim or 0) * 4 / (1024 * 1024),
+        }
+
+    def report(self):
+        s = self.stats()
+        print(f"🗃️ Embedding cache [{s['model']}]: {s['hits']} hits / {s['misses']} misses "
+              f"({s['hit_rate']:.0%}), {s['entries']} entries, {s['size_mb']:.1f} MB, {s['evictions']} evicted")
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(model_name):
+    """One shared cache instance per model per process."""
+    with _caches_lock:
+        if model_name not in _caches:
+            _caches[model_name] = EmbeddingCache(model_name)
+        return _caches[model_name]
@@ -0,0 +1,86 @@
+"""
+Hybrid retrieval: BM25 + dense vectors, merged with reciprocal rank fusion
+--------------------------------------------------------------------------
+Both searches run in parallel; each returns FETCH_K candidates and a chunk's
+fused score is Σ 1 / (RRF_K + rank) over the lists it appears in. Results come
+back in Chroma's query() shape, so callers only swap the call. A metadata
+``where`` filter (see chunker.metadata_filter) restricts both searches.
+Sharded collections (shards.ShardedCollection) bring their own fan-out BM25 index.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from lexical_index import LexicalIndex, lexical_index_path
+from tracing import stage, in_current_context
+
+FETCH_K = int(os.getenv("HYBRID_FETCH_K", "20"))
+RRF_K = 60
+LEXICAL_FILTER_OVERFETCH = 5
+
+_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hybrid")
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Fuse several ranked ID lists; returns (id, score) pairs, best first."""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class HybridRetriever:
+    def __init__(self, collection, vectorstore_dir="vectorstore", fetch_k=FETCH_K):
+        self.collection = collection
+        self.fetch_k = fetch_k
+        self.lexical = getattr(collection, "lexical", None) or LexicalIndex(lexical_index_path(collection.name, vectorstore_dir))
+        if self.lexical.count() == 0:
+            print("⚠️ Lexical index is empty — run rag_pipeline.py to enable hybrid search (vector-only for now)")
+
+    def _vector_search(self, question, query_embedding, n, where=None):
+        with stage("vector_search", n_results=n, precomputed_embedding=query_embedding is not None,
+                   filtered=bool(where)):
+            if query_embedding is not None:
+                return self.collection.query(query_embeddings=[query_embedding], n_results=n, where=where)
+            return self.collection.query(query_texts=[question], n_results=n, where=where)
+
+    def _lexical_search(self, question, n, where=None):
+        with stage("lexical_search", n_results=n, filtered=bool(where)) as span:
+            if not where:
+                hits = self.lexical.search(question, n)
+            else:
+                # BM25 knows nothing about metadata: over-fetch, then keep hits that pass the filter
+                hits = self.lexical.search(question, n * LEXICAL_FILTER_OVERFETCH)
+                if hits:
+                    allowed = set(self.collection.get(ids=[doc_id for doc_id, _ in hits], include=[], where=where)["ids"])
+                    hits = [hit for hit in hits if hit[0] in allowed][:n]
+            span.set_attribute("hits", len(hits))
+            return hits
+
+    def query(self, question, n_results=5, query_embedding=None, where=None):
+        """Hybrid top-n for one question, shaped like collection.query() output; ``where`` pre-filters on metadata."""
+        fetch_k = max(self.fetch_k, n_results)
+        vector_future = _pool.submit(in_current_context(self._vector_search), question, query_embedding, fetch_k, where)
+        lexical_future = _pool.submit(in_current_context(self._lexical_search), question, fetch_k, where)
+        vector = vector_future.result()
+        lexical_hits = lexical_future.result()
+
+        vector_ids = vector["ids"][0] if vector["ids"] else []
+        documents = dict(zip(vector_ids, vector["documents"][0] if vector["documents"] else []))
+        metadatas = dict(zip(vector_ids, vector["metadatas"][0] if vector.get("metadatas") else []))
+        fused = reciprocal_rank_fusion([vector_ids, [doc_id for doc_id, _ in lexical_hits]])[:n_results]
+
+        # BM25-only hits still need their text and metadata
+        missing = [doc_id for doc_id, _ in fused if doc_id not in documents]
+        if missing:
+            extra = self.collection.get(ids=missing, include=["documents", "metadatas"])
+            documents.update(zip(extra["ids"], extra["documents"]))
+            metadatas.update(zip(extra["ids"], extra["metadatas"]))
+
+        ids = [doc_id for doc_id, _ in fused if doc_id in documents]
+        return {
+            "ids": [ids],
+            "documents": [[documents[doc_id] for doc_id in ids]],
+            "metadatas": [[metadatas.get(doc_id) for doc_id in ids]],
+            "scores": [[score for doc_id, score in fused if doc_id in documents]],
+        }
@@ -0,0 +1,108 @@
+"""
+Lexical (BM25) inverted index
+-----------------------------
+Built by rag_pipeline next to the Chroma collection and updated with the same
+incremental upserts/deletes, so exact terms, acronyms and identifiers that dense
+search misses can still be found. Stored as a small SQLite database:
+
+    docs(id, length)              one row per chunk
+    postings(term, doc_id, tf)    term frequencies per chunk
+"""
+
+import os
+import re
+import math
+import sqlite3
+import threading
+from collections import Counter
+
+K1 = 1.5
+B = 0.75
+
+# Keeps identifiers such as "gpt-4", "text-embedding-3" or "v1.2" intact
+TOKEN_RE = re.compile(r"\w+(?:[-.]\w+)*")
+
+
+def tokenize(text):
+    """Lower-cased tokens; compound identifiers also contribute their parts."""
+    tokens = []
+    for match in TOKEN_RE.finditer(str(text or "").lower()):
+        token = match.group()
+        tokens.append(token)
+        if "-" in token or "." in token:
+            tokens.extend(p for p in re.split(r"[-.]", token) if p)
+    return tokens
+
+
+def lexical_index_path(collection_name, vectorstore_dir="vectorstore"):
+    return os.path.join(vectorstore_dir, f"{collection_name}_lexical.sqlite")
+
+
+class LexicalIndex:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS docs (id TEXT PRIMARY KEY, length INTEGER)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS postings (term TEXT, doc_id TEXT, tf INTEGER, PRIMARY KEY (term, doc_id))")
+        self._db.execute("CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id)")
+        self._db.commit()
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def _delete(self, ids):
+        rows = [(i,) for i in ids]
+        self._db.executemany("DELETE FROM postings WHERE doc_id = ?", rows)
+        self._db.executemany("DELETE FROM docs WHERE id = ?", rows)
+
+    def add(self, ids, documents):
+        """Insert or replace chunks (same semantics as Chroma's upsert)."""
+        with self._lock:
+            self._delete(ids)
+            for doc_id, text in zip(ids, documents):
+                counts = Counter(tokenize(text))
+                self._db.execute("INSERT INTO docs (id, length) VALUES (?, ?)", (doc_id, sum(counts.values())))
+                self._db.executemany(
+                    "INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)",
+                    [(term, doc_id, tf) for term, tf in counts.items()],
+                )
+            self._db.commit()
+
+    def delete(self, ids):
+        with self._lock:
+            self._delete(ids)
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM postings")
+            self._db.execute("DELETE FROM docs")
+            self._db.commit()
+
+    def search(self, query, k=20):
+        """Top-k (id, bm25_score) pairs for the query, best first."""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            n_docs, avg_len = self._db.execute("SELECT COUNT(*), AVG(length) FROM docs").fetchone()
+            if not n_docs:
+                return []
+            scores = Counter()
+            for term in terms:
+                postings = self._db.execute(
+                    "SELECT p.doc_id, p.tf, d.length FROM postings p JOIN docs d ON d.id = p.doc_id WHERE p.term = ?",
+                    (term,),
+                ).fetchall()
+                if not postings:
+                    continue
+                df = len(postings)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                for doc_id, tf, length in postings:
+                    norm = tf + K1 * (1 - B + B * length / (avg_len or 1))
+                    scores[doc_id] += idf * tf * (K1 + 1) / norm
+        return scores.most_common(k)
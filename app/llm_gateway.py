@@ -0,0 +1,328 @@
+"""
+Shared LLM gateway
+------------------
+The one place that talks to the OpenAI-compatible chat endpoint (Groq by
+default). Every entry point goes through it and gets:
+
+  • pooled keep-alive HTTP connections (one httpx client per process)
+  • connect / total timeouts (LLM_CONNECT_TIMEOUT, LLM_TIMEOUT)
+  • retries with jittered exponential backoff on 429, 5xx, timeouts and
+    dropped connections, honouring Retry-After (LLM_MAX_RETRIES)
+  • an optional token-bucket rate limit (LLM_RPM requests/minute, LLM_BURST;
+    off by default, e.g. LLM_RPM=30 for Groq's free tier) and a cap on
+    concurrent calls (LLM_MAX_CONCURRENCY)
+  • plain and streaming completions, sync and async
+  • token-usage accounting per model, also attached to the tracing spans
+    (streams ask for a usage chunk; servers that send none are counted locally)
+
+Point LLM_BASE_URL at any OpenAI-compatible server to test without Groq, e.g.
+benchmarks/fake_openai_server.py. Run this file for a quick round trip.
+"""
+
+import os
+import time
+import asyncio
+import threading
+from tenacity import (Retrying, AsyncRetrying, retry_if_exception, stop_after_attempt,
+                      wait_random_exponential)
+from dotenv import load_dotenv
+from tracing import stage, record_usage
+
+load_dotenv()
+
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://api.groq.com/openai/v1")
+LLM_API_KEY = os.getenv("LLM_API_KEY") or os.getenv("GROQ_API_KEY")
+LLM_MODEL = os.getenv("LLM_MODEL", "gemma-7b-it")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_RPM = float(os.getenv("LLM_RPM", "0"))  # 0 disables the limiter; Groq's free tier allows 30
+LLM_BURST = int(os.getenv("LLM_BURST", "5"))
+MAX_CONNECTIONS = 20
+CHARS_PER_TOKEN = 4  # usage estimate when a stream reports none
+
+
+class TokenBucket:
+    """Refills ``rate`` tokens per second up to ``capacity``; acquire() waits for a token."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Take a token now (may go negative); returns how long the caller must wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self):
+        if self.rate > 0:
+            time.sleep(self._reserve())
+
+    async def acquire_async(self):
+        if self.rate > 0:
+            await asyncio.sleep(self._reserve())
+
+
+class UsageMeter:
+    """Request, retry and token totals per model for this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.models = {}
+
+    def _entry(self, model):
+        return self.models.setdefault(model, {"requests": 0, "retries": 0, "errors": 0,
+                                              "prompt_tokens": 0, "completion_tokens": 0})
+
+    def add(self, model, usage=None, retries=0, error=False):
+        with self._lock:
+            entry = self._entry(model)
+            entry["requests"] += 1
+            entry["retries"] += retries
+            entry["errors"] += int(error)
+            if usage is not None:
+                get = usage.get if isinstance(usage, dict) else lambda key: getattr(usage, key, None)
+                entry["prompt_tokens"] += get("prompt_tokens") or 0
+                entry["completion_tokens"] += get("completion_tokens") or 0
+
+    def snapshot(self):
+        with self._lock:
+            return {model: dict(entry) for model, entry in self.models.items()}
+
+    def report(self):
+        for model, entry in self.snapshot().items():
+            print(f"🧾 {model}: {entry['requests']} requests ({entry['retries']} retries, {entry['errors']} failed), "
+                  f"{entry['prompt_tokens']} prompt + {entry['completion_tokens']} completion tokens")
+
+
+def _retryable(error):
+    import openai
+
+    if isinstance(error, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+        return True  # APITimeoutError is an APIConnectionError
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _wait(retry_state):
+    """Jittered exponential backoff, but never shorter than the server's Retry-After."""
+    delay = wait_random_exponential(multiplier=0.5, max=20)(retry_state)
+    error = retry_state.outcome.exception()
+    response = getattr(error, "response", None)
+    try:
+        delay = max(delay, float(response.headers.get("retry-after", 0)))
+    except (AttributeError, TypeError, ValueError):
+        pass
+    return delay
+
+
+def _stream_usage(event):
+    # OpenAI puts usage on the final chunk; Groq reports it under x_groq
+    usage = getattr(event, "usage", None)
+    if usage is None:
+        usage = (getattr(event, "x_groq", None) or {}).get("usage")
+    return usage
+
+
+def _estimate_usage(messages, text):
+    """Rough usage for a stream that ended without a usage chunk (~CHARS_PER_TOKEN characters per token)."""
+    prompt_chars = sum(len(m["content"]) for m in messages)
+    return {"prompt_tokens": -(-prompt_chars // CHARS_PER_TOKEN), "completion_tokens": -(-len(text) // CHARS_PER_TOKEN),
+            "estimated": True}
+
+
+class LLMGateway:
+    def __init__(self, base_url=LLM_BASE_URL, api_key=LLM_API_KEY, model=LLM_MODEL, timeout=LLM_TIMEOUT,
+                 connect_timeout=LLM_CONNECT_TIMEOUT, max_retries=LLM_MAX_RETRIES,
+                 max_concurrency=LLM_MAX_CONCURRENCY, rpm=LLM_RPM, burst=LLM_BURST):
+        if not api_key:
+            raise ValueError("❌ Missing GROQ_API_KEY (or LLM_API_KEY). Please set it via: setx GROQ_API_KEY 'your_key_here'")
+        self.base_url = base_url
+        self.model = model
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.bucket = TokenBucket(rpm / 60, burst)
+        if rpm > 0:
+            print(f"⏳ LLM rate limit: {rpm:g} requests/min (burst {burst}) — set LLM_RPM=0 to disable")
+        self.usage = UsageMeter()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._async_slots = None
+
+        # Deferred: the SDK and httpx take most of a second to import and only the gateway needs them
+        import httpx
+        from openai import OpenAI, AsyncOpenAI
+
+        timeouts = httpx.Timeout(timeout, connect=connect_timeout)
+        limits = httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS)
+        # Retries are ours (with the rate limiter in the loop), so the SDK's own are off
+        self.client = OpenAI(api_key=api_key, base_url=base_url, timeout=timeouts, max_retries=0,
+                             http_client=httpx.Client(timeout=timeouts, limits=limits))
+        self.async_client = AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=timeouts, max_retries=0,
+                                        http_client=httpx.AsyncClient(timeout=timeouts, limits=limits))
+
+    def _retrying(self, cls=Retrying):
+        return cls(retry=retry_if_exception(_retryable), wait=_wait,
+                   stop=stop_after_attempt(self.max_retries + 1), reraise=True)
+
+    def _request(self, messages, model, temperature, stream, **kwargs):
+        if stream:
+            # Without it, OpenAI-compatible servers other than Groq send no usage on streams
+            kwargs.setdefault("stream_options", {"include_usage": True})
+        return dict(model=model or self.model, messages=messages, temperature=temperature, stream=stream, **kwargs)
+
+    # ---------------- sync ---------------- #
+    def _create(self, request):
+        """One rate-limited, retried create() call; returns (response, retries)."""
+        attempts = 0
+        for attempt in self._retrying():
+            with attempt:
+                attempts += 1
+                self.bucket.acquire()
+                return self.client.chat.completions.create(**request), attempts - 1
+
+    def complete(self, messages, model=None, temperature=0.3, **kwargs):
+        """Full completion text for a list of chat messages."""
+        request = self._request(messages, model, temperature, False, **kwargs)
+        with self._slots, stage("llm", model=request["model"], messages=len(messages),
+                                prompt_chars=sum(len(m["content"]) for m in messages)) as span:
+            try:
+                response, retries = self._create(request)
+            except Exception:
+                self.usage.add(request["model"], error=True)
+                raise
+            span.set_attribute("retries", retries)
+            record_usage(span, response.usage)
+            self.usage.add(request["model"], response.usage, retries)
+        return response.choices[0].message.content.strip()
+
+    def _finish_stream(self, span, request, messages, pieces, usage, retries, stopped):
+        span.set_attribute("stream_chunks", len(pieces))
+        span.set_attribute("stopped_early", stopped)
+        usage = usage or _estimate_usage(messages, "".join(pieces))
+        span.set_attribute("usage_estimated", isinstance(usage, dict) and usage.get("estimated", False))
+        record_usage(span, usage)
+        self.usage.add(request["model"], usage, retries)
+
+    def stream(self, messages, model=None, temperature=0.3, **kwargs):
+        """
+        Yield answer text as it arrives. Retries cover the request, not a stream that broke midway.
+        Callers that may stop early must close() the generator (contextlib.closing): that releases the
+        concurrency slot and the HTTP connection at once instead of whenever it is garbage-collected.
+        """
+        request = self._request(messages, model, temperature, True, **kwargs)
+        self._slots.acquire()
+        stream = None
+        try:
+            with stage("llm", model=request["model"], messages=len(messages), streaming=True,
+                       prompt_chars=sum(len(m["content"]) for m in messages)) as span:
+                started = time.perf_counter()
+                usage, pieces, retries = None, [], 0
+                try:
+                    stream, retries = self._create(request)
+                    span.set_attribute("retries", retries)
+                    for event in stream:
+                        usage = _stream_usage(event) or usage
+                        if event.choices and event.choices[0].delta.content:
+                            if not pieces:
+                                span.set_attribute("time_to_first_token_ms", (time.perf_counter() - started) * 1000)
+                            pieces.append(event.choices[0].delta.content)
+                            yield pieces[-1]
+                except GeneratorExit:
+                    # The consumer stopped reading (rerun, disconnect): count what was generated so far
+                    self._finish_stream(span, request, messages, pieces, usage, retries, stopped=True)
+                    raise
+                except Exception:
+                    self.usage.add(request["model"], usage, error=True)
+                    raise
+                self._finish_stream(span, request, messages, pieces, usage, retries, stopped=False)
+        finally:
+            if stream is not None:
+                stream.close()
+            self._slots.release()
+
+    # ---------------- async ---------------- #
+    def _get_async_slots(self):
+        if self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(self.max_concurrency)
+        return self._async_slots
+
+    async def _acreate(self, request):
+        attempts = 0
+        async for attempt in self._retrying(AsyncRetrying):
+            with attempt:
+                attempts += 1
+                await self.bucket.acquire_async()
+                return await self.async_client.chat.completions.create(**request), attempts - 1
+
+    async def acomplete(self, messages, model=None, temperature=0.3, **kwargs):
+        request = self._request(messages, model, temperature, False, **kwargs)
+        async with self._get_async_slots():
+            with stage("llm", model=request["model"], messages=len(messages),
+                       prompt_chars=sum(len(m["content"]) for m in messages)) as span:
+                try:
+                    response, retries = await self._acreate(request)
+                except Exception:
+                    self.usage.add(request["model"], error=True)
+                    raise
+                span.set_attribute("retries", retries)
+                record_usage(span, response.usage)
+                self.usage.add(request["model"], response.usage, retries)
+        return response.choices[0].message.content.strip()
+
+    async def astream(self, messages, model=None, temperature=0.3, **kwargs):
+        """Async stream(); callers that may stop early must ``await gen.aclose()``."""
+        request = self._request(messages, model, temperature, True, **kwargs)
+        slots = self._get_async_slots()
+        await slots.acquire()
+        stream = None
+        try:
+            with stage("llm", model=request["model"], messages=len(messages), streaming=True,
+                       prompt_chars=sum(len(m["content"]) for m in messages)) as span:
+                usage, pieces, retries = None, [], 0
+                try:
+                    stream, retries = await self._acreate(request)
+                    async for event in stream:
+                        usage = _stream_usage(event) or usage
+                        if event.choices and event.choices[0].delta.content:
+                            pieces.append(event.choices[0].delta.content)
+                            yield pieces[-1]
+                except GeneratorExit:
+                    self._finish_stream(span, request, messages, pieces, usage, retries, stopped=True)
+                    raise
+                except Exception:
+                    self.usage.add(request["model"], usage, error=True)
+                    raise
+                self._finish_stream(span, request, messages, pieces, usage, retries, stopped=False)
+        finally:
+            if stream is not None:
+                await stream.close()
+            slots.release()
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """The process-wide gateway configured from the environment."""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway()
+        return _gateway
+
+
+if __name__ == "__main__":
+    gateway = get_gateway()
+    messages = [{"role": "user", "content": "Context:\nThe gateway retries 429s.\n\nQuestion:\nWhat does it retry?"}]
+    print(f"🔌 {gateway.base_url} ({gateway.model})")
+    print("💬", gateway.complete(messages))
+    print("🌊", "".join(gateway.stream(messages)))
+    gateway.usage.report()
@@ -0,0 +1,210 @@
+"""
+Local answer generation (offline fallback)
+------------------------------------------
+flan-t5 on the CPU for when the hosted LLM is unavailable, loaded once per
+process (get_generator) with a selectable backend (LOCAL_LLM_BACKEND):
+
+    torch       transformers model in full precision
+    torch-int8  the same model with dynamically quantized int8 Linear layers (default)
+    onnx        encoder/decoder exported to ONNX, run with onnxruntime
+    onnx-int8   the ONNX export with dynamically quantized int8 weights
+
+The ONNX backends need optimum (pip install "optimum[onnxruntime]"); the
+export is made once into LOCAL_LLM_ONNX_DIR.
+
+Prompts are fitted to the model's input window by trimming the context, never
+the question. generate() answers a list of prompts in length-sorted batches of
+LOCAL_LLM_BATCH with one generate call each, greedy by default, and reports
+generated tokens per second. Run this file to compare the backends.
+"""
+
+import os
+import re
+import glob
+import time
+import shutil
+import threading
+from tracing import stage
+
+LOCAL_LLM_MODEL = os.getenv("LOCAL_LLM_MODEL", "google/flan-t5-base")
+LOCAL_LLM_BACKEND = os.getenv("LOCAL_LLM_BACKEND", "torch-int8")
+LOCAL_LLM_BATCH = int(os.getenv("LOCAL_LLM_BATCH", "8"))
+LOCAL_LLM_MAX_NEW_TOKENS = int(os.getenv("LOCAL_LLM_MAX_NEW_TOKENS", "200"))
+LOCAL_LLM_ONNX_DIR = os.getenv("LOCAL_LLM_ONNX_DIR", ".cache/onnx")
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+MAX_INPUT_TOKENS = 512  # flan-t5 was trained on 512-token inputs
+
+PROMPT_TEMPLATE = "Answer the question based on the context below.\n\nContext:\n{context}\n\nQuestion: {question}\n\nAnswer:"
+
+
+def onnx_model_dir(model_name=LOCAL_LLM_MODEL, quantized=False):
+    name = re.sub(r"[^a-zA-Z0-9_.-]", "_", model_name)
+    return os.path.join(LOCAL_LLM_ONNX_DIR, name + ("_int8" if quantized else ""))
+
+
+def export_onnx(model_name=LOCAL_LLM_MODEL, quantize=True):
+    """Export encoder + decoders to ONNX with optimum (+ an int8 copy quantized with onnxruntime)."""
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    from transformers import AutoTokenizer
+
+    out_dir = onnx_model_dir(model_name)
+    model = ORTModelForSeq2SeqLM.from_pretrained(model_name, export=True)
+    model.save_pretrained(out_dir)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(out_dir)
+    print(f"📦 Exported ONNX model → {out_dir}")
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        int8_dir = onnx_model_dir(model_name, quantized=True)
+        shutil.copytree(out_dir, int8_dir, dirs_exist_ok=True)
+        for onnx_file in glob.glob(os.path.join(out_dir, "*.onnx")):
+            quantize_dynamic(onnx_file, os.path.join(int8_dir, os.path.basename(onnx_file)),
+                             weight_type=QuantType.QInt8)
+        print(f"📦 Quantized int8 model → {int8_dir}")
+    return out_dir
+
+
+class LocalGenerator:
+    def __init__(self, model_name=LOCAL_LLM_MODEL, backend=LOCAL_LLM_BACKEND, batch_size=LOCAL_LLM_BATCH):
+        if backend not in BACKENDS:
+            raise ValueError(f"❌ Unknown local LLM backend '{backend}', expected one of {BACKENDS}")
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = batch_size
+        started = time.perf_counter()
+        if backend.startswith("torch"):
+            self._load_torch()
+        else:
+            self._load_onnx()
+        self.max_input_tokens = min(self.tokenizer.model_max_length, MAX_INPUT_TOKENS)
+        self.totals = {"prompts": 0, "batches": 0, "output_tokens": 0, "seconds": 0.0, "truncated": 0}
+        print(f"🧠 Local LLM ready: {model_name} [{backend}] in {time.perf_counter() - started:.1f}s")
+
+    def _load_torch(self):
+        import torch
+        from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+
+        self.torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        model = AutoModelForSeq2SeqLM.from_pretrained(self.model_name).eval()
+        if self.backend == "torch-int8":
+            # int8 weights, activations quantized on the fly: ~4× smaller Linear layers, faster CPU matmuls
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model
+
+    def _load_onnx(self):
+        try:
+            from optimum.onnxruntime import ORTModelForSeq2SeqLM
+        except ImportError:
+            raise ImportError("❌ The ONNX backends need optimum: pip install \"optimum[onnxruntime]\"")
+        import torch
+        from transformers import AutoTokenizer
+
+        quantized = self.backend == "onnx-int8"
+        model_dir = onnx_model_dir(self.model_name, quantized)
+        if not glob.glob(os.path.join(model_dir, "*.onnx")):
+            print(f"⚙️ No ONNX export found for {self.model_name}, exporting once...")
+            export_onnx(self.model_name, quantize=quantized)
+        self.torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model = ORTModelForSeq2SeqLM.from_pretrained(model_dir, provider="CPUExecutionProvider")
+
+    def count(self, text):
+        return len(self.tokenizer(text, add_special_tokens=False).input_ids)
+
+    def build_prompt(self, question, context):
+        """PROMPT_TEMPLATE with the context cut (at a token boundary) so the whole prompt fits the input window."""
+        overhead = len(self.tokenizer(PROMPT_TEMPLATE.format(context="", question=question)).input_ids)
+        context_ids = self.tokenizer(context, add_special_tokens=False).input_ids
+        budget = max(self.max_input_tokens - overhead, 0)
+        if len(context_ids) > budget:
+            context = self.tokenizer.decode(context_ids[:budget], skip_special_tokens=True)
+            self.totals["truncated"] += 1
+        return PROMPT_TEMPLATE.format(context=context, question=question)
+
+    def _generate_batch(self, prompts, max_new_tokens, temperature):
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True, truncation=True,
+                                max_length=self.max_input_tokens)
+        # temperature only means something when sampling; 0 is plain greedy decoding
+        sampling = {"do_sample": True, "temperature": temperature} if temperature > 0 else {"do_sample": False}
+        with self.torch.inference_mode():
+            output = self.model.generate(**inputs, max_new_tokens=max_new_tokens, num_beams=1, **sampling)
+        # Drop the decoder start token; padding after EOS is not generated text
+        generated = int((output[:, 1:] != self.tokenizer.pad_token_id).sum())
+        return self.tokenizer.batch_decode(output, skip_special_tokens=True), generated
+
+    def generate(self, prompts, max_new_tokens=LOCAL_LLM_MAX_NEW_TOKENS, temperature=0.0):
+        """Answers for ``prompts`` (same order) and {prompts, batches, output_tokens, seconds, tokens_per_s}."""
+        # Length-sorted batches keep padding (and wasted decoder steps) to a minimum
+        order = sorted(range(len(prompts)), key=lambda i: len(prompts[i]))
+        answers = [None] * len(prompts)
+        stats = {"prompts": len(prompts), "batches": 0, "output_tokens": 0}
+        started = time.perf_counter()
+        with stage("llm", model=self.model_name, backend=self.backend, prompts=len(prompts)) as span:
+            for start in range(0, len(order), self.batch_size):
+                batch = order[start:start + self.batch_size]
+                texts, generated = self._generate_batch([prompts[i] for i in batch], max_new_tokens, temperature)
+                for i, text in zip(batch, texts):
+                    answers[i] = text.strip()
+                stats["batches"] += 1
+                stats["output_tokens"] += generated
+            stats["seconds"] = time.perf_counter() - started
+            stats["tokens_per_s"] = stats["output_tokens"] / stats["seconds"] if stats["seconds"] else 0.0
+            span.set_attribute("output_tokens", stats["output_tokens"])
+            span.set_attribute("tokens_per_s", stats["tokens_per_s"])
+        for key in ("prompts", "batches", "output_tokens", "seconds"):
+            self.totals[key] += stats[key]
+        return answers, stats
+
+    def warm_up(self):
+        """One tiny generate call, so the first question does not pay for lazy init and allocator growth."""
+        started = time.perf_counter()
+        self._generate_batch(["warm up"], 2, 0.0)
+        print(f"🔥 Local LLM warm-up done in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+
+_generators = {}
+_generators_lock = threading.Lock()
+
+
+def get_generator(model_name=LOCAL_LLM_MODEL, backend=LOCAL_LLM_BACKEND):
+    """The process-wide generator for (model, backend); loaded on first use."""
+    with _generators_lock:
+        key = (model_name, backend)
+        if key not in _generators:
+            _generators[key] = LocalGenerator(model_name, backend)
+        return _generators[key]
+
+
+def format_generation(stats):
+    return (f"{stats['output_tokens']} tokens in {stats['seconds']:.2f}s ({stats['tokens_per_s']:.1f} tok/s), "
+            f"{stats['prompts']} prompt(s) in {stats['batches']} batch(es)")
+
+
+def compare_backends(prompts, backends=BACKENDS, model_name=LOCAL_LLM_MODEL):
+    """Throughput of every backend on the same prompts, and how often its answer matches torch's."""
+    reference = None
+    report = {}
+    for backend in backends:
+        try:
+            generator = get_generator(model_name, backend)
+        except ImportError as e:
+            print(f"⏭️ {backend:<10} skipped: {e}")
+            continue
+        generator.warm_up()
+        answers, stats = generator.generate(prompts)
+        if reference is None:
+            reference = answers
+        same = sum(a == r for a, r in zip(answers, reference)) / len(prompts)
+        report[backend] = {"tokens_per_s": stats["tokens_per_s"], "seconds": stats["seconds"],
+                           "same_as_torch": same}
+        print(f"⚡ {backend:<10} {format_generation(stats)}, same answer as torch {same:.0%}")
+    return report
+
+
+if __name__ == "__main__":
+    with open("input/clean_text.txt", "r", encoding="utf-8") as f:
+        paragraphs = [p.strip() for p in f.read(200_000).split("\n\n")]
+    contexts = [p for p in paragraphs if len(p) > 200][:16]
+    sample_prompts = [PROMPT_TEMPLATE.format(context=c, question="What is this passage about?") for c in contexts]
+    compare_backends(sample_prompts)
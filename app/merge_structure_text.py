@@ -1,27 +1,62 @@
 import os
+import re
+import json
+import hashlib
+from doc_store import DocumentStore, file_hash, layout_rows
 
 INPUT_DIR = "data/structure_output"
-OUTPUT_FILE = "input/extracted_text.txt"
+SOURCE_PDF = "input/mastering_rag.pdf"
+EXTRACTOR = "layout"
+
+def page_dirs(input_dir=INPUT_DIR):
+    """(page number, directory) for every page_N folder, in page order (not os.walk order)."""
+    pages = []
+    for name in os.listdir(input_dir):
+        match = re.fullmatch(r"page_(\d+)", name)
+        if match and os.path.isdir(os.path.join(input_dir, name)):
+            pages.append((int(match.group(1)), os.path.join(input_dir, name)))
+    return sorted(pages)
+
+def read_blocks(page_dir):
+    """PPStructure blocks saved by save_structure_res (one JSON object per line)."""
+    blocks = []
+    for name in sorted(f for f in os.listdir(page_dir) if f.endswith(".txt")):
+        with open(os.path.join(page_dir, name), "r", encoding="utf-8") as f:
+            blocks.extend(json.loads(line) for line in f if line.strip())
+    return blocks
+
+def results_hash(pages):
+    """Hash of the saved layout results, used when the source PDF is not available."""
+    digest = hashlib.sha256()
+    for _, page_dir in pages:
+        for name in sorted(os.listdir(page_dir)):
+            if name.endswith(".txt"):
+                digest.update(name.encode("utf-8"))
+                with open(os.path.join(page_dir, name), "rb") as f:
+                    digest.update(f.read())
+    return digest.hexdigest()
 
 def merge_texts():
-    all_text = []
-
-    # walk through all folders and collect text
-    for root, dirs, files in os.walk(INPUT_DIR):
-        for file in files:
-            if file.endswith(".txt"):
-                file_path = os.path.join(root, file)
-                with open(file_path, "r", encoding="utf-8") as f:
-                    text = f.read().strip()
-                    if text:
-                        all_text.append(text)
-
-    # save merged content
-    os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as out:
-        out.write("\n\n".join(all_text))
-
-    print(f"✅ Merged text saved → {OUTPUT_FILE}")
+    """Import saved layout results into the document store, one row per block, in page order."""
+    pages = page_dirs()
+    doc_name = os.path.basename(SOURCE_PDF)
+    if os.path.exists(SOURCE_PDF):
+        source_hash = file_hash(SOURCE_PDF)
+    else:
+        # PDF not at hand: the saved results themselves identify this version of the document
+        source_hash = results_hash(pages)
+
+    store = DocumentStore()
+    if store.is_current(doc_name, EXTRACTOR, source_hash):
+        print(f"✅ {doc_name} layout results already in the document store")
+        return
+
+    rows = []
+    for page, page_dir in pages:
+        rows.extend(layout_rows(page, read_blocks(page_dir)))
+
+    path = store.write(doc_name, EXTRACTOR, source_hash, rows, max((p for p, _ in pages), default=0))
+    print(f"✅ Merged {len(pages)} pages ({len(rows)} blocks) → {path}")
 
 if __name__ == "__main__":
     merge_texts()
@@ -0,0 +1,142 @@
+"""
+Near-duplicate chunk removal (MinHash + LSH)
+--------------------------------------------
+Extracted PDFs repeat boilerplate, running heads and whole passages; exact
+chunk IDs only catch byte-identical copies. Before embedding, every chunk is
+reduced to a MinHash signature over word shingles and looked up in an LSH
+table (DEDUP_BANDS bands of the signature). A candidate that really agrees on
+at least DEDUP_THRESHOLD of the signature (≈ Jaccard similarity of the
+shingle sets) is a near-duplicate: it collapses into the first occurrence and
+is never embedded or stored.
+
+The first occurrence in corpus order wins, so re-running ingestion on the
+same corpus keeps the same chunks. Disable with DEDUP_ENABLED=0.
+
+Memory stays flat per kept chunk: one uint32 signature row in a growing numpy
+array plus at most one entry per LSH band; no chunk text is kept. A bucket
+lists up to DEDUP_BUCKET_SIZE kept chunks, so a chunk that shares a band with
+an earlier, different chunk is still found through its real original; only
+chunks landing in a full bucket lose that band as a path (counted as
+"full buckets" in the report). With
+DEDUP_REPORT_CLUSTERS=N the report also shows the N largest clusters, using a
+short preview kept for clusters only.
+
+    dedup = NearDuplicateFilter()
+    for chunk, metadata in dedup.filter(iter_corpus(path)):
+        ...
+    dedup.report()
+"""
+
+import os
+import re
+import time
+import mmh3
+import numpy as np
+
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "1") == "1"
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+DEDUP_REPORT_CLUSTERS = int(os.getenv("DEDUP_REPORT_CLUSTERS", "0"))
+DEDUP_BUCKET_SIZE = int(os.getenv("DEDUP_BUCKET_SIZE", "8"))
+DEDUP_NUM_PERM = 128
+DEDUP_BANDS = 16  # 16 bands × 8 rows: pairs above ~0.7 Jaccard become candidates
+SHINGLE_WORDS = 5
+MERSENNE_PRIME = (1 << 31) - 1
+INITIAL_CAPACITY = 4096
+WORD_RE = re.compile(r"\w+")
+
+
+def shingles(text, size=SHINGLE_WORDS):
+    """Word n-grams of the normalized text (the whole text for chunks shorter than one shingle)."""
+    words = WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class NearDuplicateFilter:
+    def __init__(self, threshold=DEDUP_THRESHOLD, num_perm=DEDUP_NUM_PERM, bands=DEDUP_BANDS, seed=1,
+                 report_clusters=DEDUP_REPORT_CLUSTERS, bucket_size=DEDUP_BUCKET_SIZE):
+        if num_perm % bands:
+            raise ValueError(f"❌ num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.threshold = threshold
+        self.report_clusters = report_clusters
+        self.bucket_size = bucket_size
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        # Universal hashing (a·h + b) mod p stands in for num_perm random permutations
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._tables = [{} for _ in range(bands)]  # 64-bit band hash → kept chunk numbers (≤ bucket_size)
+        self._signatures = np.empty((INITIAL_CAPACITY, num_perm), dtype=np.uint32)  # row per kept chunk
+        self._previews = {}  # kept chunk number → preview, only with report_clusters
+        self.kept = 0
+        self.removed = 0
+        self.clusters = {}  # kept chunk number → near-duplicates collapsed into it
+        self.full_buckets = 0  # band entries not recorded because the bucket was full
+        self.elapsed = 0.0
+
+    def signature(self, text):
+        hashes = np.fromiter((mmh3.hash(s, signed=False) for s in shingles(text)), dtype=np.uint64) % MERSENNE_PRIME
+        # a, b, h < 2³¹ keeps a·h + b inside 64 bits before the modulo
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % MERSENNE_PRIME
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def check(self, text):
+        """Kept chunk number this text duplicates, or None after registering it as new."""
+        started = time.perf_counter()
+        signature = self.signature(text)
+        # A hash collision only adds a candidate; the signature comparison below still decides
+        keys = [mmh3.hash64(signature[b * self.rows:(b + 1) * self.rows].tobytes(), signed=False)[0]
+                for b in range(self.bands)]
+        candidates = sorted({c for table, key in zip(self._tables, keys) for c in table.get(key, ())})
+        match = None
+        if candidates:
+            agreement = np.mean(self._signatures[candidates] == signature, axis=1)
+            passing = np.flatnonzero(agreement >= self.threshold)
+            # Lowest number = earliest kept chunk, so the first occurrence wins whatever the band order
+            match = candidates[passing[0]] if len(passing) else None
+        if match is None:
+            match_id = self.kept
+            if match_id == len(self._signatures):
+                self._signatures = np.concatenate([self._signatures, np.empty_like(self._signatures)])
+            self._signatures[match_id] = signature
+            for table, key in zip(self._tables, keys):
+                bucket = table.setdefault(key, [])
+                if len(bucket) < self.bucket_size:
+                    bucket.append(match_id)
+                else:
+                    self.full_buckets += 1
+            self.kept += 1
+        else:
+            self.clusters[match] = self.clusters.get(match, 0) + 1
+            if self.report_clusters and match not in self._previews:
+                # The duplicate stands in for the kept chunk's text, which is not stored
+                self._previews[match] = " ".join(text.split())[:60]
+            self.removed += 1
+        self.elapsed += time.perf_counter() - started
+        return match
+
+    def filter(self, chunks):
+        """Pass through (chunk, metadata) pairs, dropping near-duplicates of earlier chunks."""
+        for chunk, metadata in chunks:
+            if self.check(chunk) is None:
+                yield chunk, metadata
+
+    def stats(self):
+        seen = self.kept + self.removed
+        return {"chunks": seen, "kept": self.kept, "removed": self.removed,
+                "removed_rate": self.removed / seen if seen else 0.0, "clusters": len(self.clusters),
+                "full_buckets": self.full_buckets,
+                "ms_per_chunk": self.elapsed * 1000 / seen if seen else 0.0}
+
+    def report(self):
+        s = self.stats()
+        print(f"🧬 Near-duplicates: {s['removed']} of {s['chunks']} chunks removed ({s['removed_rate']:.1%}) "
+              f"in {s['clusters']} clusters, {s['ms_per_chunk']:.2f} ms/chunk")
+        if s["full_buckets"]:
+            print(f"   {s['full_buckets']} LSH band entries dropped by full buckets "
+                  f"(DEDUP_BUCKET_SIZE={self.bucket_size}); raise it if near-duplicates slip through")
+        for kept, count in sorted(self.clusters.items(), key=lambda item: -item[1])[:self.report_clusters]:
+            print(f"   ×{count + 1} \"{self._previews[kept]}…\"")
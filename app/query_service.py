@@ -0,0 +1,376 @@
+"""
+Async HTTP query service
+------------------------
+A concurrent API over the same retrieval stack as the CLI and Streamlit app,
+served by uvicorn as a plain ASGI app:
+
+    POST /query    {"question": "...", "n_results": 5, "generate": true,
+                    "pages": [first, last], "section": "...",
+                    "shards": ["..."]}   (filters optional; shards on a sharded store only)
+    GET  /health   liveness: the process is up
+    GET  /ready    200 once the embedding model and index are loaded and warm, 503 before
+
+Per request the hot path never blocks the event loop:
+  • query embeddings from concurrent requests are coalesced for up to
+    EMBED_BATCH_WINDOW_MS into one model call (EMBED_MAX_BATCH texts at most)
+  • vector + lexical search, answer-cache reads/writes and context packing
+    run on a bounded pool of SEARCH_WORKERS threads
+  • the LLM call is async through the shared gateway, which caps concurrency
+    (LLM_MAX_CONCURRENCY), rate-limits and retries
+Beyond MAX_IN_FLIGHT concurrent requests new ones get 503 instead of queueing.
+Malformed bodies get 400; errors inside the service are 500.
+
+Run:  python app/query_service.py
+      (or: uvicorn query_service:app --app-dir app --host 0.0.0.0 --port 8000)
+"""
+
+import os
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from embedder import get_embedder
+from shards import open_collection
+from answer_cache import SemanticAnswerCache
+from hybrid_retriever import HybridRetriever
+from reranker import RerankingRetriever
+from llm_gateway import get_gateway
+from context_packer import get_packer
+from chunker import metadata_filter
+from tracing import setup_tracing, stage, in_current_context
+from warmup import warm_up
+
+load_dotenv()
+
+SERVICE_HOST = os.getenv("SERVICE_HOST", "0.0.0.0")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8000"))
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "32"))
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "4"))
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", "256"))
+MAX_N_RESULTS = 50
+
+
+# ------------------------------------------------------------
+# 1️⃣ Micro-batched query embedding
+# ------------------------------------------------------------
+class MicroBatcher:
+    """Collects texts from concurrent callers and embeds them together in one executor call."""
+
+    def __init__(self, encode_fn, window_ms=EMBED_BATCH_WINDOW_MS, max_batch=EMBED_MAX_BATCH):
+        self.encode_fn = encode_fn
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        # One model call at a time; requests arriving meanwhile form the next batch
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+        self._queue = None
+        self._task = None
+        self.batches = 0
+        self.texts = 0
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        self._executor.shutdown(wait=False)
+
+    async def embed(self, text):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            texts = [text for text, _ in batch]
+            try:
+                vectors = await loop.run_in_executor(self._executor, self.encode_fn, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():  # caller may have disconnected
+                    future.set_result(vector)
+
+    def stats(self):
+        return {"batches": self.batches, "texts": self.texts,
+                "mean_batch": round(self.texts / self.batches, 2) if self.batches else 0.0}
+
+
+# ------------------------------------------------------------
+# 2️⃣ Service state: model, index, pools, LLM client
+# ------------------------------------------------------------
+def build_prompt(question, context):
+    return f"""
+You are a Retrieval-Augmented Generation (RAG) assistant.
+Use the provided context to generate an accurate and concise answer.
+Context passages start with their source and pages in [brackets]; cite the ones you use.
+
+Context:
+{context}
+
+Question:
+{question}
+
+Answer:
+"""
+
+
+class ServiceUnavailable(Exception):
+    pass
+
+
+class BadRequest(Exception):
+    pass
+
+
+class QueryService:
+    def __init__(self):
+        self.embedder = None
+        self.packer = None
+        self.collection = None
+        self.retriever = None
+        self.shard_retrievers = {}
+        self.answer_cache = SemanticAnswerCache("service")
+        self.gateway = None
+        self.search_pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="search")
+        self.batcher = None
+        self._load_task = None
+        self.in_flight = 0
+        self.status = {"model": False, "index": False, "error": None}
+
+    def load(self):
+        """Load and warm the model and index (runs on a thread so /health answers meanwhile)."""
+        started = time.perf_counter()
+        try:
+            # The LLM client is built here too, so /health answers while its SDK imports
+            try:
+                self.gateway = get_gateway()
+            except ValueError as e:
+                print(f"⚠️ {e} — /query will only retrieve")
+            self.embedder = get_embedder()
+            self.packer = get_packer()
+            self.status["model"] = True
+
+            collection = open_collection(self.embedder)
+            retriever = RerankingRetriever(HybridRetriever(collection))
+            # Ready only once the first forward pass, index pages and tokenizer are warm
+            _, self.status["warm_up"] = warm_up(self.embedder, retriever, self.packer)
+            self.collection, self.retriever = collection, retriever
+            self.status.update(index=True, chunks=collection.count(), shards=sorted(getattr(collection, "shards", [])))
+            print(f"✅ Query service ready in {time.perf_counter() - started:.1f}s "
+                  f"({self.status['chunks']} chunks in {collection.name})")
+        except Exception as e:
+            self.status["error"] = str(e)
+            print(f"❌ Query service failed to load: {e}")
+
+    @property
+    def ready(self):
+        return self.status["model"] and self.status["index"]
+
+    async def start(self):
+        self.batcher = MicroBatcher(lambda texts: self.embedder.encode(texts))
+        self.batcher.start()
+        # Kept on self: the loop only holds a weak reference to tasks
+        self._load_task = asyncio.create_task(asyncio.to_thread(self.load))
+        self._load_task.add_done_callback(self._loaded)
+
+    def _loaded(self, task):
+        """Surface anything load() let escape, so a dead loader shows up in the log and /ready."""
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            self.status["error"] = str(error) or type(error).__name__
+            print(f"❌ Query service loader died: {error!r}")
+
+    async def stop(self):
+        await self.batcher.stop()
+        self.search_pool.shutdown(wait=False)
+
+    async def generate(self, question, context):
+        return await self.gateway.acomplete([
+            {"role": "system", "content": "You are a helpful assistant specialized in AI and RAG."},
+            {"role": "user", "content": build_prompt(question, context)},
+        ])
+
+    def retriever_for(self, shards=None):
+        """The full retriever, or one over a subset of shards (built once per subset, reranker shared)."""
+        if not shards:
+            return self.retriever
+        key = tuple(sorted(shards))
+        if key not in self.shard_retrievers:
+            if not hasattr(self.collection, "subset"):
+                raise BadRequest("shards given but the store is not sharded")
+            unknown = [s for s in key if s not in self.collection.registry.shards()]
+            if unknown:
+                raise BadRequest(f"unknown shards {unknown}")
+            self.shard_retrievers[key] = RerankingRetriever(HybridRetriever(self.collection.subset(key)),
+                                                            reranker=self.retriever.reranker,
+                                                            enabled=self.retriever.enabled)
+        return self.shard_retrievers[key]
+
+    async def query(self, question, n_results=5, generate=True, where=None, shards=None):
+        if not self.ready:
+            raise ServiceUnavailable("model and index are still loading")
+        if self.in_flight >= MAX_IN_FLIGHT:
+            raise ServiceUnavailable("too many requests in flight")
+        self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            with stage("request", question_chars=len(question), n_results=n_results, filtered=bool(where)) as span:
+                retriever = self.retriever_for(shards)
+                vector = await self.batcher.embed(question)
+                embedded = time.perf_counter()
+                loop = asyncio.get_running_loop()
+                results = await loop.run_in_executor(
+                    self.search_pool, in_current_context(retriever.query), question, n_results, vector.tolist(), where
+                )
+                timings = {"embed_ms": (embedded - started) * 1000, **results["timings"]}
+                ids, docs, metadatas = results["ids"][0], results["documents"][0], results["metadatas"][0]
+                span.set_attribute("chunks", len(docs))
+                response = {"question": question, "answer": None, "cached": False, "timings": timings,
+                            "chunks": [{"id": i, "text": d, "metadata": m} for i, d, m in zip(ids, docs, metadatas)]}
+
+                if generate and docs and self.gateway is not None:
+                    # Cache reads/writes and tokenizing the context are blocking work: off the event loop too.
+                    # Filtered and unfiltered questions retrieve different evidence, so the chunk IDs keep them apart
+                    answer = await loop.run_in_executor(
+                        self.search_pool, in_current_context(self.answer_cache.lookup), vector, ids
+                    )
+                    if answer is None:
+                        context, packing = await loop.run_in_executor(
+                            self.search_pool, in_current_context(self.packer.pack), docs, None, metadatas
+                        )
+                        response["citations"] = packing["citations"]
+                        timings["context_tokens"] = packing["tokens"]
+                        llm_started = time.perf_counter()
+                        answer = await self.generate(question, context)
+                        timings["llm_ms"] = (time.perf_counter() - llm_started) * 1000
+                        await loop.run_in_executor(
+                            self.search_pool, in_current_context(self.answer_cache.store), question, vector, ids, answer
+                        )
+                    else:
+                        response["cached"] = True
+                    response["answer"] = answer
+                timings["request_ms"] = (time.perf_counter() - started) * 1000
+                return response
+        finally:
+            self.in_flight -= 1
+
+
+# ------------------------------------------------------------
+# 3️⃣ ASGI app
+# ------------------------------------------------------------
+service = QueryService()
+
+
+async def send_json(send, status, payload):
+    body = json.dumps(payload).encode("utf-8")
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def read_json(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            try:
+                return json.loads(body or b"{}")
+            except ValueError as e:
+                raise BadRequest(f"body is not valid JSON: {e}")
+
+
+def parse_query(request):
+    """Validated POST /query body → keyword arguments of QueryService.query; BadRequest describes the first problem."""
+    if not isinstance(request, dict):
+        raise BadRequest("body must be a JSON object")
+    question = request.get("question")
+    if not isinstance(question, str) or not question.strip():
+        raise BadRequest("question is required")
+    n_results = request.get("n_results", 5)
+    if isinstance(n_results, bool) or not isinstance(n_results, int) or not 1 <= n_results <= MAX_N_RESULTS:
+        raise BadRequest(f"n_results must be an integer between 1 and {MAX_N_RESULTS}")
+    generate = request.get("generate", True)
+    if not isinstance(generate, bool):
+        raise BadRequest("generate must be true or false")
+    pages = request.get("pages")
+    if pages is not None and not (isinstance(pages, list) and len(pages) == 2
+                                  and all(isinstance(p, int) and not isinstance(p, bool) for p in pages)):
+        raise BadRequest("pages must be [first, last] page numbers")
+    section = request.get("section")
+    if section is not None and not isinstance(section, str):
+        raise BadRequest("section must be a string")
+    shards = request.get("shards")
+    if shards is not None and not (isinstance(shards, list) and all(isinstance(s, str) for s in shards)):
+        raise BadRequest("shards must be a list of shard names")
+    return {"question": question.strip(), "n_results": n_results, "generate": generate,
+            "where": metadata_filter(pages=tuple(pages) if pages else None, section=section), "shards": shards}
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            setup_tracing("service")
+            await service.start()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await service.stop()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    method, path = scope["method"], scope["path"].rstrip("/") or "/"
+    if method == "GET" and path == "/health":
+        await send_json(send, 200, {"status": "ok", "in_flight": service.in_flight})
+    elif method == "GET" and path == "/ready":
+        payload = {**service.status, "ready": service.ready, "llm": service.gateway is not None,
+                   "embedding_batches": service.batcher.stats() if service.batcher else None}
+        await send_json(send, 200 if service.ready else 503, payload)
+    elif method == "POST" and path == "/query":
+        try:
+            result = await service.query(**parse_query(await read_json(receive)))
+            await send_json(send, 200, result)
+        except BadRequest as e:
+            await send_json(send, 400, {"error": f"invalid request: {e}"})
+        except ServiceUnavailable as e:
+            await send_json(send, 503, {"error": str(e)})
+        except Exception as e:
+            await send_json(send, 500, {"error": str(e)})
+    else:
+        await send_json(send, 404, {"error": "not found"})
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host=SERVICE_HOST, port=SERVICE_PORT)
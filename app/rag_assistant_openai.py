@@ -1,40 +1,48 @@
-import os
 from dotenv import load_dotenv
-import chromadb
-from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
-from openai import OpenAI
+from embedder import get_embedder
+from vector_index import VECTOR_BACKEND
+from shards import open_collection
+from answer_cache import SemanticAnswerCache
+from hybrid_retriever import HybridRetriever
+from reranker import RerankingRetriever, format_timings
+from llm_gateway import get_gateway
+from context_packer import get_packer, format_packing
 from rag_visualizer import visualize_from_context
+from tracing import setup_tracing, stage
+from warmup import warm_up
 
 # ---------------------------------------------
 # 1️⃣ Load environment
 # ---------------------------------------------
 load_dotenv()
-GROQ_key = os.getenv("GROQ_API_KEY")
-
-if not GROQ_key:
-    raise ValueError("❌ Missing GROQ_API_KEY. Please set it via: setx GROQ_API_KEY 'your_key_here'")
+setup_tracing("assistant")
 
 # ---------------------------------------------
-# 2️⃣ Initialize GROQ client
+# 2️⃣ Initialize the LLM client
 # ---------------------------------------------
-client = OpenAI(api_key=GROQ_key, base_url="https://api.groq.com/openai/v1")
-print("🤖 Using GROQ API successfully authenticated ✅")
+# Pooled connections, timeouts, retries and rate limiting live in the shared gateway;
+# it reads LLM_API_KEY / GROQ_API_KEY, LLM_BASE_URL and LLM_MODEL and refuses to start without a key
+gateway = get_gateway()
+print(f"🤖 Using {gateway.model} via {gateway.base_url} ✅")
 
 # ---------------------------------------------
-# 3️⃣ Connect to Chroma vector store
+# 3️⃣ Connect to the vector store (VECTOR_BACKEND=chroma|local)
 # ---------------------------------------------
 MODEL_NAME = "BAAI/bge-small-en"
-embedding_function = SentenceTransformerEmbeddingFunction(model_name=MODEL_NAME)
-
-chroma_client = chromadb.PersistentClient(path="vectorstore")
+embedder = get_embedder(MODEL_NAME)
+answer_cache = SemanticAnswerCache("assistant")
 collection_name = "rag_docs_final"
 
 try:
-    collection = chroma_client.get_collection(collection_name, embedding_function=embedding_function)
-    print(f"📚 Using existing Chroma collection: {collection_name}")
+    collection = open_collection(embedder)
+    print(f"📚 Using existing {VECTOR_BACKEND} index: {collection_name}")
 except Exception:
-    collection = chroma_client.create_collection(collection_name, embedding_function=embedding_function)
-    print(f"🆕 Created new Chroma collection: {collection_name}")
+    collection = open_collection(embedder, create=True)
+    print(f"🆕 Created new {VECTOR_BACKEND} index: {collection_name}")
+
+retriever = RerankingRetriever(HybridRetriever(collection))
+packer = get_packer()
+warm_up(embedder, retriever, packer)
 
 # ---------------------------------------------
 # 4️⃣ DeepSeek-powered RAG generator
@@ -43,6 +51,7 @@ def generate_answer(question, context):
     prompt = f"""
 You are a Retrieval-Augmented Generation (RAG) assistant.
 Use the provided context to generate an accurate and concise answer.
+Context passages start with their source and pages in [brackets]; cite the ones you use.
 
 Context:
 {context}
@@ -52,15 +61,13 @@ Question:
 
 Answer:
 """
-    response = client.chat.completions.create(
-        model="gemma-7b-it", # tried "llama3-8b-8192" and "groq-cha" as well but "gemma-7b-it"  nothin will worked best.
-        messages=[
+    return gateway.complete(
+        [
             {"role": "system", "content": "You are a helpful assistant specialized in AI and RAG."},
             {"role": "user", "content": prompt},
         ],
         temperature=0.3,
     )
-    return response.choices[0].message.content.strip()
 
 # ---------------------------------------------
 # 5️⃣ Interactive RAG chat loop with live visualization
@@ -68,26 +75,45 @@ Answer:
 while True:
     question = input("\n❓ Ask a question (or type 'exit' to quit): ").strip()
     if question.lower() in ["exit", "quit"]:
+        gateway.usage.report()
         print("👋 Exiting RAG Assistant. Goodbye!")
         break
 
-    results = collection.query(query_texts=[question], n_results=5)
-    docs = results["documents"][0] if results["documents"] else []
-
-    if not docs:
-        print("⚠️ No relevant context found.")
-        continue
-
-    context = "\n".join(docs)
-
-    try:
-        answer = generate_answer(question, context)
-        print("\n💬 RAG Answer:\n", answer)
-    except Exception as e:
-        print(f"\n❌ Error generating response: {e}")
-        continue
-
-    # 🧠 Auto-generate RAG visualization for current question
+    # One span per question; every stage below nests under it
+    with stage("request", question_chars=len(question)) as span:
+        question_vector = embedder.encode([question])[0]
+        results = retriever.query(question, n_results=5, query_embedding=question_vector.tolist())
+        print(f"⏱️ {format_timings(results['timings'])}")
+        docs = results["documents"][0] if results["documents"] else []
+
+        if not docs:
+            print("⚠️ No relevant context found.")
+            continue
+
+        # Overlapping neighbours are stitched together and the prompt stays within the token budget
+        context, packing = packer.pack(docs, metadatas=results["metadatas"][0])
+        print(f"📦 {format_packing(packing)}")
+        if packing["citations"]:
+            print(f"📄 Sources: {'; '.join(packing['citations'])}")
+        span.set_attribute("chunks", len(docs))
+        span.set_attribute("context_chars", len(context))
+
+        # Same evidence + near-identical question → reuse the earlier answer
+        chunk_ids = results["ids"][0]
+        answer = answer_cache.lookup(question_vector, chunk_ids)
+        if answer is not None:
+            span.set_attribute("answer_cache_hit", True)
+            print("\n⚡ RAG Answer (cached):\n", answer)
+        else:
+            try:
+                answer = generate_answer(question, context)
+                print("\n💬 RAG Answer:\n", answer)
+            except Exception as e:
+                print(f"\n❌ Error generating response: {e}")
+                continue
+            answer_cache.store(question, question_vector, chunk_ids, answer)
+
+    # 🧠 Auto-generate RAG visualization (outside the request span: it waits on user input)
     try:
         visualize_from_context(f"Question: {question}\nAnswer: {answer}\nContext: {context}", query=question)
     except Exception as e:
@@ -1,64 +1,360 @@
 import os
-from chromadb import PersistentClient
-from sentence_transformers import SentenceTransformer
+import json
+import time
+import hashlib
+import argparse
+from itertools import islice
 from tqdm import tqdm
-from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+from embedder import get_embedder
+from chunker import StructureChunker, embedder_tokenizer, has_page_breaks, CHUNK_TOKENS, CHUNKER_VERSION
+from doc_store import DocumentStore, DOC_STORE_DIR, is_doc_store
+from vector_index import open_index, drop_index, VECTOR_BACKEND, LOCAL_QUANT
+from lexical_index import LexicalIndex, lexical_index_path
+from shards import ShardRegistry, SHARD_STRATEGY, NUM_SHARDS
+from near_dedup import NearDuplicateFilter, DEDUP_ENABLED
+from tracing import setup_tracing, stage
 
 # -------- CONFIG -------- #
 MODEL_NAME = "BAAI/bge-small-en"
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
 TEXT_FILE = "input/clean_text.txt"
-CHUNK_SIZE = 600
-CHUNK_OVERLAP = 120
+# The extractors' document store when present, else a single text file or a directory of documents
+SOURCE_PATH = os.getenv("RAG_SOURCE") or (DOC_STORE_DIR if is_doc_store(DOC_STORE_DIR) else TEXT_FILE)
+SOURCE_EXTENSIONS = (".txt", ".md")
+READ_BLOCK_CHARS = 1 << 16
+EMBED_BATCH_SIZE = 256
+VECTORSTORE_DIR = "vectorstore"
+COLLECTION_NAME = "rag_docs_final"
 # ------------------------ #
 
-# Initialize the embedding function for Chroma (✅ consistent with assistant)
-embedding_function = SentenceTransformerEmbeddingFunction(model_name=MODEL_NAME)
-model = SentenceTransformer(MODEL_NAME)
-
-def chunk_text(text, chunk_size=600, overlap=120):
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunk = text[start:end].strip()
-        if chunk:
-            chunks.append(chunk)
-        start += (chunk_size - overlap)
-    return chunks
-
-def build_chroma():
-    if not os.path.exists(TEXT_FILE):
-        raise FileNotFoundError(f"❌ Text file not found: {TEXT_FILE}")
-
-    with open(TEXT_FILE, "r", encoding="utf-8") as f:
-        text = f.read()
-
-    chunks = chunk_text(text, CHUNK_SIZE, CHUNK_OVERLAP)
-    print(f"[INFO] Created {len(chunks)} chunks ✅")
-
-    client = PersistentClient(path="vectorstore")
-
-    # ✅ Use same embedding function as assistant
-    collection = client.get_or_create_collection(
-        name="rag_docs_final",
-        embedding_function=embedding_function,
-        metadata={"hnsw:space": "cosine"}
-    )
-
-    # Clean up previous data
+def iter_source_files(path=SOURCE_PATH):
+    """A single file, or every text document under a directory (sorted for reproducible runs)."""
+    if os.path.isfile(path):
+        yield path
+        return
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(SOURCE_EXTENSIONS):
+                yield os.path.join(root, name)
+
+def read_blocks(file_path, block_chars=READ_BLOCK_CHARS):
+    with open(file_path, "r", encoding="utf-8") as f:
+        while True:
+            block = f.read(block_chars)
+            if not block:
+                break
+            yield block
+
+def iter_corpus(path=SOURCE_PATH, chunker=None):
+    """
+    Yield (chunk, metadata) pairs across all documents without loading any of them whole.
+    Page numbers are only recorded for files with form-feed page breaks (a cheap streaming pre-scan).
+    """
+    chunker = chunker or StructureChunker()
+    if is_doc_store(path):
+        # Page-indexed extractor output: streamed row batch by row batch, pages always in order
+        store = DocumentStore(path)
+        for doc, extractor in store.preferred():
+            yield from chunker.chunks(store.iter_text(doc, extractor), doc, paged=True)
+        return
+    for file_path in iter_source_files(path):
+        source = os.path.relpath(file_path, path) if os.path.isdir(path) else os.path.basename(file_path)
+        paged = has_page_breaks(read_blocks(file_path))
+        yield from chunker.chunks(read_blocks(file_path), source, paged=paged)
+
+def dedup_corpus(chunks, enabled=DEDUP_ENABLED):
+    """(chunks, filter): near-duplicates dropped before they reach the embedder (filter is None when disabled)."""
+    if not enabled:
+        return chunks, None
+    dedup = NearDuplicateFilter()
+    return dedup.filter(chunks), dedup
+
+def report_dedup(dedup, span):
+    if dedup is not None:
+        dedup.report()
+        span.set_attribute("chunks_near_duplicate", dedup.removed)
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def chunk_id(chunk):
+    """Stable, content-derived ID: editing one paragraph no longer shifts every ID after it."""
+    return "chunk_" + hashlib.sha256(chunk.encode("utf-8")).hexdigest()[:24]
+
+def index_fingerprint(embedder, backend=VECTOR_BACKEND, chunker=None):
+    """Anything that changes the stored vectors or their metadata; a mismatch forces a full re-embed."""
+    tokenizer = "chars/4" if chunker is None or chunker.tokenizer is None else embedder.model_name
+    return {"model": embedder.model_name, "backend": embedder.backend, "store": backend,
+            "chunker": CHUNKER_VERSION, "chunk_tokens": CHUNK_TOKENS, "chunk_tokenizer": tokenizer}
+
+def manifest_path(vectorstore_dir=VECTORSTORE_DIR, collection_name=COLLECTION_NAME):
+    return os.path.join(vectorstore_dir, f"{collection_name}_manifest.json")
+
+def load_manifest(vectorstore_dir=VECTORSTORE_DIR, collection_name=COLLECTION_NAME):
     try:
-        collection.delete(where={})
-    except:
-        pass
+        with open(manifest_path(vectorstore_dir, collection_name), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_manifest(ids, fingerprint, vectorstore_dir=VECTORSTORE_DIR, collection_name=COLLECTION_NAME):
+    path = manifest_path(vectorstore_dir, collection_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    ids = sorted(ids)
+    # Content version of the store; answer caches are invalidated when it changes
+    version = hashlib.sha256(json.dumps([fingerprint, ids]).encode("utf-8")).hexdigest()[:16]
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"fingerprint": fingerprint, "version": version, "ids": ids}, f)
+    os.replace(tmp_path, path)
+    return version
+
+def indexed_ids(collection, fingerprint, vectorstore_dir=VECTORSTORE_DIR):
+    """
+    IDs already in the store. The manifest is trusted when its fingerprint matches;
+    otherwise everything in the collection is treated as stale.
+    """
+    manifest = load_manifest(vectorstore_dir, collection.name)
+    if manifest and manifest.get("fingerprint") == fingerprint:
+        return set(manifest["ids"]), False
+    return set(collection.get(include=[])["ids"]), True
+
+class IndexWriter:
+    """
+    Incremental ingestion into one collection: its vectors, BM25 index and manifest.
+    Chunks are added one at a time and flushed in batches; finish() deletes whatever
+    the run did not see and saves the manifest.
+    """
+
+    def __init__(self, collection_name, embedder, chunker, vectorstore_dir=VECTORSTORE_DIR,
+                 backend=VECTOR_BACKEND, batch_size=EMBED_BATCH_SIZE):
+        self.embedder = embedder
+        self.vectorstore_dir = vectorstore_dir
+        self.backend = backend
+        self.batch_size = batch_size
+        self.fingerprint = index_fingerprint(embedder, backend, chunker)
+
+        # ✅ Same index backend + embedder the query paths use (VECTOR_BACKEND=chroma|local).
+        # Ingestion is the one place LOCAL_INDEX_QUANT is applied: readers open in the stored mode
+        self.collection = open_index(backend, collection_name, embedder, vectorstore_dir, create=True,
+                                     quant=LOCAL_QUANT if backend == "local" else None)
+
+        self.existing, self.full_rebuild = indexed_ids(self.collection, self.fingerprint, vectorstore_dir)
+        if self.full_rebuild:
+            print(f"[INFO] {collection_name}: no matching manifest — existing vectors will be replaced")
+
+        # BM25 index lives next to the collection and follows the same upserts/deletes
+        self.lexical = LexicalIndex(lexical_index_path(collection_name, vectorstore_dir))
+        self.relex_all = self.full_rebuild or self.lexical.count() != len(self.existing)
+        if self.relex_all:
+            print(f"[INFO] {collection_name}: lexical index out of sync — rebuilding it from the streamed chunks")
+            self.lexical.clear()
+
+        # Only IDs are kept for the whole run; chunk text and vectors live one batch at a time
+        self.seen = set()
+        self.sources = set()
+        self.pending = []
+        self.total_chunks = self.embedded = self.deleted = 0
+
+    def add(self, chunk, metadata):
+        self.pending.append((chunk, metadata))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
 
-    print("[INFO] Encoding text and adding to vector store...")
-    embeddings = model.encode(chunks, show_progress_bar=True).tolist()
-    ids = [f"chunk_{i}" for i in range(len(chunks))]
+    def flush(self):
+        batch, self.pending = self.pending, []
+        self.total_chunks += len(batch)
 
-    collection.add(ids=ids, documents=chunks, embeddings=embeddings)
+        ids, docs, metadatas = [], [], []
+        lex_ids, lex_docs = [], []
+        moved_ids, moved_metadatas = [], []
+        for chunk, metadata in batch:
+            cid = chunk_id(chunk)
+            # Identical chunks share an ID — keep the first occurrence only
+            if cid in self.seen:
+                continue
+            self.seen.add(cid)
+            self.sources.add(metadata["source"])
+            if self.full_rebuild or cid not in self.existing:
+                ids.append(cid)
+                docs.append(chunk)
+                metadatas.append(metadata)
+            else:
+                # Unchanged text can still have moved (pages/offsets): refresh metadata, no re-embed
+                moved_ids.append(cid)
+                moved_metadatas.append(metadata)
+            if self.relex_all or cid not in self.existing:
+                lex_ids.append(cid)
+                lex_docs.append(chunk)
 
-    print("\n✅ Vector store successfully built and saved to: vectorstore/")
-    return collection
+        if ids:
+            embeddings = self.embedder.encode(docs).tolist()
+            with stage("upsert", chunks=len(ids), backend=self.backend, collection=self.collection.name):
+                self.collection.upsert(ids=ids, documents=docs, embeddings=embeddings, metadatas=metadatas)
+            self.embedded += len(ids)
+        if moved_ids:
+            self.collection.update_metadata(moved_ids, moved_metadatas)
+        if lex_ids:
+            with stage("lexical_index", chunks=len(lex_ids)):
+                self.lexical.add(lex_ids, lex_docs)
+
+    def finish(self):
+        """Flush, drop stale chunks and save the manifest; returns the collection's content version."""
+        self.flush()
+        stale = list(self.existing - self.seen)
+        for stale_batch in batched(stale, self.batch_size):
+            self.collection.delete(ids=stale_batch)
+            self.lexical.delete(stale_batch)
+        self.deleted = len(stale)
+
+        if self.collection.backend == "local" and self.collection.ivf:
+            self.collection.build_ivf()
+        return save_manifest(self.seen, self.fingerprint, self.vectorstore_dir, self.collection.name)
+
+def build_chroma(source_path=SOURCE_PATH, batch_size=EMBED_BATCH_SIZE, embedder=None,
+                 vectorstore_dir=VECTORSTORE_DIR, backend=VECTOR_BACKEND, chunker=None):
+    if not os.path.exists(source_path):
+        raise FileNotFoundError(f"❌ Source not found: {source_path}")
+
+    with stage("ingest", source=source_path, backend=backend, batch_size=batch_size) as span:
+        # One shared embedder serves both the vector store and the batch encoder (✅ consistent with assistant)
+        embedder = embedder or get_embedder(MODEL_NAME, EMBEDDING_BACKEND)
+        # Chunks are measured with the embedding model's own tokenizer
+        chunker = chunker or StructureChunker(embedder_tokenizer(embedder))
+        writer = IndexWriter(COLLECTION_NAME, embedder, chunker, vectorstore_dir, backend, batch_size)
+        started = time.perf_counter()
+
+        print(f"[INFO] Streaming chunks from {source_path} in batches of {batch_size}...")
+        progress = tqdm(unit="chunk", desc="Ingesting")
+        corpus, dedup = dedup_corpus(iter_corpus(source_path, chunker))
+        for chunk, metadata in corpus:
+            writer.add(chunk, metadata)
+            progress.update(1)
+        writer.finish()
+        progress.close()
+        report_dedup(dedup, span)
+
+        span.set_attribute("chunks_read", writer.total_chunks)
+        span.set_attribute("chunks_unique", len(writer.seen))
+        span.set_attribute("chunks_embedded", writer.embedded)
+        span.set_attribute("chunks_deleted", writer.deleted)
+
+    elapsed = time.perf_counter() - started
+    print(f"[INFO] {writer.total_chunks} chunks read, {len(writer.seen)} unique, {writer.embedded} new/changed upserted, "
+          f"{writer.deleted} stale deleted")
+    print(f"⚡ Throughput: {writer.total_chunks / elapsed:.1f} chunks/s overall, "
+          f"{writer.embedded / elapsed:.1f} embedded chunks/s ({elapsed:.1f}s)")
+    embedder.cache.report()
+
+    print(f"\n✅ Vector store ({backend}) successfully built and saved to: {vectorstore_dir}/")
+    return writer.collection
+
+def drop_collection(collection_name, vectorstore_dir=VECTORSTORE_DIR, backend=VECTOR_BACKEND):
+    """Remove a collection with its BM25 index and manifest."""
+    drop_index(backend, collection_name, vectorstore_dir)
+    lexical_path = lexical_index_path(collection_name, vectorstore_dir)
+    for path in (lexical_path, lexical_path + "-wal", lexical_path + "-shm", manifest_path(vectorstore_dir, collection_name)):
+        if os.path.exists(path):
+            os.remove(path)
+
+def build_shards(source_path=SOURCE_PATH, strategy=SHARD_STRATEGY, num_shards=NUM_SHARDS, only=None,
+                 batch_size=EMBED_BATCH_SIZE, embedder=None, vectorstore_dir=VECTORSTORE_DIR, backend=VECTOR_BACKEND,
+                 chunker=None):
+    """
+    One streaming pass over the corpus, each chunk routed to its shard's IndexWriter.
+    ``only`` rebuilds just those shards: chunks of every other shard are skipped and
+    their collections are left untouched.
+    """
+    if not os.path.exists(source_path):
+        raise FileNotFoundError(f"❌ Source not found: {source_path}")
+
+    registry = ShardRegistry(vectorstore_dir)
+    if registry.configure(strategy, num_shards):
+        if only:
+            raise ValueError("❌ Shard layout changed — run a full rebuild before rebuilding single shards")
+        print(f"[INFO] Shard layout changed to {strategy} — every shard is rebuilt")
+
+    with stage("ingest", source=source_path, backend=backend, batch_size=batch_size,
+               shard_strategy=strategy, shards=",".join(only or [])) as span:
+        embedder = embedder or get_embedder(MODEL_NAME, EMBEDDING_BACKEND)
+        chunker = chunker or StructureChunker(embedder_tokenizer(embedder))
+        writers, finished = {}, {}
+        current = None
+        started = time.perf_counter()
+
+        def finish(shard):
+            writer = writers.pop(shard)
+            version = writer.finish()
+            registry.record(shard, version, len(writer.seen), writer.sources)
+            finished[shard] = writer
+            print(f"[INFO] Shard {shard}: {len(writer.seen)} chunks, {writer.embedded} embedded, "
+                  f"{writer.deleted} stale deleted")
+
+        print(f"[INFO] Streaming chunks from {source_path} into {strategy} shards...")
+        progress = tqdm(unit="chunk", desc="Ingesting")
+        # Deduplication sees every shard's chunks, so single-shard rebuilds drop exactly what a full run does
+        corpus, dedup = dedup_corpus(iter_corpus(source_path, chunker))
+        for chunk, metadata in corpus:
+            progress.update(1)
+            shard = registry.shard_for(chunk_id(chunk), metadata)
+            if only and shard not in only:
+                continue
+            # Documents arrive one after another: a document shard is complete once the next one starts
+            if strategy == "document" and current not in (None, shard) and current in writers:
+                finish(current)
+            current = shard
+            if shard not in writers:
+                writers[shard] = IndexWriter(registry.collection_name(shard), embedder, chunker,
+                                             vectorstore_dir, backend, batch_size)
+            writers[shard].add(chunk, metadata)
+        for shard in list(writers):
+            finish(shard)
+        progress.close()
+        report_dedup(dedup, span)
+
+        # Shards that received no chunks this run (removed documents, old layout) are dropped
+        candidates = only or list(registry.shards())
+        dropped = [shard for shard in candidates if shard not in finished and shard in registry.shards()]
+        for shard in dropped:
+            drop_collection(registry.shards()[shard]["collection"], vectorstore_dir, backend)
+            registry.remove(shard)
+            print(f"🗑️ Dropped empty shard: {shard}")
+        registry.save()
+
+        chunks_read = sum(w.total_chunks for w in finished.values())
+        embedded = sum(w.embedded for w in finished.values())
+        span.set_attribute("chunks_read", chunks_read)
+        span.set_attribute("chunks_embedded", embedded)
+        span.set_attribute("shards_built", len(finished))
+        span.set_attribute("shards_dropped", len(dropped))
+
+    elapsed = time.perf_counter() - started
+    print(f"[INFO] {len(finished)} shards built, {len(dropped)} dropped, {chunks_read} chunks, "
+          f"{embedded} new/changed upserted")
+    print(f"⚡ Throughput: {embedded / elapsed:.1f} embedded chunks/s ({elapsed:.1f}s)")
+    embedder.cache.report()
+    print(f"\n✅ Sharded vector store ({backend}, {len(registry.shards())} shards) saved to: {vectorstore_dir}/")
+    return registry
 
 if __name__ == "__main__":
-    build_chroma()
+    parser = argparse.ArgumentParser(description="Ingest the corpus into the vector store")
+    parser.add_argument("--shards", help="comma-separated shards to rebuild (others are left untouched)")
+    args = parser.parse_args()
+
+    setup_tracing("ingest")
+    registry = ShardRegistry(VECTORSTORE_DIR)
+    # An existing sharded store stays sharded unless SHARD_STRATEGY picks another layout
+    strategy = SHARD_STRATEGY if SHARD_STRATEGY != "none" else (registry.strategy if registry.exists() else "none")
+    if strategy == "none":
+        if args.shards:
+            raise SystemExit("❌ --shards needs a sharded store (set SHARD_STRATEGY=document|hash)")
+        build_chroma()
+    else:
+        num_shards = NUM_SHARDS if SHARD_STRATEGY != "none" or not registry.exists() else registry.data["num_shards"]
+        build_shards(strategy=strategy, num_shards=num_shards, only=args.shards.split(",") if args.shards else None)
@@ -1,44 +1,103 @@
-from chromadb import PersistentClient
-from sentence_transformers import SentenceTransformer
-from transformers import pipeline
+import os
+import sys
+import argparse
+from embedder import get_embedder
+from shards import open_collection
+from hybrid_retriever import HybridRetriever
+from reranker import RerankingRetriever, format_timings
+from context_packer import get_packer, format_packing
+from tracing import setup_tracing, stage
+from warmup import warm_up
 
-# === Initialize embeddings & ChromaDB ===
-embedder = SentenceTransformer("BAAI/bge-small-en")
-client = PersistentClient(path="vectorstore")
+parser = argparse.ArgumentParser(description="Offline RAG assistant: local retrieval + local flan-t5 answers")
+parser.add_argument("--questions", help="file with one question per line, answered in batches (also used for piped stdin)")
+args = parser.parse_args()
 
+setup_tracing("retrieve")
+
+# === Initialize embeddings & vector store ===
+embedder = get_embedder("BAAI/bge-small-en")
+
+# The pipeline's store: sharded when a shard registry exists; RAG_SHARDS=a,b searches only those shards
+shards = [s for s in os.getenv("RAG_SHARDS", "").split(",") if s] or None
 try:
-    collection = client.get_collection("rag_docs")
-except:
-    collection = client.get_collection("rag_chunks")
+    collection = open_collection(embedder, shards=shards)
+except Exception as e:
+    raise SystemExit(f"❌ No vector index found ({e}) — run app/rag_pipeline.py first")
+
+print(f"📚 Using collection: {collection.name}" + (f" ({len(collection.shards)} shards)" if hasattr(collection, "shards") else ""))
+retriever = RerankingRetriever(HybridRetriever(collection))
+packer = get_packer()
+# flan-t5 reads at most 512 tokens; leave room for the instruction and the question
+FLAN_CONTEXT_BUDGET = 400
 
-print(f"📚 Using collection: {collection.name}")
+warm_up(embedder, retriever, packer)
 
 # === Initialize LLM ===
-print("🧠 Loading local LLM model (flan-t5-base)...")
-generator = pipeline("text2text-generation", model="google/flan-t5-base")
+# transformers is imported only now: a missing index fails fast instead of after the import
+from local_llm import get_generator, format_generation
+generator = get_generator()
+generator.warm_up()
 
-# === Query Loop ===
-while True:
-    query = input("\n❓ Enter your question (or type 'exit' to quit): ")
-    if query.lower() in ["exit", "quit"]:
-        print("👋 Exiting RAG Assistant.")
-        break
 
-    # 1️⃣ Retrieve top chunks
-    query_emb = embedder.encode([query]).tolist()
-    results = collection.query(query_embeddings=query_emb, n_results=5)
-    docs = results.get("documents", [[]])[0]
+def retrieve(query):
+    """Top chunks for one question → (prompt fitted to the model's input window, citations) or None."""
+    with stage("request", question_chars=len(query)) as span:
+        # 1️⃣ Retrieve top chunks
+        query_emb = embedder.encode([query])[0].tolist()
+        results = retriever.query(query, n_results=5, query_embedding=query_emb)
+        print(f"⏱️ {format_timings(results['timings'])}")
+        docs = results.get("documents", [[]])[0]
+
+        if not docs:
+            return None
 
-    if not docs:
-        print("⚠️ No relevant information found.")
-        continue
+        # 2️⃣ Combine top contexts (overlaps merged, bounded to what flan-t5 can read)
+        context, packing = packer.pack(docs, budget=FLAN_CONTEXT_BUDGET, metadatas=results["metadatas"][0])
+        print(f"📦 {format_packing(packing)}")
+        span.set_attribute("chunks", len(docs))
+        span.set_attribute("context_chars", len(context))
+        return generator.build_prompt(query, context), packing["citations"]
 
-    # 2️⃣ Combine top contexts
-    context = "\n\n".join(docs)
 
-    # 3️⃣ Generate answer using LLM
-    prompt = f"Answer the question based on the context below.\n\nContext:\n{context}\n\nQuestion: {query}\n\nAnswer:"
-    answer = generator(prompt, max_new_tokens=200, temperature=0.7)[0]["generated_text"]
+def answer_all(queries):
+    """Retrieve for every question, then answer them together in batched generate calls."""
+    pending = []
+    for query in queries:
+        retrieved = retrieve(query)
+        if retrieved is None:
+            print(f"⚠️ No relevant information found for: {query}")
+        else:
+            pending.append((query, *retrieved))
+    if not pending:
+        return
+
+    # 3️⃣ Generate answers using the local LLM
+    answers, stats = generator.generate([prompt for _, prompt, _ in pending])
 
     # 4️⃣ Print results
-    print("\n💬 RAG Answer:\n", answer)
+    for (query, _, citations), answer in zip(pending, answers):
+        if len(pending) > 1:
+            print(f"\n❓ {query}")
+        print("\n💬 RAG Answer:\n", answer)
+        if citations:
+            print(f"📄 Sources: {'; '.join(citations)}")
+    print(f"⚡ {format_generation(stats)}")
+
+
+# === Batch mode: a question file or piped stdin ===
+if args.questions or not sys.stdin.isatty():
+    source = open(args.questions, "r", encoding="utf-8") if args.questions else sys.stdin
+    with source:
+        questions = [line.strip() for line in source if line.strip()]
+    print(f"🗂️ Answering {len(questions)} questions in batches of {generator.batch_size}")
+    answer_all(questions)
+    sys.exit(0)
+
+# === Query Loop ===
+while True:
+    query = input("\n❓ Enter your question (or type 'exit' to quit): ")
+    if query.lower() in ["exit", "quit"]:
+        print("👋 Exiting RAG Assistant.")
+        break
+    answer_all([query])
@@ -8,54 +8,81 @@ RAG Visualizer Pro v3 (Stable + High-Resolution + Smart Flow)
 ✅ Logs all visualizations with timestamp
 ✅ Prevents 'expected string or bytes-like object' errors
 ✅ Generates high-resolution (300 DPI) visuals
+✅ Renders in memory on a background worker, cached by keyword set + pattern
 """
 
 import os
 import re
 import sys
+import hashlib
 import platform
+import threading
 import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from graphviz import Digraph
+from tracing import stage, in_current_context
 
-# Ensure Graphviz Path
-os.environ["PATH"] += os.pathsep + r"C:\Program Files\Graphviz\bin"
-print("✅ Graphviz path added:", r"C:\Program Files\Graphviz\bin")
+# Graphviz's default Windows install location is not on PATH
+WINDOWS_GRAPHVIZ_BIN = r"C:\Program Files\Graphviz\bin"
+if platform.system() == "Windows" and WINDOWS_GRAPHVIZ_BIN not in os.environ.get("PATH", ""):
+    os.environ["PATH"] += os.pathsep + WINDOWS_GRAPHVIZ_BIN
+
+RENDER_CACHE_DIR = os.getenv("DIAGRAM_CACHE_DIR", os.path.join("outputs", "diagram_cache"))
+RENDER_CACHE_ENTRIES = 64  # in-memory renders kept per process
 
 # ------------------------------------------------------------
-# 1️⃣ Extract RAG-related keywords
+# 1️⃣ + 2️⃣ Keywords and flow pattern in one precompiled pass
 # ------------------------------------------------------------
+RAG_KEYWORDS = (
+    "query", "retriever", "vector", "database", "embedding",
+    "model", "generation", "llm", "chunk", "index", "context",
+    "search", "store", "retrieve", "rank", "rerank", "feedback",
+    "refine", "parallel", "ensemble", "combine", "fusion", "hybrid", "cot",
+)
+# Checked in this order; pattern words match anywhere in a word ("reranking" → rerank)
+FLOW_PATTERNS = (
+    ("parallel", ("parallel", "simultaneous", "compare", "ensemble", "multi-path")),
+    ("loop", ("loop", "feedback", "refine", "iterate", "retrain", "improve")),
+    ("rerank", ("rank", "rerank", "filter", "score")),
+    ("hybrid", ("hybrid", "fusion", "combine", "cross")),
+)
+KEYWORD_SET = frozenset(RAG_KEYWORDS)
+WORD_RE = re.compile(r"\w+")
+
+def analyze_text(text: str):
+    """
+    (keywords, pattern) from a single scan of the text: the distinct words are
+    collected once, then keywords are set lookups and pattern words are substring
+    checks over that (much smaller) vocabulary.
+    """
+    text = str(text or "").lower()
+    words = set(WORD_RE.findall(text))
+    keywords = sorted(words & KEYWORD_SET)
+    vocabulary = " ".join(words)
+    pattern = "linear"
+    for name, terms in FLOW_PATTERNS:
+        # "multi-path" spans two words, so it is looked up in the text itself
+        if any(term in (text if "-" in term else vocabulary) for term in terms):
+            pattern = name
+            break
+    return keywords, pattern
+
 def extract_rag_keywords(text: str):
-    text = str(text or "")
-    possible_keywords = [
-        "query", "retriever", "vector", "database", "embedding",
-        "model", "generation", "llm", "chunk", "index", "context",
-        "search", "store", "retrieve", "rank", "rerank", "feedback",
-        "refine", "parallel", "ensemble", "combine", "fusion", "hybrid", "cot"
-    ]
-    found = [kw for kw in possible_keywords if re.search(rf"\b{kw}\b", text, re.IGNORECASE)]
-    return list(set(found))
+    return analyze_text(text)[0]
 
-# ------------------------------------------------------------
-# 2️⃣ Detect flow pattern (Linear / Loop / Parallel / Rerank / Hybrid)
-# ------------------------------------------------------------
 def detect_flow_pattern(text: str):
-    text = str(text or "").lower()
-    if any(w in text for w in ["parallel", "simultaneous", "compare", "ensemble", "multi-path"]):
-        return "parallel"
-    elif any(w in text for w in ["loop", "feedback", "refine", "iterate", "retrain", "improve"]):
-        return "loop"
-    elif any(w in text for w in ["rank", "rerank", "filter", "score"]):
-        return "rerank"
-    elif any(w in text for w in ["hybrid", "fusion", "combine", "cross"]):
-        return "hybrid"
-    else:
-        return "linear"
+    return analyze_text(text)[1]
 
 # ------------------------------------------------------------
 # 3️⃣ Generate the flow diagram (300 DPI + SVG Export)
 # ------------------------------------------------------------
-def generate_rag_flow_diagram(keywords, pattern="linear", output_path="rag_flow"):
+# Nodes only depend on these keywords, so other keywords do not split the cache
+DIAGRAM_KEYWORDS = {"embedding", "model", "vector", "database", "retriever", "search", "rank", "index", "llm", "generation"}
+
+def build_diagram(keywords, pattern="linear"):
+    from graphviz import Digraph  # only needed once something is actually drawn
+
     dot = Digraph(comment=f"RAG {pattern.title()} Flow", format="png")
 
     # Global Graphviz Attributes (High Quality)
@@ -123,47 +150,142 @@ def generate_rag_flow_diagram(keywords, pattern="linear", output_path="rag_flow"
         dot.edge("V", "G", label="context combine")
         dot.edge("G", "A", label="generate hybrid response")
 
-    # Render PNG (High-Resolution)
-    dot.render(output_path, cleanup=True)
+    return dot
+
+def diagram_key(keywords, pattern):
+    return hashlib.sha256(repr((sorted(set(keywords) & DIAGRAM_KEYWORDS), pattern)).encode("utf-8")).hexdigest()[:16]
+
+class DiagramCache:
+    """Rendered diagrams by (keyword set, pattern, format): in memory, backed by files in RENDER_CACHE_DIR."""
+
+    def __init__(self, cache_dir=RENDER_CACHE_DIR, max_entries=RENDER_CACHE_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def _path(self, key, fmt):
+        return os.path.join(self.cache_dir, f"{key}.{fmt}")
+
+    def get(self, key, fmt, persist=True):
+        with self._lock:
+            data = self._entries.get((key, fmt))
+            if data is not None:
+                self._entries.move_to_end((key, fmt))
+                self.hits += 1
+                return data
+        if not persist:
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            with open(self._path(key, fmt), "rb") as f:
+                data = f.read()
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        self._remember(key, fmt, data)
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, fmt, data, persist=True):
+        self._remember(key, fmt, data)
+        if not persist:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = self._path(key, fmt) + f".{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key, fmt))
+        except OSError as e:
+            print(f"⚠️ Diagram cache not written: {e}")
+
+    def _remember(self, key, fmt, data):
+        with self._lock:
+            self._entries[(key, fmt)] = data
+            self._entries.move_to_end((key, fmt))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+_render_cache = DiagramCache()
+# One render at a time, off the caller's thread; the chat loop never waits for Graphviz
+_render_worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="diagram")
+
+def render_diagram(keywords, pattern="linear", fmt="png", persist=True, cache=_render_cache):
+    """
+    Diagram as PNG/SVG bytes, rendered in memory (dot.pipe) and cached by keyword set + pattern.
+    With persist=False only the in-memory cache is used and nothing touches the disk.
+    """
+    key = diagram_key(keywords, pattern)
+    data = cache.get(key, fmt, persist)
+    if data is not None:
+        return data
+    with stage("render_diagram", format=fmt, pattern=pattern, keywords=len(keywords)):
+        data = build_diagram(keywords, pattern).pipe(format=fmt)
+    cache.put(key, fmt, data, persist)
+    return data
+
+def open_file(path):
+    """Show a file in the platform viewer without waiting for the viewer to exit."""
+    try:
+        if platform.system() == "Windows":
+            os.startfile(path)
+        elif platform.system() == "Darwin":
+            subprocess.Popen(["open", path])
+        else:
+            subprocess.Popen(["xdg-open", path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        print(f"🖼️  Opened: {path}")
+    except Exception as e:
+        print(f"⚠️ Could not open image automatically: {e}")
+
+def generate_rag_flow_diagram(keywords, pattern="linear", output_path="rag_flow", open_viewer=True):
+    """Write <output_path>.png (300 DPI) and <output_path>_svg.svg, reusing cached renders."""
+    png = render_diagram(keywords, pattern, "png")
+    with open(f"{output_path}.png", "wb") as f:
+        f.write(png)
     print(f"✅ {pattern.title()} RAG Flow Diagram generated → {output_path}.png")
 
     # Also Export SVG (for clarity)
-    dot.format = 'svg'
-    dot.render(f"{output_path}_svg", cleanup=True)
+    svg = render_diagram(keywords, pattern, "svg")
+    with open(f"{output_path}_svg.svg", "wb") as f:
+        f.write(svg)
     print(f"🌐 SVG version saved → {output_path}_svg.svg")
 
-    # Auto-open the generated PNG
-    img_file = f"{output_path}.png"
-    if os.path.exists(img_file):
+    if open_viewer:
+        open_file(f"{output_path}.png")
+    return f"{output_path}.png"
+
+def generate_in_background(keywords, pattern="linear", output_path="rag_flow", open_viewer=True):
+    """Queue generate_rag_flow_diagram on the render worker; returns its Future."""
+    def run():
         try:
-            if platform.system() == "Windows":
-                os.startfile(img_file)
-            elif platform.system() == "Darwin":
-                subprocess.run(["open", img_file])
-            else:
-                subprocess.run(["xdg-open", img_file])
-            print(f"🖼️  Opened: {img_file}")
+            return generate_rag_flow_diagram(keywords, pattern, output_path, open_viewer)
         except Exception as e:
-            print(f"⚠️ Could not open image automatically: {e}")
-    else:
-        print(f"❌ Image not found at {img_file}")
-
-    return f"{output_path}.png"
+            print(f"⚠️ Visualization failed: {e}")
+            return None
+    return _render_worker.submit(in_current_context(run))
 
 # ------------------------------------------------------------
 # 4️⃣ Orchestrator with Interactive Choice + Safe Handling
 # ------------------------------------------------------------
 def visualize_from_context(context_text: str, query: str = None, answer: str = None):
+    """
+    Ask whether to draw the flow diagram, then render it on the background worker.
+    Returns a Future resolving to the PNG path (None when skipped).
+    """
     # Convert everything to strings (prevent TypeError)
     context_text, query, answer = str(context_text or ""), str(query or ""), str(answer or "")
     full_text = f"{query}\n{context_text}\n{answer}"
-    keywords = extract_rag_keywords(full_text)
+    keywords, pattern = analyze_text(full_text)
 
     if not keywords:
         print("⚠️ No relevant RAG-related terms detected.")
         return None
 
-    pattern = detect_flow_pattern(full_text)
     print(f"🧠 Detected RAG flow pattern: {pattern.title()}")
 
     # Ask if user wants visualization
@@ -187,8 +309,8 @@ def visualize_from_context(context_text: str, query: str = None, answer: str = N
     os.makedirs(output_dir, exist_ok=True)
     output_path = os.path.join(output_dir, f"rag_flow_{safe_name}_{timestamp}")
 
-    # Generate flow
-    img_path = generate_rag_flow_diagram(keywords, pattern, output_path)
+    # Generate flow (cached renders are reused; the caller gets control back immediately)
+    future = generate_in_background(keywords, pattern, output_path)
 
     # Log the visualization
     log_file = os.path.join(output_dir, "rag_log.txt")
@@ -196,7 +318,7 @@ def visualize_from_context(context_text: str, query: str = None, answer: str = N
         log.write(f"{safe_name}_{timestamp}.png → {pattern.title()} flow [{visualize_output}]\n")
 
     print(f"🪶 Logged in: {log_file}")
-    return img_path
+    return future
 
 # ------------------------------------------------------------
 # 5️⃣ Run standalone
@@ -208,4 +330,6 @@ if __name__ == "__main__":
     The LLM refines responses through a feedback loop and applies reranking.
     """
     sample_answer = "RAG improves responses iteratively through reranking and feedback refinement."
-    visualize_from_context(sample_context, query=sample_question, answer=sample_answer)
+    future = visualize_from_context(sample_context, query=sample_question, answer=sample_answer)
+    if future is not None:
+        future.result()
@@ -0,0 +1,120 @@
+"""
+Cross-encoder reranking stage
+-----------------------------
+Optional stage between retrieval and prompt building (RERANK_ENABLED=1):
+over-fetch RERANK_FETCH_K candidates, score every (query, chunk) pair with a
+small local cross-encoder in batched CPU passes and keep the best N.
+
+Scoring runs on a single background worker with a RERANK_BUDGET_MS deadline.
+If the deadline passes (slow CPU, backlog under load) the first-stage order is
+used instead, so the reranker can never add more than its budget to a request.
+A job that missed its deadline is cancelled: it stops after the current batch
+of RERANK_BATCH pairs (or never starts if it was still queued), so the next
+request's scoring does not wait behind work nobody will use.
+Every result carries per-stage timings to show whether the stage pays for itself.
+"""
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from tracing import stage
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "0") == "1"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_FETCH_K = int(os.getenv("RERANK_FETCH_K", "30"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "300"))
+RERANK_BATCH = int(os.getenv("RERANK_BATCH", "16"))
+
+
+class CrossEncoderReranker:
+    def __init__(self, model_name=RERANK_MODEL, budget_ms=RERANK_BUDGET_MS, batch_size=RERANK_BATCH):
+        self.model_name = model_name
+        self.budget_ms = budget_ms
+        self.batch_size = batch_size
+        self._model = None
+        self._load_lock = threading.Lock()
+        # One scorer at a time: a backlog shows up as a blown budget instead of piling up CPU work
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+
+    @property
+    def model(self):
+        with self._load_lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+                self._model = CrossEncoder(self.model_name, device="cpu", max_length=512)
+                print(f"🎯 Reranker loaded: {self.model_name}")
+            return self._model
+
+    def warm_up(self):
+        self.model.predict([("warm up", "warm up")])
+
+    def score(self, query, documents, cancelled=None):
+        """Cross-encoder scores in batches; None as soon as ``cancelled`` is set (checked between batches)."""
+        scores = []
+        for start in range(0, len(documents), self.batch_size):
+            if cancelled is not None and cancelled.is_set():
+                return None
+            batch = documents[start:start + self.batch_size]
+            scores.extend(self.model.predict([(query, doc) for doc in batch], batch_size=len(batch)))
+        return scores
+
+    def rerank(self, query, ids, documents, top_n):
+        """Return (order, info): candidate positions best first; the incoming order when over budget."""
+        started = time.perf_counter()
+        cancelled = threading.Event()
+        future = self._worker.submit(self.score, query, documents, cancelled)
+        try:
+            scores = future.result(timeout=self.budget_ms / 1000)
+        except TimeoutError:
+            # Free the worker for the next request: stop after the current batch, or skip if still queued
+            cancelled.set()
+            elapsed = (time.perf_counter() - started) * 1000
+            return list(range(min(top_n, len(ids)))), {"rerank_ms": elapsed, "reranked": False, "fallback": "budget"}
+
+        order = sorted(range(len(ids)), key=lambda i: float(scores[i]), reverse=True)[:top_n]
+        elapsed = (time.perf_counter() - started) * 1000
+        return order, {"rerank_ms": elapsed, "reranked": True}
+
+
+class RerankingRetriever:
+    """Wraps any retriever with query(question, n_results, query_embedding, where) and adds the rerank stage."""
+
+    def __init__(self, retriever, reranker=None, enabled=RERANK_ENABLED, fetch_k=RERANK_FETCH_K):
+        self.retriever = retriever
+        self.enabled = enabled
+        self.fetch_k = fetch_k
+        self.reranker = reranker or (CrossEncoderReranker() if enabled else None)
+        if self.enabled:
+            # Load the model up front so the first query is not charged for it (and never times out on it)
+            self.reranker.warm_up()
+
+    def query(self, question, n_results=5, query_embedding=None, where=None):
+        started = time.perf_counter()
+        fetch = max(self.fetch_k, n_results) if self.enabled else n_results
+        with stage("retrieve", n_results=n_results, fetch_k=fetch, filtered=bool(where)) as span:
+            results = self.retriever.query(question, n_results=fetch, query_embedding=query_embedding, where=where)
+            timings = {"retrieve_ms": (time.perf_counter() - started) * 1000, "candidates": len(results["ids"][0])}
+
+            if self.enabled and results["ids"][0]:
+                with stage("rerank", candidates=timings["candidates"], budget_ms=self.reranker.budget_ms) as rerank_span:
+                    order, info = self.reranker.rerank(question, results["ids"][0], results["documents"][0], n_results)
+                    rerank_span.set_attribute("reranked", info["reranked"])
+                results = {key: [[results[key][0][i] for i in order]]
+                           for key in ("ids", "documents", "metadatas") if results.get(key)}
+                timings.update(info)
+
+            span.set_attribute("chunks", len(results["ids"][0]))
+        timings["total_ms"] = (time.perf_counter() - started) * 1000
+        results["timings"] = timings
+        return results
+
+
+def format_timings(timings):
+    """One-line stage breakdown, e.g. 'retrieve 14 ms | rerank 88 ms (30 candidates) | total 102 ms'."""
+    parts = [f"retrieve {timings['retrieve_ms']:.0f} ms"]
+    if "rerank_ms" in timings:
+        note = "" if timings.get("reranked") else ", over budget → first-stage order"
+        parts.append(f"rerank {timings['rerank_ms']:.0f} ms ({timings['candidates']} candidates{note})")
+    parts.append(f"total {timings['total_ms']:.0f} ms")
+    return " | ".join(parts)
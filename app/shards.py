@@ -0,0 +1,212 @@
+"""
+Sharded vector store
+--------------------
+With SHARD_STRATEGY set, rag_pipeline.py spreads chunks over several
+collections instead of the single COLLECTION_NAME one:
+
+    document  one shard per source document (adding a document adds a shard)
+    hash      NUM_SHARDS shards, chunk ID hash modulo NUM_SHARDS (even sizes)
+
+Each shard is a complete index of its own (vectors, BM25 index, manifest), so
+one can be rebuilt without touching the others:
+
+    python app/rag_pipeline.py --shards doc_guide_1a2b3c
+
+vectorstore/shards.json is the registry: strategy, shard → collection name,
+chunk count, documents and content version. Query paths call open_collection(),
+which returns a ShardedCollection when the registry exists. It fans every
+query out to the shards on a thread pool and merges the per-shard top-k with a
+heap, so it drops into HybridRetriever like a plain collection. subset()
+restricts queries to some shards.
+"""
+
+import os
+import re
+import json
+import heapq
+import hashlib
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from vector_index import open_index, VECTOR_BACKEND, COLLECTION_NAME
+from lexical_index import LexicalIndex, lexical_index_path
+from tracing import stage, in_current_context
+
+SHARD_STRATEGY = os.getenv("SHARD_STRATEGY", "none")
+NUM_SHARDS = int(os.getenv("NUM_SHARDS", "4"))
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "8"))
+STRATEGIES = ("none", "document", "hash")
+
+_pool = ThreadPoolExecutor(max_workers=SHARD_WORKERS, thread_name_prefix="shard")
+
+
+def registry_path(vectorstore_dir="vectorstore"):
+    return os.path.join(vectorstore_dir, "shards.json")
+
+
+def document_shard(source):
+    """Readable, collection-name-safe shard name for a source document, e.g. 'doc_mastering_rag_1a2b3c'."""
+    stem = re.sub(r"[^a-z0-9]+", "_", os.path.splitext(source)[0].lower()).strip("_")[:40]
+    return f"doc_{stem}_{hashlib.sha1(source.encode('utf-8')).hexdigest()[:6]}"
+
+
+class ShardRegistry:
+    def __init__(self, vectorstore_dir="vectorstore"):
+        self.vectorstore_dir = vectorstore_dir
+        self.path = registry_path(vectorstore_dir)
+        self.data = None
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+
+    def exists(self):
+        return self.data is not None
+
+    @property
+    def strategy(self):
+        return self.data["strategy"]
+
+    def configure(self, strategy, num_shards=NUM_SHARDS):
+        """Start or keep a layout. Returns True when the previous layout differs (every shard must be rebuilt)."""
+        if strategy not in STRATEGIES[1:]:
+            raise ValueError(f"❌ Unknown shard strategy '{strategy}', expected 'document' or 'hash'")
+        changed = bool(self.data) and (self.data["strategy"], self.data["num_shards"]) != (strategy, num_shards)
+        if not self.data or changed:
+            self.data = {"strategy": strategy, "num_shards": num_shards, "version": None,
+                         "shards": (self.data or {}).get("shards", {})}
+        return changed
+
+    def shard_for(self, cid, metadata):
+        if self.data["strategy"] == "document":
+            return document_shard(metadata["source"])
+        # chunk IDs are 'chunk_' + sha256 hex
+        return f"h{int(cid[6:14], 16) % self.data['num_shards']:02d}"
+
+    def collection_name(self, shard):
+        return f"{COLLECTION_NAME}__{shard}"
+
+    def shards(self):
+        return dict(self.data["shards"]) if self.data else {}
+
+    def record(self, shard, version, chunks, documents):
+        self.data["shards"][shard] = {"collection": self.collection_name(shard), "version": version,
+                                      "chunks": chunks, "documents": sorted(documents),
+                                      "updated": datetime.now().isoformat(timespec="seconds")}
+
+    def remove(self, shard):
+        self.data["shards"].pop(shard, None)
+
+    def save(self):
+        # Store-wide content version (answer caches key on it): changes when any shard changes
+        versions = sorted((name, info["version"]) for name, info in self.data["shards"].items())
+        self.data["version"] = hashlib.sha256(json.dumps(versions).encode("utf-8")).hexdigest()[:16]
+        os.makedirs(self.vectorstore_dir, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def _fan_out(shards, call):
+    """Run call(name, shard) on every shard in parallel; results in shard order."""
+    futures = [_pool.submit(in_current_context(call), name, shard) for name, shard in shards.items()]
+    return [future.result() for future in futures]
+
+
+def _merge_top_k(ranked_lists, k, key, id_of):
+    """Heap-merge per-shard lists already sorted by ``key``; a chunk stored in two shards counts once."""
+    seen, top = set(), []
+    for hit in heapq.merge(*ranked_lists, key=key):
+        if id_of(hit) in seen:
+            continue
+        seen.add(id_of(hit))
+        top.append(hit)
+        if len(top) == k:
+            break
+    return top
+
+
+class ShardedLexicalIndex:
+    """BM25 over every shard; per-shard hits merged by score (each shard keeps its own IDF statistics)."""
+
+    def __init__(self, indexes):
+        self.indexes = indexes
+
+    def count(self):
+        return sum(index.count() for index in self.indexes.values())
+
+    def search(self, query, k=20):
+        hits = _fan_out(self.indexes, lambda name, index: index.search(query, k))
+        return _merge_top_k(hits, k, key=lambda hit: -hit[1], id_of=lambda hit: hit[0])
+
+
+class ShardedCollection:
+    """Read-only collection interface (query / get / count / name) over a set of shard indexes."""
+
+    def __init__(self, registry, embedder=None, backend=VECTOR_BACKEND, names=None):
+        available = registry.shards()
+        names = list(available) if names is None else list(names)
+        unknown = [n for n in names if n not in available]
+        if unknown:
+            raise ValueError(f"❌ Unknown shards {unknown}; available: {sorted(available)}")
+        self.registry = registry
+        self.embedder = embedder
+        self.backend = backend
+        self.name = COLLECTION_NAME
+        self.shards = {n: open_index(backend, available[n]["collection"], embedder, registry.vectorstore_dir)
+                       for n in names}
+        self.lexical = ShardedLexicalIndex({
+            n: LexicalIndex(lexical_index_path(available[n]["collection"], registry.vectorstore_dir)) for n in names
+        })
+
+    def subset(self, names):
+        """A view over only ``names`` (shards must be registered)."""
+        return ShardedCollection(self.registry, self.embedder, self.backend, names)
+
+    def count(self):
+        return sum(index.count() for index in self.shards.values())
+
+    def query(self, query_texts=None, query_embeddings=None, n_results=10, where=None):
+        if query_embeddings is None:
+            # Embed once, not once per shard
+            query_embeddings = self.embedder.encode(query_texts).tolist()
+
+        def search(name, index):
+            with stage("shard_search", shard=name, n_results=n_results):
+                return index.query(query_embeddings=query_embeddings, n_results=n_results, where=where)
+
+        per_shard = _fan_out(self.shards, search)
+        out = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for q in range(len(query_embeddings)):
+            # Every shard's list is sorted by distance: a heap merge yields the global top-k
+            ranked = [zip(r["distances"][q], r["ids"][q], r["documents"][q], r["metadatas"][q]) for r in per_shard]
+            top = _merge_top_k(ranked, n_results, key=lambda hit: hit[0], id_of=lambda hit: hit[1])
+            out["distances"].append([hit[0] for hit in top])
+            out["ids"].append([hit[1] for hit in top])
+            out["documents"].append([hit[2] for hit in top])
+            out["metadatas"].append([hit[3] for hit in top])
+        return out
+
+    def get(self, ids=None, include=("documents", "metadatas"), where=None):
+        per_shard = _fan_out(self.shards, lambda name, index: index.get(ids=ids, include=include, where=where))
+        rows = {}
+        for result in per_shard:
+            for i, doc_id in enumerate(result["ids"]):
+                rows[doc_id] = {key: result[key][i] for key in include if result.get(key) is not None}
+        order = [i for i in ids if i in rows] if ids is not None else list(rows)
+        out = {"ids": order}
+        for key in include:
+            out[key] = [rows[i].get(key) for i in order]
+        return out
+
+
+def open_collection(embedder=None, vectorstore_dir="vectorstore", backend=VECTOR_BACKEND, shards=None, create=False):
+    """
+    The store every query path reads: a ShardedCollection (restricted to ``shards`` if given)
+    when a shard registry exists, else the single COLLECTION_NAME index.
+    """
+    registry = ShardRegistry(vectorstore_dir)
+    if registry.exists():
+        return ShardedCollection(registry, embedder, backend, shards)
+    if shards:
+        raise ValueError("❌ Shard filter given but the store is not sharded (set SHARD_STRATEGY and re-ingest)")
+    return open_index(backend, COLLECTION_NAME, embedder, vectorstore_dir, create=create)
@@ -0,0 +1,139 @@
+"""
+Per-stage tracing and latency metrics
+-------------------------------------
+Every entry point calls setup_tracing(<service>) once; each RAG request then
+produces one OpenTelemetry span per stage (embed, vector/lexical search,
+rerank, LLM, diagram rendering, ingestion batches) plus a
+rag.stage.duration histogram, with prompt size, chunk counts and token usage
+as attributes.
+
+Exporters (RAG_TRACE_EXPORTER), none of which need a collector except otlp:
+
+    file     JSON lines in RAG_TRACE_DIR/<service>_spans.jsonl and _metrics.jsonl (default)
+    console  spans and metrics printed to stdout
+    otlp     OTLP/gRPC to OTEL_EXPORTER_OTLP_ENDPOINT
+    none     instrumentation stays in place as no-ops
+
+Summarize a span file per stage:  python app/tracing.py traces/assistant_spans.jsonl
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from opentelemetry import trace, metrics
+
+TRACE_EXPORTER = os.getenv("RAG_TRACE_EXPORTER", "file")
+TRACE_DIR = os.getenv("RAG_TRACE_DIR", "traces")
+METRICS_INTERVAL_MS = int(os.getenv("RAG_METRICS_INTERVAL_MS", "30000"))
+
+# Proxies until setup_tracing() installs real providers, so modules can instrument at import time
+tracer = trace.get_tracer("rag")
+meter = metrics.get_meter("rag")
+STAGE_DURATION = meter.create_histogram("rag.stage.duration", unit="ms", description="Duration of one RAG stage")
+LLM_TOKENS = meter.create_counter("rag.llm.tokens", unit="token", description="LLM tokens by direction")
+
+_setup_lock = threading.Lock()
+_configured = False
+
+
+def _json_line(item):
+    return item.to_json(indent=None) + os.linesep
+
+
+def setup_tracing(service_name, exporter=TRACE_EXPORTER):
+    """Install tracer + meter providers for this process (first call wins)."""
+    global _configured
+    with _setup_lock:
+        if _configured or exporter == "none":
+            return
+        _configured = True
+
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, SimpleSpanProcessor, ConsoleSpanExporter
+        from opentelemetry.sdk.metrics import MeterProvider
+        from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader, ConsoleMetricExporter
+
+        if exporter == "file":
+            os.makedirs(TRACE_DIR, exist_ok=True)
+            span_out = open(os.path.join(TRACE_DIR, f"{service_name}_spans.jsonl"), "a", encoding="utf-8")
+            metric_out = open(os.path.join(TRACE_DIR, f"{service_name}_metrics.jsonl"), "a", encoding="utf-8")
+            span_processor = BatchSpanProcessor(ConsoleSpanExporter(out=span_out, formatter=_json_line))
+            metric_exporter = ConsoleMetricExporter(out=metric_out, formatter=_json_line)
+        elif exporter == "console":
+            span_processor = SimpleSpanProcessor(ConsoleSpanExporter())
+            metric_exporter = ConsoleMetricExporter()
+        elif exporter == "otlp":
+            from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+            from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
+            span_processor = BatchSpanProcessor(OTLPSpanExporter())
+            metric_exporter = OTLPMetricExporter()
+        else:
+            raise ValueError(f"❌ Unknown RAG_TRACE_EXPORTER: {exporter} (use file, console, otlp or none)")
+
+        resource = Resource.create({"service.name": f"rag-{service_name}"})
+        tracer_provider = TracerProvider(resource=resource)
+        tracer_provider.add_span_processor(span_processor)
+        trace.set_tracer_provider(tracer_provider)
+        reader = PeriodicExportingMetricReader(metric_exporter, export_interval_millis=METRICS_INTERVAL_MS)
+        metrics.set_meter_provider(MeterProvider(resource=resource, metric_readers=[reader]))
+        # Both providers flush and shut down at interpreter exit
+        print(f"📈 Tracing enabled ({exporter}) for rag-{service_name}")
+
+
+@contextmanager
+def stage(name, **attributes):
+    """Span rag.<name> + a rag.stage.duration sample; yields the span for extra attributes."""
+    started = time.perf_counter()
+    with tracer.start_as_current_span(f"rag.{name}", attributes=attributes) as span:
+        try:
+            yield span
+        finally:
+            STAGE_DURATION.record((time.perf_counter() - started) * 1000, {"stage": name})
+
+
+def record_usage(span, usage):
+    """Attach token usage from an OpenAI-style response (object or dict) to a span and the token counter."""
+    if usage is None:
+        return
+    get = usage.get if isinstance(usage, dict) else lambda key: getattr(usage, key, None)
+    for key, direction in (("prompt_tokens", "prompt"), ("completion_tokens", "completion")):
+        value = get(key)
+        if value is not None:
+            span.set_attribute(f"llm.usage.{key}", value)
+            LLM_TOKENS.add(value, {"direction": direction})
+
+
+def in_current_context(fn):
+    """Bind fn to the caller's context so spans opened on pool threads nest under the current span."""
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+
+# ------------------------------------------------------------
+# Span file summary
+# ------------------------------------------------------------
+def summarize(span_file):
+    import numpy as np
+
+    durations = {}
+    with open(span_file, "r", encoding="utf-8") as f:
+        for line in f:
+            span = json.loads(line)
+            start = datetime.fromisoformat(span["start_time"].replace("Z", "+00:00"))
+            end = datetime.fromisoformat(span["end_time"].replace("Z", "+00:00"))
+            durations.setdefault(span["name"], []).append((end - start).total_seconds() * 1000)
+
+    print(f"{'stage':<28}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for name, values in sorted(durations.items(), key=lambda item: -sum(item[1])):
+        p50, p95 = np.percentile(values, [50, 95])
+        print(f"{name:<28}{len(values):>7}{p50:>10.1f}{p95:>10.1f}{max(values):>10.1f}")
+
+
+if __name__ == "__main__":
+    summarize(sys.argv[1] if len(sys.argv) > 1 else os.path.join(TRACE_DIR, "assistant_spans.jsonl"))
@@ -1,23 +1,61 @@
 import streamlit as st
-import chromadb
-from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
-from openai import OpenAI
+from contextlib import closing
+from embedder import get_embedder
+from shards import open_collection, ShardedCollection
+from answer_cache import SemanticAnswerCache, store_version
+from hybrid_retriever import HybridRetriever
+from reranker import RerankingRetriever, format_timings
+from llm_gateway import get_gateway
+from context_packer import get_packer, format_packing
+from chunker import metadata_filter, store_outline
 from dotenv import load_dotenv
-import os
 
-from rag_visualizer import extract_rag_keywords, detect_flow_pattern, generate_rag_flow_diagram
+from rag_visualizer import analyze_text, render_diagram
+from tracing import setup_tracing, stage
+from warmup import warm_up
 
 # Load environment
 load_dotenv()
-GROQ_KEY = os.getenv("GROQ_API_KEY")
+setup_tracing("streamlit")
 
-# Groq Client
-client = OpenAI(api_key=GROQ_KEY, base_url="https://api.groq.com/openai/v1")
+# Heavy resources are built once per process — Streamlit reruns this script on every interaction
+@st.cache_resource(show_spinner="Loading models and vector store ...")
+def load_resources():
+    # Groq via the shared gateway (pooled connections, retries, rate limit)
+    gateway = get_gateway()
 
-# Chroma Setup
-embedding_function = SentenceTransformerEmbeddingFunction(model_name="BAAI/bge-small-en")
-chroma_client = chromadb.PersistentClient(path="vectorstore")
-collection = chroma_client.get_collection("rag_docs_final", embedding_function=embedding_function)
+    # Vector store setup (VECTOR_BACKEND=chroma|local; sharded when a shard registry exists)
+    embedder = get_embedder("BAAI/bge-small-en")
+    collection = open_collection(embedder)
+    retriever = RerankingRetriever(HybridRetriever(collection))
+    packer = get_packer()
+    # Prime model, index and tokenizer while the spinner shows, not on the first question
+    warm_up(embedder, retriever, packer)
+    return gateway, embedder, collection, retriever, packer, SemanticAnswerCache("streamlit")
+
+gateway, embedder, collection, retriever, packer, answer_cache = load_resources()
+
+@st.cache_resource(show_spinner=False)
+def shard_retriever(shards):
+    """The full retriever, or one over a subset of shards (sharing the loaded reranker)."""
+    if not shards:
+        return retriever
+    return RerankingRetriever(HybridRetriever(collection.subset(shards)),
+                              reranker=retriever.reranker, enabled=retriever.enabled)
+
+@st.cache_data(show_spinner=False)
+def outline(version):
+    return store_outline(collection)
+
+# Retrieval is memoized per question and filter; the store version in the key drops stale results after a rebuild
+@st.cache_data(max_entries=256, show_spinner=False)
+def retrieve(question, version, pages=None, section=None, shards=None):
+    results = shard_retriever(shards).query(question, n_results=5, where=metadata_filter(pages, section))
+    return results["documents"][0], results["ids"][0], results["metadatas"][0], results["timings"]
+
+def stream_answer(prompt):
+    """Yield answer tokens as they arrive from a streaming completion."""
+    yield from gateway.stream([{"role": "user", "content": prompt}], temperature=0.3)
 
 # Streamlit UI
 st.title("🔍 RAG Assistant (Streamlit + DeepSeek)")
@@ -25,17 +63,48 @@ st.write("Ask anything based on your PDF knowledge base.")
 
 question = st.text_input("Enter your question:")
 
+# Optional pre-filters: only chunks on these pages / in this section are searched
+sections, last_page = outline(store_version())
+with st.sidebar:
+    st.header("🔎 Filters")
+    pages = st.slider("Pages", 1, last_page, (1, last_page)) if last_page > 1 else None
+    if pages == (1, last_page):
+        pages = None
+    section = st.selectbox("Section", ["All sections"] + sections)
+    section = None if section == "All sections" else section
+    shards = None
+    if isinstance(collection, ShardedCollection):
+        shards = tuple(st.multiselect("Shards", sorted(collection.shards), help="Empty = search all shards")) or None
+
 if question:
-    results = collection.query(query_texts=[question], n_results=5)
-    
-    docs = results["documents"][0]
-    if not docs:
-        st.error("No relevant context found.")
-    else:
-        context = "\n".join(docs)
+    # One span per script run with a question; retrieval, LLM and diagram rendering nest under it
+    with stage("request", question_chars=len(question)) as span:
+        docs, chunk_ids, metadatas, timings = retrieve(question, store_version(), pages, section, shards)
+        st.caption(f"⏱️ {format_timings(timings)}")
 
-        with st.spinner("Generating answer ..."):
-            prompt = f"""Use ONLY the context below to answer.
+        if not docs:
+            st.error("No relevant context found.")
+        else:
+            context, packing = packer.pack(docs, metadatas=metadatas)
+            st.caption(f"📦 {format_packing(packing)}")
+            if packing["citations"]:
+                st.caption(f"📄 Sources: {'; '.join(packing['citations'])}")
+            span.set_attribute("chunks", len(docs))
+            span.set_attribute("context_chars", len(context))
+
+            # Answers survive reruns (e.g. toggling the diagram checkbox) without another LLM call
+            answers = st.session_state.setdefault("answers", {})
+            answer_key = (question, tuple(chunk_ids))
+            answer = answers.get(answer_key)
+            st.success("### 📘 Answer")
+
+            if answer is None:
+                question_vector = embedder.encode([question])[0]
+                answer = answer_cache.lookup(question_vector, chunk_ids)
+
+                if answer is None:
+                    prompt = f"""Use ONLY the context below to answer.
+Context passages start with their source and pages in [brackets]; cite the ones you use.
 
 Context:
 {context}
@@ -45,21 +114,21 @@ Question:
 
 Answer:
 """
-            response = client.chat.completions.create(
-                model="gemma-7b-it",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3
-            )
-
-            answer = response.choices[0].message.content.strip()
-            st.success("### 📘 Answer")
-            st.write(answer)
+                    # Closed even when a rerun interrupts the stream: the gateway slot is released at once
+                    with closing(stream_answer(prompt)) as tokens:
+                        answer = st.write_stream(tokens).strip()
+                    answer_cache.store(question, question_vector, chunk_ids, answer)
+                else:
+                    st.write(answer)
+                answers[answer_key] = answer
+            else:
+                st.write(answer)
 
-        # Diagram option
-        if st.checkbox("Generate RAG Flow Diagram?"):
-            keywords = extract_rag_keywords(context)
-            pattern = detect_flow_pattern(keywords)
-            diagram = generate_rag_flow_diagram(keywords, pattern)
+            # Diagram option
+            if st.checkbox("Generate RAG Flow Diagram?"):
+                keywords, pattern = analyze_text(context)
+                # SVG bytes straight from Graphviz (cached per keyword set + pattern), nothing written to disk
+                diagram = render_diagram(keywords, pattern, "svg", persist=False)
 
-            st.image(diagram)
-            st.success("Diagram generated successfully!")
+                st.image(diagram.decode("utf-8"))
+                st.success("Diagram generated successfully!")
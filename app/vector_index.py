@@ -0,0 +1,557 @@
+"""
+Pluggable vector index backends
+-------------------------------
+Every script reads and writes vectors through open_index(), which returns one
+of two backends with the same Chroma-style interface
+(upsert / update_metadata / delete / get / query / count / name):
+
+    chroma  the existing chromadb.PersistentClient collection (default)
+    local   in-process index: L2-normalized embeddings in a memory-mapped
+            float16/float32 matrix, exact top-k by blocked matrix products, and
+            an optional IVF (inverted file) mode that only scans the
+            LOCAL_IVF_NPROBE closest clusters for larger corpora
+
+Select with VECTOR_BACKEND=chroma|local. The local backend opens in
+milliseconds: nothing is loaded until pages of the matrix are touched.
+
+LOCAL_INDEX_QUANT=int8|binary adds a compact copy of every vector (int8 codes
+with a per-row scale, or one sign bit per dimension) that the candidate search
+scans instead of the full matrix. Only the best k × rescore candidates are then
+read back from the float matrix and scored exactly, so the hot working set
+shrinks 2× (int8 vs float16) to 16× (binary) at close to exact recall.
+benchmarks/quantization_report.py measures the trade-off on your vectors.
+
+query() and get() take a Chroma ``where`` metadata filter on both backends,
+e.g. {"$and": [{"page_start": {"$lte": 12}}, {"page_end": {"$gte": 10}}]}.
+The local backend resolves it in SQLite first and only scans matching rows.
+
+Local queries hold the index lock only to snapshot the current arrays; the
+scan, rescoring and row fetch (a per-thread SQLite reader on the WAL database)
+run without it, so concurrent queries search in parallel and writers only wait
+for the snapshot.
+"""
+
+import os
+import json
+import shutil
+import sqlite3
+import threading
+import numpy as np
+
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+COLLECTION_NAME = "rag_docs_final"
+LOCAL_DTYPE = os.getenv("LOCAL_INDEX_DTYPE", "float16")
+LOCAL_IVF = os.getenv("LOCAL_INDEX_IVF", "0") == "1"
+IVF_NPROBE = int(os.getenv("LOCAL_IVF_NPROBE", "8"))
+LOCAL_QUANT = os.getenv("LOCAL_INDEX_QUANT", "none")
+# Candidates kept per result for the full-precision rescoring pass; sign bits need a wider net
+RESCORE_FACTOR = {"int8": int(os.getenv("LOCAL_INT8_RESCORE", "4")),
+                  "binary": int(os.getenv("LOCAL_BINARY_RESCORE", "16"))}
+QUANT_MODES = ("none", "int8", "binary")
+SCAN_BLOCK_ROWS = 65536
+INITIAL_CAPACITY = 1024
+
+
+def open_index(backend=VECTOR_BACKEND, name=COLLECTION_NAME, embedder=None, vectorstore_dir="vectorstore", create=False,
+               quant=None):
+    """
+    Open (or with ``create=True`` create) the named index on the chosen backend. ``quant`` re-encodes a
+    local index to that mode; None keeps the stored one (what every reader wants).
+    """
+    if backend == "chroma":
+        import chromadb
+        client = chromadb.PersistentClient(path=vectorstore_dir)
+        embedding_function = embedder.chroma_function() if embedder else None
+        if create:
+            collection = client.get_or_create_collection(
+                name=name, embedding_function=embedding_function, metadata={"hnsw:space": "cosine"}
+            )
+        else:
+            collection = client.get_collection(name, embedding_function=embedding_function)
+        return ChromaIndex(collection)
+    if backend == "local":
+        return LocalIndex(os.path.join(vectorstore_dir, f"{name}_local"), name, embedder, create=create, quant=quant)
+    raise ValueError(f"❌ Unknown vector backend '{backend}', expected 'chroma' or 'local'")
+
+
+def drop_index(backend=VECTOR_BACKEND, name=COLLECTION_NAME, vectorstore_dir="vectorstore"):
+    """Delete the named index and its vectors; a missing index is not an error."""
+    if backend == "chroma":
+        import chromadb
+        client = chromadb.PersistentClient(path=vectorstore_dir)
+        if name in [c.name for c in client.list_collections()]:
+            client.delete_collection(name)
+    elif backend == "local":
+        shutil.rmtree(os.path.join(vectorstore_dir, f"{name}_local"), ignore_errors=True)
+    else:
+        raise ValueError(f"❌ Unknown vector backend '{backend}', expected 'chroma' or 'local'")
+
+
+WHERE_OPERATORS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+def where_sql(where):
+    """Translate a Chroma ``where`` filter into an SQL condition over the JSON metadata column."""
+    clauses, params = [], []
+    for key, value in where.items():
+        if key in ("$and", "$or"):
+            parts = [where_sql(part) for part in value]
+            clauses.append("(" + f" {key[1:].upper()} ".join(clause for clause, _ in parts) + ")")
+            params.extend(p for _, part_params in parts for p in part_params)
+            continue
+        if not isinstance(value, dict):
+            value = {"$eq": value}
+        field = f"json_extract(metadata, '$.\"{key}\"')"
+        for op, operand in value.items():
+            if op in WHERE_OPERATORS:
+                clauses.append(f"{field} {WHERE_OPERATORS[op]} ?")
+                params.append(operand)
+            elif op in ("$in", "$nin"):
+                marks = ",".join("?" * len(operand))
+                clauses.append(f"{field} {'NOT IN' if op == '$nin' else 'IN'} ({marks})")
+                params.extend(operand)
+            else:
+                raise ValueError(f"❌ Unsupported where operator '{op}'")
+    return " AND ".join(clauses) or "1", params
+
+
+def _normalize(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+
+def quantize(vectors, quant):
+    """(codes, scales) for unit vectors: symmetric int8 with one scale per row, or packed sign bits."""
+    if quant == "int8":
+        scales = np.clip(np.abs(vectors).max(axis=1), 1e-12, None) / 127
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    if quant == "binary":
+        return np.packbits(vectors > 0, axis=1), None
+    raise ValueError(f"❌ Unknown quantization '{quant}', expected one of {QUANT_MODES}")
+
+
+def code_width(dim, quant):
+    return dim if quant == "int8" else (dim + 7) // 8
+
+
+class ChromaIndex:
+    """Thin adapter so the Chroma collection satisfies the common interface."""
+
+    backend = "chroma"
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.name = collection.name
+
+    def upsert(self, ids, documents, embeddings, metadatas=None):
+        self.collection.upsert(ids=ids, documents=documents, embeddings=embeddings, metadatas=metadatas)
+
+    def update_metadata(self, ids, metadatas):
+        self.collection.update(ids=ids, metadatas=metadatas)
+
+    def delete(self, ids):
+        self.collection.delete(ids=ids)
+
+    def get(self, ids=None, include=("documents", "metadatas"), where=None):
+        return self.collection.get(ids=ids, where=where or None, include=list(include))
+
+    def query(self, query_texts=None, query_embeddings=None, n_results=10, where=None):
+        if query_embeddings is not None:
+            return self.collection.query(query_embeddings=query_embeddings, n_results=n_results, where=where or None)
+        return self.collection.query(query_texts=query_texts, n_results=n_results, where=where or None)
+
+    def count(self):
+        return self.collection.count()
+
+
+class SearchSnapshot:
+    """The arrays one query reads, captured under the index lock so the scan itself runs without it."""
+
+    def __init__(self, index):
+        self.matrix, self.codes, self.scales = index._matrix, index._codes, index._scales
+        self.valid, self.capacity = index._valid, index.capacity
+        self.quant, self.rescore = index.quant, index.rescore
+        self.centroids, self.assign = index._centroids, index._assign
+        self.ivf, self.nprobe = index.ivf, index.nprobe
+        # Deletes seen so far: a row freed after this point may hold another chunk by the time hits are named
+        self.epoch = index._delete_epoch
+
+    def top_k(self, score, rows, k):
+        """Top-k among ``rows`` (all valid rows when None) by ``score(index)``, scanning in blocks."""
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        if rows is None:
+            blocks = ((start, np.arange(start, min(start + SCAN_BLOCK_ROWS, self.capacity)))
+                      for start in range(0, self.capacity, SCAN_BLOCK_ROWS))
+        else:
+            blocks = ((None, rows[s:s + SCAN_BLOCK_ROWS]) for s in range(0, len(rows), SCAN_BLOCK_ROWS))
+        for start, block_rows in blocks:
+            if start is not None:
+                valid = self.valid[start:start + len(block_rows)]
+                scores = score(slice(start, start + len(block_rows)))[valid]
+                block_rows = block_rows[valid]
+            else:
+                scores = score(block_rows)
+            if len(block_rows) == 0:
+                continue
+            best_rows = np.concatenate([best_rows, block_rows])
+            best_scores = np.concatenate([best_scores, scores])
+            if len(best_scores) > k:
+                keep = np.argpartition(-best_scores, k)[:k]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+        order = np.argsort(-best_scores)
+        return best_rows[order], best_scores[order]
+
+    def exact_scorer(self, query):
+        return lambda index: np.asarray(self.matrix[index], dtype=np.float32) @ query
+
+    def code_scorer(self, query):
+        if self.quant == "int8":
+            # The query stays float: only the stored side is quantized
+            return lambda index: (np.asarray(self.codes[index], dtype=np.float32) @ query) * self.scales[index]
+        bits = np.packbits(query > 0)
+        # Fewer differing sign bits = closer; negated Hamming distance ranks like a similarity
+        return lambda index: -np.bitwise_count(self.codes[index] ^ bits).sum(axis=1, dtype=np.int32).astype(np.float32)
+
+    def search(self, query, rows, k):
+        """Exact top-k, or quantized candidate search + full-precision rescoring of the best k × rescore."""
+        fetch = k * self.rescore
+        if self.codes is None or (rows is not None and len(rows) <= fetch):
+            return self.top_k(self.exact_scorer(query), rows, k)
+        candidates, _ = self.top_k(self.code_scorer(query), rows, fetch)
+        # Sorted rows keep the float reads in file order
+        return self.top_k(self.exact_scorer(query), np.sort(candidates), k)
+
+    def candidate_rows(self, query):
+        if not self.ivf or self.centroids is None:
+            return None
+        probes = np.argsort(-(self.centroids @ query))[:self.nprobe]
+        return np.flatnonzero(np.isin(self.assign, probes) & self.valid)
+
+
+class LocalIndex:
+    """
+    Files under ``path``:
+        vectors.bin   memory-mapped (capacity, dim) matrix of unit vectors
+        rows.sqlite   row → id, document, metadata
+        meta.json     dim, dtype, capacity, quant
+        ivf.npz       centroids + per-row cluster assignment (IVF mode only)
+        codes.bin     (capacity, code width) int8 codes or packed sign bits (quantized mode only)
+        scales.bin    per-row float32 scale of the int8 codes
+    Deleted rows are zeroed, masked out and reused by later inserts.
+    ``quant=None`` (the default) opens an index in its stored mode, so readers never touch the codes; a
+    new index starts as LOCAL_INDEX_QUANT. Passing a different ``quant`` re-encodes the codes once from the
+    matrix — only the ingestion path does that (rag_pipeline's IndexWriter).
+    """
+
+    backend = "local"
+
+    def __init__(self, path, name, embedder=None, dtype=LOCAL_DTYPE, create=False, ivf=LOCAL_IVF, nprobe=IVF_NPROBE,
+                 quant=None, rescore=None):
+        if quant is not None and quant not in QUANT_MODES:
+            raise ValueError(f"❌ Unknown quantization '{quant}', expected one of {QUANT_MODES}")
+        self.path = path
+        self.name = name
+        self.embedder = embedder
+        self.ivf = ivf
+        self.nprobe = nprobe
+        meta_path = os.path.join(path, "meta.json")
+        if not create and not os.path.exists(meta_path):
+            raise FileNotFoundError(f"❌ Local index not found: {path} (run rag_pipeline.py with VECTOR_BACKEND=local)")
+        os.makedirs(path, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._readers = threading.local()
+        self._db = sqlite3.connect(os.path.join(path, "rows.sqlite"), check_same_thread=False)
+        # WAL: readers on their own connections never wait for (or see half of) a write
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS rows (row INTEGER PRIMARY KEY, id TEXT UNIQUE, document TEXT, metadata TEXT)")
+        self._db.commit()
+
+        meta = {"dim": None, "dtype": dtype, "capacity": 0, "quant": quant or LOCAL_QUANT}
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta.update({"quant": "none"}, **json.load(f))
+        self.dim, self.dtype, self.capacity = meta["dim"], np.dtype(meta["dtype"]), meta["capacity"]
+        self.quant = meta["quant"]
+        if not os.path.exists(meta_path):
+            self._save_meta()
+
+        self._row_ids = [None] * self.capacity
+        self._id_rows = {}
+        for row, doc_id in self._db.execute("SELECT row, id FROM rows"):
+            self._row_ids[row] = doc_id
+            self._id_rows[doc_id] = row
+        self._valid = np.array([i is not None for i in self._row_ids], dtype=bool)
+        # Per row, the delete epoch it was last freed in; queries drop hits on rows freed after their snapshot
+        self._delete_epoch = 0
+        self._freed_at = np.zeros(self.capacity, dtype=np.int64)
+        self._free = [r for r in range(self.capacity - 1, -1, -1) if self._row_ids[r] is None]
+        self._matrix = self._map() if self.capacity else None
+        self._codes, self._scales = self._map_codes() if self.capacity else (None, None)
+
+        self._centroids, self._assign = None, None
+        ivf_path = os.path.join(path, "ivf.npz")
+        if os.path.exists(ivf_path):
+            ivf = np.load(ivf_path)
+            self._centroids, self._assign = ivf["centroids"], ivf["assign"].copy()
+
+        if quant is not None and quant != self.quant:
+            self.requantize(quant)
+        self.rescore = rescore or RESCORE_FACTOR.get(self.quant, 1)
+
+    # ---------------- storage ---------------- #
+    def _map(self):
+        return np.memmap(os.path.join(self.path, "vectors.bin"), dtype=self.dtype, mode="r+",
+                         shape=(self.capacity, self.dim))
+
+    def _map_codes(self):
+        if self.quant == "none" or self.dim is None:
+            return None, None
+        codes = np.memmap(os.path.join(self.path, "codes.bin"), mode="r+",
+                          dtype=np.int8 if self.quant == "int8" else np.uint8,
+                          shape=(self.capacity, code_width(self.dim, self.quant)))
+        scales = None
+        if self.quant == "int8":
+            scales = np.memmap(os.path.join(self.path, "scales.bin"), dtype=np.float32, mode="r+",
+                               shape=(self.capacity,))
+        return codes, scales
+
+    def _resize_codes(self, capacity):
+        """Size the code files for ``capacity`` rows (new rows read as zeros)."""
+        if self.quant == "none" or self.dim is None:
+            return
+        self._codes = self._scales = None
+        with open(os.path.join(self.path, "codes.bin"), "ab") as f:
+            f.truncate(capacity * code_width(self.dim, self.quant))
+        if self.quant == "int8":
+            with open(os.path.join(self.path, "scales.bin"), "ab") as f:
+                f.truncate(capacity * 4)
+
+    def _save_meta(self):
+        with open(os.path.join(self.path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "dtype": self.dtype.name, "capacity": self.capacity, "quant": self.quant}, f)
+
+    def _save_ivf(self):
+        np.savez(os.path.join(self.path, "ivf.npz"), centroids=self._centroids, assign=self._assign)
+
+    def _grow(self, needed):
+        new_capacity = max(self.capacity * 2, INITIAL_CAPACITY, self.capacity + needed)
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        with open(os.path.join(self.path, "vectors.bin"), "ab") as f:
+            f.truncate(new_capacity * self.dim * self.dtype.itemsize)
+        self._resize_codes(new_capacity)
+        self._free = list(range(new_capacity - 1, self.capacity - 1, -1)) + self._free
+        self._row_ids.extend([None] * (new_capacity - self.capacity))
+        self._valid = np.concatenate([self._valid, np.zeros(new_capacity - self.capacity, dtype=bool)])
+        self._freed_at = np.concatenate([self._freed_at, np.zeros(new_capacity - self.capacity, dtype=np.int64)])
+        if self._assign is not None:
+            self._assign = np.concatenate([self._assign, np.full(new_capacity - self.capacity, -1, dtype=np.int32)])
+        self.capacity = new_capacity
+        self._matrix = self._map()
+        self._codes, self._scales = self._map_codes()
+        self._save_meta()
+
+    def requantize(self, quant, block_rows=SCAN_BLOCK_ROWS):
+        """Switch the candidate-search encoding, rebuilding the codes from the float matrix."""
+        with self._lock:
+            self._codes = self._scales = None
+            for name in ("codes.bin", "scales.bin"):
+                if os.path.exists(os.path.join(self.path, name)):
+                    os.remove(os.path.join(self.path, name))
+            self.quant = quant
+            self.rescore = RESCORE_FACTOR.get(quant, 1)
+            if self.capacity and self.dim is not None:
+                self._resize_codes(self.capacity)
+                self._codes, self._scales = self._map_codes()
+                if self._codes is not None:
+                    for start in range(0, self.capacity, block_rows):
+                        self._write_codes(slice(start, start + block_rows),
+                                          np.asarray(self._matrix[start:start + block_rows], dtype=np.float32))
+                    self._codes.flush()
+            self._save_meta()
+            print(f"🗜️ Local index re-encoded for candidate search: quant={quant} ({self.count()} vectors)")
+
+    def _write_codes(self, rows, vectors):
+        codes, scales = quantize(vectors, self.quant)
+        self._codes[rows] = codes
+        if scales is not None:
+            self._scales[rows] = scales
+
+    # ---------------- writes ---------------- #
+    def upsert(self, ids, documents, embeddings, metadatas=None):
+        vectors = _normalize(embeddings)
+        metadatas = metadatas or [None] * len(ids)
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                self._save_meta()
+            new = sum(1 for i in set(ids) if i not in self._id_rows)
+            if new > len(self._free):
+                self._grow(new - len(self._free))
+
+            rows, written = [], []
+            for doc_id, document, metadata, vector in zip(ids, documents, metadatas, vectors):
+                row = self._id_rows.get(doc_id)
+                if row is None:
+                    row = self._free.pop()
+                    self._id_rows[doc_id] = row
+                    self._row_ids[row] = doc_id
+                    self._valid[row] = True
+                self._matrix[row] = vector
+                if self._centroids is not None:
+                    self._assign[row] = int(np.argmax(self._centroids @ vector))
+                rows.append((row, doc_id, document, json.dumps(metadata) if metadata else None))
+                written.append(row)
+            self._matrix.flush()
+            if self._codes is not None:
+                self._write_codes(written, vectors)
+                self._codes.flush()
+            self._db.executemany("INSERT OR REPLACE INTO rows (row, id, document, metadata) VALUES (?, ?, ?, ?)", rows)
+            self._db.commit()
+            if self._centroids is not None:
+                self._save_ivf()
+
+    def update_metadata(self, ids, metadatas):
+        with self._lock:
+            self._db.executemany("UPDATE rows SET metadata = ? WHERE id = ?",
+                                 [(json.dumps(m) if m else None, i) for i, m in zip(ids, metadatas)])
+            self._db.commit()
+
+    def delete(self, ids):
+        with self._lock:
+            self._delete_epoch += 1
+            for doc_id in ids:
+                row = self._id_rows.pop(doc_id, None)
+                if row is None:
+                    continue
+                self._row_ids[row] = None
+                self._valid[row] = False
+                self._freed_at[row] = self._delete_epoch
+                self._matrix[row] = 0
+                if self._codes is not None:
+                    self._codes[row] = 0
+                self._free.append(row)
+                if self._assign is not None:
+                    self._assign[row] = -1
+            self._db.executemany("DELETE FROM rows WHERE id = ?", [(i,) for i in ids])
+            self._db.commit()
+            if self._matrix is not None:
+                self._matrix.flush()
+            if self._codes is not None:
+                self._codes.flush()
+            if self._assign is not None:
+                self._save_ivf()
+
+    def build_ivf(self, nlist=None, iterations=10, seed=0):
+        """Train spherical k-means centroids over the current vectors and assign every row to one."""
+        with self._lock:
+            rows = np.flatnonzero(self._valid)
+            if len(rows) == 0:
+                return
+            vectors = np.asarray(self._matrix[rows], dtype=np.float32)
+            nlist = min(nlist or max(1, int(np.sqrt(len(rows)))), len(rows))
+            rng = np.random.default_rng(seed)
+            centroids = vectors[rng.choice(len(rows), nlist, replace=False)]
+            for _ in range(iterations):
+                labels = np.argmax(vectors @ centroids.T, axis=1)
+                for c in range(nlist):
+                    members = vectors[labels == c]
+                    # Empty clusters are re-seeded from a random vector
+                    centroids[c] = members.sum(axis=0) if len(members) else vectors[rng.integers(len(rows))]
+                centroids = _normalize(centroids)
+            self._centroids = centroids
+            self._assign = np.full(self.capacity, -1, dtype=np.int32)
+            self._assign[rows] = np.argmax(vectors @ centroids.T, axis=1)
+            self._save_ivf()
+            print(f"🧭 IVF index trained: {nlist} clusters over {len(rows)} vectors")
+
+    # ---------------- reads ---------------- #
+    def count(self):
+        return len(self._id_rows)
+
+    def bytes_per_vector(self):
+        """Bytes read per vector by the candidate scan, and by the full-precision matrix."""
+        full = (self.dim or 0) * self.dtype.itemsize
+        if self.quant == "none":
+            return {"scan": full, "full": full}
+        return {"scan": code_width(self.dim or 0, self.quant) + (4 if self.quant == "int8" else 0), "full": full}
+
+    def _reader(self):
+        """This thread's own SQLite connection for reads (queries never share the writer's)."""
+        db = getattr(self._readers, "db", None)
+        if db is None:
+            db = self._readers.db = sqlite3.connect(os.path.join(self.path, "rows.sqlite"), check_same_thread=False)
+        return db
+
+    def _fetch(self, ids, include):
+        found = {}
+        for start in range(0, len(ids), 500):
+            part = ids[start:start + 500]
+            marks = ",".join("?" * len(part))
+            for doc_id, document, metadata in self._reader().execute(
+                f"SELECT id, document, metadata FROM rows WHERE id IN ({marks})", part
+            ):
+                found[doc_id] = (document, json.loads(metadata) if metadata else None)
+        ids = [i for i in ids if i in found]
+        result = {"ids": ids}
+        if "documents" in include:
+            result["documents"] = [found[i][0] for i in ids]
+        if "metadatas" in include:
+            result["metadatas"] = [found[i][1] for i in ids]
+        return result
+
+    def _filtered_rows(self, where):
+        """Sorted matrix rows whose metadata matches ``where``."""
+        clause, params = where_sql(where)
+        rows = [row for (row,) in self._reader().execute(f"SELECT row FROM rows WHERE {clause}", params)]
+        return np.array(sorted(rows), dtype=np.int64)
+
+    def get(self, ids=None, include=("documents", "metadatas"), where=None):
+        with self._lock:
+            if where:
+                matching = [self._row_ids[r] for r in self._filtered_rows(where)]
+                if ids is not None:
+                    allowed = set(matching)
+                    matching = [i for i in ids if i in allowed]
+                ids = matching
+            elif ids is None:
+                ids = list(self._id_rows)
+            return self._fetch(list(ids), include)
+
+    def _snapshot(self):
+        with self._lock:
+            return SearchSnapshot(self)
+
+    def query(self, query_texts=None, query_embeddings=None, n_results=10, where=None):
+        if query_embeddings is None:
+            if self.embedder is None:
+                raise ValueError("❌ query_texts needs an embedder; pass embedder= to open_index()")
+            query_embeddings = self.embedder.encode(query_texts)
+        queries = _normalize(query_embeddings)
+
+        out = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        snapshot = self._snapshot()
+        # A metadata filter is resolved once; the matching rows are scanned exactly (no IVF needed)
+        filtered = self._filtered_rows(where) if where else None
+        for query in queries:
+            if snapshot.matrix is None or not self._id_rows or (filtered is not None and len(filtered) == 0):
+                rows, scores = np.empty(0, dtype=np.int64), np.empty(0)
+            elif filtered is not None:
+                rows, scores = snapshot.search(query, filtered, n_results)
+            else:
+                rows, scores = snapshot.search(query, snapshot.candidate_rows(query), n_results)
+            with self._lock:
+                # A row freed since the snapshot (deleted, maybe reused) no longer holds the vector it was scored on
+                hits = [(self._row_ids[r], s) for r, s in zip(rows, scores) if self._freed_at[r] <= snapshot.epoch]
+            hits = [(doc_id, s) for doc_id, s in hits if doc_id is not None]
+            fetched = self._fetch([doc_id for doc_id, _ in hits], ("documents", "metadatas"))
+            distances = {doc_id: float(1 - s) for doc_id, s in hits}
+            out["ids"].append(fetched["ids"])
+            out["documents"].append(fetched["documents"])
+            out["metadatas"].append(fetched["metadatas"])
+            # Chroma-compatible cosine distance
+            out["distances"].append([distances[i] for i in fetched["ids"]])
+        return out
@@ -0,0 +1,117 @@
+"""
+Cold start: model snapshot, warm-up and startup profile
+-------------------------------------------------------
+Build time (see dockerfile): snapshot the models into the Hugging Face cache,
+so a starting container never downloads anything. The image then runs with
+HF_HUB_OFFLINE=1 and loads straight from disk:
+
+    python app/warmup.py --download BAAI/bge-small-en
+
+Run time: warm_up() primes a freshly loaded stack before it counts as ready.
+It runs the embedder's first forward pass, touches the vector index pages and
+the BM25 database, and loads the context tokenizer, so the first real question
+already runs at steady-state latency.
+
+Without arguments this file loads and warms the configured stack once and
+prints how long each startup phase took (benchmarks/startup_benchmark.py
+tracks the same numbers across commits).
+
+Only the standard library is imported at module level, so the build step can
+run this file before the application code is copied in.
+"""
+
+import sys
+import json
+import time
+import argparse
+
+# Weights other frameworks use; SentenceTransformer / transformers on CPU never read them
+SNAPSHOT_IGNORE = ["*.h5", "*.msgpack", "*.ot", "*.onnx", "onnx/*", "openvino/*", "flax_model*", "tf_model*",
+                   "rust_model*", "coreml/*"]
+
+
+def download_models(models):
+    """Fetch each model repo into the local Hugging Face cache (HF_HOME)."""
+    from huggingface_hub import snapshot_download
+
+    for name in models:
+        started = time.perf_counter()
+        path = snapshot_download(name, ignore_patterns=SNAPSHOT_IGNORE)
+        print(f"📦 Snapshot {name} → {path} ({time.perf_counter() - started:.1f}s)")
+
+
+def warm_up(embedder, retriever=None, packer=None):
+    """One throwaway pass through every stage; returns (query vector, per-stage timings in ms)."""
+    timings = {}
+    started = time.perf_counter()
+    vector = embedder.encode_uncached(["warm up"])[0]
+    timings["embed_ms"] = (time.perf_counter() - started) * 1000
+    if retriever is not None:
+        t = time.perf_counter()
+        retriever.query("warm up", n_results=1, query_embedding=vector.tolist())
+        timings["retrieve_ms"] = (time.perf_counter() - t) * 1000
+    if packer is not None:
+        t = time.perf_counter()
+        packer.pack(["warm up"])
+        timings["pack_ms"] = (time.perf_counter() - t) * 1000
+    timings["total_ms"] = (time.perf_counter() - started) * 1000
+    print(f"🔥 Warm-up done in {timings['total_ms']:.0f} ms ("
+          + ", ".join(f"{k[:-3]} {v:.0f} ms" for k, v in timings.items() if k != "total_ms") + ")")
+    return vector, timings
+
+
+def profile_startup(embedder=None, vectorstore_dir="vectorstore", backend=None,
+                    question="What is retrieval-augmented generation?"):
+    """Load the query stack the way the entry points do and time each phase (seconds unless noted)."""
+    phases = {}
+    started = t = time.perf_counter()
+
+    from embedder import get_embedder
+    from vector_index import VECTOR_BACKEND
+    from shards import open_collection
+    from hybrid_retriever import HybridRetriever
+    from reranker import RerankingRetriever
+    from context_packer import get_packer
+    phases["import_s"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    embedder = embedder or get_embedder()
+    phases["model_load_s"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    collection = open_collection(embedder, vectorstore_dir, backend or VECTOR_BACKEND)
+    retriever = RerankingRetriever(HybridRetriever(collection, vectorstore_dir))
+    packer = get_packer()
+    phases["index_open_s"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    warm_up(embedder, retriever, packer)
+    phases["warm_up_s"] = time.perf_counter() - t
+    phases["ready_s"] = time.perf_counter() - started
+
+    t = time.perf_counter()
+    vector = embedder.encode([question])[0]
+    results = retriever.query(question, n_results=5, query_embedding=vector.tolist())
+    packer.pack(results["documents"][0], metadatas=results.get("metadatas", [None])[0])
+    phases["first_query_ms"] = (time.perf_counter() - t) * 1000
+    phases["chunks"] = collection.count()
+    return phases
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Snapshot models at build time, or profile a warm start")
+    parser.add_argument("--download", nargs="+", metavar="MODEL", help="models to snapshot into HF_HOME")
+    parser.add_argument("--json", action="store_true", help="print the startup profile as JSON")
+    args = parser.parse_args()
+
+    if args.download:
+        download_models(args.download)
+        sys.exit(0)
+
+    profile = profile_startup()
+    if args.json:
+        print(json.dumps(profile))
+    else:
+        print(f"🚀 Ready in {profile['ready_s']:.2f}s: imports {profile['import_s']:.2f}s | "
+              f"model {profile['model_load_s']:.2f}s | index {profile['index_open_s']:.2f}s | "
+              f"warm-up {profile['warm_up_s']:.2f}s — first query {profile['first_query_ms']:.0f} ms")
@@ -0,0 +1,136 @@
+"""
+Fake OpenAI-compatible chat server
+----------------------------------
+A local stand-in for the Groq endpoint so benchmarks and client tests run with
+no network and no API key. Implements:
+
+    GET  /v1/models
+    POST /v1/chat/completions   (plain JSON and stream=true server-sent events)
+
+Latency is simulated with a time-to-first-token and a per-token delay, and
+every Nth request can be answered with a 429 to exercise retry logic.
+
+Standalone:  python benchmarks/fake_openai_server.py  → http://127.0.0.1:8001/v1
+"""
+
+import json
+import time
+import uuid
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_answer(prompt, max_words=60):
+    """Deterministic answer built from the prompt's context section."""
+    context = prompt.split("Context:", 1)[-1].split("Question:", 1)[0]
+    words = context.split()[:max_words] or ["No", "context", "provided."]
+    return "Based on the context: " + " ".join(words)
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    server_version = "FakeOpenAI/1.0"
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark output clean
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "gemma-7b-it", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+            count = server.request_count
+        if server.error_every and count % server.error_every == 0:
+            self._send_json(429, {"error": {"message": "rate limited (simulated)", "type": "rate_limit"}},
+                            headers={"Retry-After": "0"})
+            return
+
+        prompt = "\n".join(str(m.get("content", "")) for m in request.get("messages", []))
+        answer = fake_answer(prompt)
+        tokens = answer.split(" ")
+        usage = {"prompt_tokens": len(prompt.split()), "completion_tokens": len(tokens),
+                 "total_tokens": len(prompt.split()) + len(tokens)}
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = request.get("model", "gemma-7b-it")
+
+        time.sleep(server.ttft)
+        if not request.get("stream"):
+            time.sleep(server.token_delay * len(tokens))
+            self._send_json(200, {
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": answer}}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        def send_event(payload):
+            self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        for i, token in enumerate(tokens):
+            send_event({
+                "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": {"content": token if i == 0 else " " + token}, "finish_reason": None}],
+            })
+            time.sleep(server.token_delay)
+        send_event({
+            "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        })
+        # Like OpenAI: streamed usage only on request, as a final chunk without choices
+        if (request.get("stream_options") or {}).get("include_usage"):
+            send_event({
+                "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [], "usage": usage,
+            })
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def start_fake_server(host="127.0.0.1", port=0, ttft=0.05, token_delay=0.005, error_every=0):
+    """Start the server on a daemon thread; returns (server, base_url). Call server.shutdown() to stop."""
+    server = ThreadingHTTPServer((host, port), FakeOpenAIHandler)
+    server.daemon_threads = True
+    server.ttft = ttft
+    server.token_delay = token_delay
+    server.error_every = error_every
+    server.request_count = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True, name="fake-openai").start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    server, url = start_fake_server(port=8001)
+    print(f"🧪 Fake OpenAI-compatible server running at {url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
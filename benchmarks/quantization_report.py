@@ -0,0 +1,140 @@
+"""
+Quantized vector storage: recall vs memory report
+-------------------------------------------------
+Builds one local index, then reopens it with every LOCAL_INDEX_QUANT mode and
+rescore factor and compares each configuration's top-k with the exact float32
+top-k of the same queries:
+
+  • recall@k against exact search (same ids in the top k)
+  • bytes per vector scanned by the candidate search, and the resident size of
+    that scan for the whole corpus
+  • query latency p50 / p95
+
+Vectors are either seeded synthetic clusters (normalized Gaussian mixtures, so
+neighbours are meaningful) or copied out of an existing local index. Queries
+are stored vectors with added noise. A JSON report is written next to the
+main benchmark's results.
+
+Example:
+    python benchmarks/quantization_report.py --vectors 200000 --dim 384
+    python benchmarks/quantization_report.py --index vectorstore/rag_docs_final_local
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from datetime import datetime
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "app"))
+
+from vector_index import LocalIndex, _normalize  # noqa: E402
+from rag_benchmark import percentiles, git_commit  # noqa: E402
+
+INSERT_BATCH = 10000
+
+
+def synthetic_vectors(n, dim, seed, clusters=256, spread=1.4):
+    rng = np.random.default_rng(seed)
+    centers = _normalize(rng.standard_normal((clusters, dim)))
+    labels = rng.integers(clusters, size=n)
+    return _normalize(centers[labels] + spread * rng.standard_normal((n, dim)) / np.sqrt(dim))
+
+
+def index_vectors(path):
+    # Opens in the stored mode: the user's index is only read
+    index = LocalIndex(path, os.path.basename(path))
+    rows = np.flatnonzero(index._valid)
+    return np.asarray(index._matrix[rows], dtype=np.float32)
+
+
+def exact_top_k(vectors, queries, k):
+    scores = queries @ vectors.T
+    top = np.argpartition(-scores, k, axis=1)[:, :k]
+    return [set(row) for row in top]
+
+
+def run(args):
+    vectors = index_vectors(args.index) if args.index else synthetic_vectors(args.vectors, args.dim, args.seed)
+    n, dim = vectors.shape
+    rng = np.random.default_rng(args.seed + 1)
+    sample = rng.choice(n, size=min(args.queries, n), replace=False)
+    queries = _normalize(vectors[sample] + args.noise * rng.standard_normal((len(sample), dim)) / np.sqrt(dim))
+    print(f"📐 {n} vectors × {dim} dims, {len(queries)} queries, k={args.k}")
+
+    # 1️⃣ Ground truth: brute-force float32
+    truth = exact_top_k(vectors, queries, args.k)
+
+    # 2️⃣ One index on disk, re-encoded per mode
+    work_dir = tempfile.mkdtemp(prefix="rag_quant_")
+    report = {"timestamp": datetime.now().isoformat(timespec="seconds"), "commit": git_commit(),
+              "config": {"vectors": n, "dim": dim, "queries": len(queries), "k": args.k, "dtype": args.dtype,
+                         "source": args.index or "synthetic", "seed": args.seed},
+              "results": []}
+    try:
+        path = os.path.join(work_dir, "index")
+        index = LocalIndex(path, "quant_report", dtype=args.dtype, create=True, quant="none")
+        for start in range(0, n, INSERT_BATCH):
+            ids = [f"v{i}" for i in range(start, min(start + INSERT_BATCH, n))]
+            index.upsert(ids, [""] * len(ids), vectors[start:start + INSERT_BATCH])
+
+        configs = [("none", 1)] + [(quant, r) for quant in ("int8", "binary") for r in args.rescore]
+        for quant, rescore in configs:
+            index = LocalIndex(path, "quant_report", quant=quant, rescore=rescore)
+            # Warm the page cache so every mode is timed on resident data
+            index.query(query_embeddings=queries[:5], n_results=args.k)
+            latencies, hits = [], 0
+            for query, expected in zip(queries, truth):
+                started = time.perf_counter()
+                ids = index.query(query_embeddings=query[None, :], n_results=args.k)["ids"][0]
+                latencies.append((time.perf_counter() - started) * 1000)
+                hits += len(set(int(i[1:]) for i in ids) & expected)
+            sizes = index.bytes_per_vector()
+            result = {"quant": quant, "rescore": rescore if quant != "none" else None,
+                      f"recall@{args.k}": hits / (len(queries) * args.k),
+                      "scan_bytes_per_vector": sizes["scan"], "full_bytes_per_vector": sizes["full"],
+                      "scan_mb": sizes["scan"] * n / 1e6, "latency": percentiles(latencies)}
+            report["results"].append(result)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    # 3️⃣ Table + machine-readable output
+    print(f"\n{'mode':<8}{'rescore':>8}{'recall@' + str(args.k):>11}{'B/vector':>10}{'scan MB':>10}"
+          f"{'p50 ms':>9}{'p95 ms':>9}")
+    for r in report["results"]:
+        print(f"{r['quant']:<8}{r['rescore'] or '-':>8}{r[f'recall@{args.k}']:>11.2%}"
+              f"{r['scan_bytes_per_vector']:>10}{r['scan_mb']:>10.1f}"
+              f"{r['latency']['p50_ms']:>9.2f}{r['latency']['p95_ms']:>9.2f}")
+
+    os.makedirs(args.out, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    out_file = os.path.join(args.out, f"quant_{stamp}.json")
+    with open(out_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"📝 Report saved → {out_file}")
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Recall vs memory of quantized local index storage")
+    parser.add_argument("--index", help="existing local index directory to take vectors from")
+    parser.add_argument("--vectors", type=int, default=100000, help="synthetic vectors to generate")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rescore", type=int, nargs="+", default=[1, 2, 4, 8, 16],
+                        help="candidates per result kept for full-precision rescoring")
+    parser.add_argument("--noise", type=float, default=0.5, help="query perturbation around stored vectors")
+    parser.add_argument("--dtype", default="float16", help="dtype of the full-precision matrix")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=os.path.join(ROOT, "benchmarks", "results"))
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    run(parse_args())
@@ -0,0 +1,312 @@
+"""
+RAG retrieval + ingestion benchmark
+-----------------------------------
+Reproducible measurements for changes to chunking, the embedding model or
+backend, n_results and the vector store:
+
+  • ingestion throughput (chunks/s) through rag_pipeline.build_chroma()
+  • query latency p50 / p95 / p99 through the hybrid (+ optional rerank) retriever
+  • recall@k against labeled answers
+  • end-to-end answer latency (retrieve → prompt → LLM), with the LLM served by
+    the local fake OpenAI-compatible server, so no network or API key is needed
+  • memory high-water mark after each phase
+
+The corpus is either a seeded synthetic knowledge base with generated
+question/answer pairs, or passages sampled from input/clean_text.txt. Every
+run writes a JSON report and appends one line to history.jsonl for comparison.
+
+Example:
+    python benchmarks/rag_benchmark.py --corpus synthetic --docs 200 --backend local
+    python benchmarks/rag_benchmark.py --embedder hashing   # fully offline smoke run
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+import zlib
+from datetime import datetime
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "app"))
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# ------------------------------------------------------------
+# Corpus + labeled questions
+# ------------------------------------------------------------
+SYLLABLES = ["zor", "blax", "qui", "tren", "vel", "mora", "kip", "san", "dor", "lux", "fen", "ria", "tal", "osk"]
+FILLER = ("the system data model index query vector store chunk answer context retrieval pipeline "
+          "latency memory batch token embedding document search result score cache layer service "
+          "request response node cluster shard update stream process worker").split()
+PEOPLE = ["Ada Park", "Ravi Menon", "Lena Ortiz", "Tomas Berg", "Mei Chen", "Omar Haddad", "Sara Novak"]
+ATTRIBUTES = ["write-back", "read-through", "tiered", "sharded", "append-only", "columnar"]
+
+
+def entity_name(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(3)).capitalize()
+
+
+def filler_sentence(rng):
+    words = [rng.choice(FILLER) for _ in range(rng.randint(8, 18))]
+    return " ".join(words).capitalize() + "."
+
+
+def synthetic_corpus(out_dir, n_docs, n_questions, seed):
+    """Write n_docs text files; return questions with the exact answer text ('needle') they need."""
+    rng = random.Random(seed)
+    facts = []
+    used = set()
+    for d in range(n_docs):
+        sentences = []
+        for _ in range(rng.randint(3, 6)):
+            entity = entity_name(rng)
+            while entity in used:
+                entity = entity_name(rng)
+            used.add(entity)
+            person, year = rng.choice(PEOPLE), rng.randint(1970, 2024)
+            attr, shards = rng.choice(ATTRIBUTES), rng.randint(2, 512)
+            if rng.random() < 0.5:
+                needle = f"{entity} module was designed by {person} in {year}"
+                question = f"Who designed the {entity} module and when?"
+            else:
+                needle = f"{entity} uses a {attr} cache with {shards} shards"
+                question = f"What kind of cache does {entity} use and how many shards?"
+            facts.append({"question": question, "needle": needle, "doc": d})
+            sentences.extend(filler_sentence(rng) for _ in range(rng.randint(4, 10)))
+            sentences.append(f"The {needle}.")
+        with open(os.path.join(out_dir, f"doc_{d:05d}.txt"), "w", encoding="utf-8") as f:
+            f.write(" ".join(sentences))
+    return rng.sample(facts, min(n_questions, len(facts)))
+
+
+def extracted_corpus(out_dir, n_questions, seed, source=os.path.join(ROOT, "input", "clean_text.txt")):
+    """Use the real extracted text; questions are 8-word spans sampled from its sentences."""
+    shutil.copy(source, os.path.join(out_dir, "clean_text.txt"))
+    with open(source, "r", encoding="utf-8") as f:
+        sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+", f.read()) if len(s.split()) >= 12]
+    rng = random.Random(seed)
+    questions = []
+    for sentence in rng.sample(sentences, min(n_questions, len(sentences))):
+        words = sentence.split()
+        start = rng.randint(0, len(words) - 8)
+        span = " ".join(words[start:start + 8])
+        questions.append({"question": span, "needle": span})
+    return questions
+
+
+# ------------------------------------------------------------
+# Offline embedding stand-in
+# ------------------------------------------------------------
+class _NoCache:
+    def report(self):
+        pass
+
+
+class HashingEmbedder:
+    """Signed feature-hashing bag of words; same interface as embedder.Embedder, no model download."""
+
+    model_name = "hashing-384"
+    backend = "hashing"
+    dim = 384
+    cache = _NoCache()
+
+    def encode(self, texts, batch_size=None):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in re.findall(r"\w+", text.lower()):
+                h = zlib.crc32(token.encode("utf-8"))
+                out[row, h % self.dim] += 1.0 if (h >> 16) & 1 else -1.0
+        return out / np.clip(np.linalg.norm(out, axis=1, keepdims=True), 1e-12, None)
+
+    def encode_uncached(self, texts, batch_size=None):
+        return self.encode(texts)
+
+    def chroma_function(self):
+        return None  # vectors are always passed explicitly
+
+
+# ------------------------------------------------------------
+# Measurements
+# ------------------------------------------------------------
+def max_rss_mb():
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage / 1024 / 1024 if sys.platform == "darwin" else usage / 1024
+
+
+def percentiles(samples_ms):
+    if not samples_ms:
+        return {}
+    p50, p95, p99 = np.percentile(samples_ms, [50, 95, 99])
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99),
+            "mean_ms": float(np.mean(samples_ms)), "n": len(samples_ms)}
+
+
+def normalize_ws(text):
+    return " ".join(text.lower().split())
+
+
+def contains_needle(documents, needle):
+    needle = normalize_ws(needle)
+    return any(needle in normalize_ws(doc) for doc in documents)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def run(args):
+    work_dir = tempfile.mkdtemp(prefix="rag_bench_")
+    # Cold, isolated caches: the run must not read or pollute the real ones
+    os.environ["EMBEDDING_CACHE_DIR"] = os.path.join(work_dir, "embedding_cache")
+
+    from rag_pipeline import build_chroma, iter_corpus
+    from chunker import StructureChunker, embedder_tokenizer
+    from hybrid_retriever import HybridRetriever
+    from reranker import RerankingRetriever
+    from fake_openai_server import start_fake_server
+
+    corpus_dir = os.path.join(work_dir, "corpus")
+    store_dir = os.path.join(work_dir, "vectorstore")
+    os.makedirs(corpus_dir)
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "config": vars(args),
+        "memory": {"start_mb": max_rss_mb()},
+    }
+
+    try:
+        # 1️⃣ Corpus
+        if args.corpus == "synthetic":
+            questions = synthetic_corpus(corpus_dir, args.docs, args.questions, args.seed)
+        else:
+            questions = extracted_corpus(corpus_dir, args.questions, args.seed)
+        print(f"📚 Corpus ready: {args.corpus}, {len(questions)} labeled questions")
+
+        if args.embedder == "hashing":
+            embedder = HashingEmbedder()
+        else:
+            from embedder import get_embedder
+            embedder = get_embedder()
+        report["memory"]["model_loaded_mb"] = max_rss_mb()
+
+        # 2️⃣ Ingestion
+        # The tokenizer is loaded before the timer: ingestion throughput must not include it
+        chunker = StructureChunker(embedder_tokenizer(embedder))
+        chunk_count = sum(1 for _ in iter_corpus(corpus_dir, chunker))
+        started = time.perf_counter()
+        collection = build_chroma(source_path=corpus_dir, embedder=embedder,
+                                  vectorstore_dir=store_dir, backend=args.backend, chunker=chunker)
+        ingest_s = time.perf_counter() - started
+        report["ingest"] = {"chunks": chunk_count, "indexed": collection.count(), "seconds": ingest_s,
+                            "chunks_per_s": chunk_count / ingest_s if ingest_s else None}
+        report["memory"]["after_ingest_mb"] = max_rss_mb()
+
+        # 3️⃣ Query latency + recall@k
+        retriever = RerankingRetriever(HybridRetriever(collection, store_dir))
+        retriever.query(questions[0]["question"], n_results=args.k,
+                        query_embedding=embedder.encode([questions[0]["question"]])[0].tolist())  # warm-up
+        latencies, embed_latencies, hits = [], [], 0
+        for q in questions:
+            started = time.perf_counter()
+            vector = embedder.encode([q["question"]])[0].tolist()
+            embedded = time.perf_counter()
+            results = retriever.query(q["question"], n_results=args.k, query_embedding=vector)
+            done = time.perf_counter()
+            embed_latencies.append((embedded - started) * 1000)
+            latencies.append((done - started) * 1000)
+            hits += contains_needle(results["documents"][0], q["needle"])
+        report["query"] = {
+            "k": args.k,
+            f"recall@{args.k}": hits / len(questions),
+            "latency": percentiles(latencies),
+            "embed_latency": percentiles(embed_latencies),
+        }
+        report["memory"]["after_queries_mb"] = max_rss_mb()
+
+        # 4️⃣ End-to-end answers through the fake OpenAI-compatible server
+        from llm_gateway import LLMGateway
+        from context_packer import get_packer
+        server, base_url = start_fake_server(ttft=args.llm_ttft, token_delay=args.llm_token_delay)
+        gateway = LLMGateway(base_url=base_url, api_key="benchmark", rpm=0)
+        packer = get_packer()
+        e2e, ttft, context_tokens = [], [], []
+        for q in questions[:args.llm_questions]:
+            started = time.perf_counter()
+            vector = embedder.encode([q["question"]])[0].tolist()
+            results = retriever.query(q["question"], n_results=args.k, query_embedding=vector)
+            context, packing = packer.pack(results["documents"][0])
+            context_tokens.append(packing["tokens"])
+            prompt = f"Use ONLY the context below to answer.\n\nContext:\n{context}\n\nQuestion:\n{q['question']}\n\nAnswer:\n"
+            first = None
+            for _ in gateway.stream([{"role": "user", "content": prompt}], temperature=0.3):
+                if first is None:
+                    first = time.perf_counter()
+            done = time.perf_counter()
+            e2e.append((done - started) * 1000)
+            ttft.append(((first or done) - started) * 1000)
+        server.shutdown()
+        report["end_to_end"] = {"latency": percentiles(e2e), "time_to_first_token": percentiles(ttft),
+                                "mean_context_tokens": float(np.mean(context_tokens)) if context_tokens else None,
+                                "llm": "fake-openai-server", "llm_ttft_s": args.llm_ttft}
+        report["memory"]["peak_mb"] = max_rss_mb()
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    # 5️⃣ Machine-readable output
+    os.makedirs(args.out, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    out_file = os.path.join(args.out, f"bench_{stamp}.json")
+    with open(out_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    with open(os.path.join(args.out, "history.jsonl"), "a", encoding="utf-8") as f:
+        f.write(json.dumps(report) + "\n")
+
+    q, lat = report["query"], report["query"]["latency"]
+    print(f"\n⚡ Ingestion: {report['ingest']['chunks_per_s']:.1f} chunks/s ({report['ingest']['chunks']} chunks)")
+    print(f"🔍 Query: p50 {lat['p50_ms']:.1f} ms | p95 {lat['p95_ms']:.1f} ms | p99 {lat['p99_ms']:.1f} ms | "
+          f"recall@{args.k} {q[f'recall@{args.k}']:.2%}")
+    print(f"💬 End-to-end: p50 {report['end_to_end']['latency']['p50_ms']:.1f} ms")
+    print(f"🧠 Peak memory: {report['memory']['peak_mb']} MB")
+    print(f"📝 Report saved → {out_file}")
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark RAG ingestion and retrieval")
+    parser.add_argument("--corpus", choices=["synthetic", "extracted"], default="synthetic")
+    parser.add_argument("--docs", type=int, default=200, help="synthetic documents to generate")
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--backend", choices=["chroma", "local"], default=os.getenv("VECTOR_BACKEND", "chroma"))
+    parser.add_argument("--embedder", choices=["real", "hashing"], default="real",
+                        help="'hashing' is an offline stand-in for the embedding model")
+    parser.add_argument("--llm-questions", type=int, default=20)
+    parser.add_argument("--llm-ttft", type=float, default=0.05, help="simulated LLM time to first token (s)")
+    parser.add_argument("--llm-token-delay", type=float, default=0.005, help="simulated per-token delay (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=os.path.join(ROOT, "benchmarks", "results"))
+    parser.add_argument("--keep", action="store_true", help="keep the temporary corpus and index")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    run(parse_args())
@@ -0,0 +1,198 @@
+"""
+Startup-time benchmark
+----------------------
+Cold-start regressions (a heavy top-level import, a model fetched at runtime, a
+missing warm-up) do not show up in the query benchmark, so this one measures
+fresh processes only:
+
+  • import time of every app module, each in its own interpreter
+  • time to ready: imports → model load → index open → warm-up, the same path
+    the entry points take (warmup.profile_startup), against a small index
+    built once per run
+  • latency of the first real query after warm-up
+
+Each number is the median of --runs fresh processes. The report is written as
+JSON and appended to startup_history.jsonl; the change against the previous
+entry is printed, and --max-ready-s / --max-import-s turn the run into a
+check that exits with status 1 on regression.
+
+Example:
+    python benchmarks/startup_benchmark.py --embedder hashing --runs 5
+    python benchmarks/startup_benchmark.py --max-ready-s 8 --max-import-s 0.5
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT, "app")
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Modules the entry points import before they can serve (ui_streamlit itself only runs under streamlit)
+APP_MODULES = ["embedder", "vector_index", "shards", "hybrid_retriever", "reranker", "context_packer",
+               "answer_cache", "llm_gateway", "rag_visualizer", "tracing", "query_service"]
+IMPORT_PROBE = "import time; t = time.perf_counter(); import {module}; print('\\n' + repr(time.perf_counter() - t))"
+
+
+def child_env(work_dir):
+    env = dict(os.environ, PYTHONPATH=APP_DIR)
+    # Cold, isolated caches: runs must not read or pollute the real ones
+    env["EMBEDDING_CACHE_DIR"] = os.path.join(work_dir, "embedding_cache")
+    return env
+
+
+def last_line(output):
+    return output.strip().splitlines()[-1]
+
+
+def time_imports(modules, runs, env):
+    timings = {}
+    for module in modules:
+        samples = []
+        for _ in range(runs):
+            done = subprocess.run([sys.executable, "-c", IMPORT_PROBE.format(module=module)], cwd=ROOT, env=env,
+                                  capture_output=True, text=True)
+            if done.returncode != 0:
+                print(f"⚠️ import {module} failed: {last_line(done.stderr)}")
+                samples = []
+                break
+            samples.append(float(last_line(done.stdout)))
+        timings[module] = float(np.median(samples)) if samples else None
+    return timings
+
+
+def time_startup(args, store_dir, env):
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--store", store_dir,
+               "--backend", args.backend, "--embedder", args.embedder]
+    profiles = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        done = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True)
+        if done.returncode != 0:
+            raise SystemExit(f"❌ Startup run failed:\n{done.stderr[-2000:]}")
+        profile = json.loads(last_line(done.stdout))
+        profile["process_s"] = time.perf_counter() - started
+        profiles.append(profile)
+    return {key: float(np.median([p[key] for p in profiles])) for key in profiles[0]}
+
+
+def build_store(args, work_dir):
+    """A small index to open: the synthetic benchmark corpus through the real ingestion pipeline."""
+    from rag_benchmark import synthetic_corpus, HashingEmbedder
+    import rag_pipeline
+
+    corpus_dir = os.path.join(work_dir, "corpus")
+    store_dir = os.path.join(work_dir, "vectorstore")
+    os.makedirs(corpus_dir, exist_ok=True)
+    synthetic_corpus(corpus_dir, args.docs, 1, args.seed)
+    embedder = HashingEmbedder() if args.embedder == "hashing" else None
+    rag_pipeline.build_chroma(corpus_dir, embedder=embedder, vectorstore_dir=store_dir, backend=args.backend)
+    return store_dir
+
+
+def run_child(args):
+    from warmup import profile_startup
+
+    embedder = None
+    if args.embedder == "hashing":
+        from rag_benchmark import HashingEmbedder
+        embedder = HashingEmbedder()
+    print(json.dumps(profile_startup(embedder, args.store, args.backend)))
+
+
+def previous_report(history_path):
+    try:
+        with open(history_path, "r", encoding="utf-8") as f:
+            lines = [line for line in f if line.strip()]
+        return json.loads(lines[-1]) if lines else None
+    except (OSError, ValueError):
+        return None
+
+
+def run(args):
+    from rag_benchmark import git_commit
+
+    work_dir = tempfile.mkdtemp(prefix="rag_startup_")
+    env = child_env(work_dir)
+    try:
+        # 1️⃣ Per-module import time, each in a fresh interpreter
+        print(f"⏱️ Timing imports ({args.runs} fresh processes per module)...")
+        imports = time_imports(APP_MODULES, args.runs, env)
+
+        # 2️⃣ Process start → ready → first query
+        print(f"⏱️ Timing cold starts against a {args.docs}-document {args.backend} index...")
+        store_dir = build_store(args, work_dir)
+        startup = time_startup(args, store_dir, env)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {"timestamp": datetime.now().isoformat(timespec="seconds"), "commit": git_commit(),
+              "config": {"backend": args.backend, "embedder": args.embedder, "docs": args.docs, "runs": args.runs},
+              "imports_s": imports, "startup": startup}
+
+    # 3️⃣ Report, history and regression check
+    os.makedirs(args.out, exist_ok=True)
+    history_path = os.path.join(args.out, "startup_history.jsonl")
+    previous = previous_report(history_path)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    out_file = os.path.join(args.out, f"startup_{stamp}.json")
+    with open(out_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    with open(history_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(report) + "\n")
+
+    print("\n📦 Import time (median):")
+    for module, seconds in sorted(imports.items(), key=lambda item: -(item[1] or 0)):
+        print(f"   {module:<18} {'failed' if seconds is None else f'{seconds * 1000:7.0f} ms'}")
+    print(f"\n🚀 Ready in {startup['ready_s']:.2f}s (process {startup['process_s']:.2f}s): "
+          f"imports {startup['import_s']:.2f}s | model {startup['model_load_s']:.2f}s | "
+          f"index {startup['index_open_s']:.2f}s | warm-up {startup['warm_up_s']:.2f}s")
+    print(f"🔍 First query after warm-up: {startup['first_query_ms']:.1f} ms")
+    if previous and previous.get("config") == report["config"]:
+        delta = startup["ready_s"] - previous["startup"]["ready_s"]
+        print(f"📈 vs {previous.get('commit') or 'previous run'}: ready {delta:+.2f}s")
+    print(f"📝 Report saved → {out_file}")
+
+    failures = []
+    if args.max_ready_s is not None and startup["ready_s"] > args.max_ready_s:
+        failures.append(f"ready {startup['ready_s']:.2f}s > {args.max_ready_s}s")
+    if args.max_import_s is not None:
+        failures += [f"import {m} {s:.2f}s > {args.max_import_s}s"
+                     for m, s in imports.items() if s is not None and s > args.max_import_s]
+    if failures:
+        print("❌ Startup regression: " + "; ".join(failures))
+        sys.exit(1)
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark process startup: imports, time to ready, first query")
+    parser.add_argument("--backend", choices=["chroma", "local"], default=os.getenv("VECTOR_BACKEND", "chroma"))
+    parser.add_argument("--embedder", choices=["real", "hashing"], default="real",
+                        help="'hashing' is an offline stand-in for the embedding model")
+    parser.add_argument("--docs", type=int, default=50, help="synthetic documents in the index")
+    parser.add_argument("--runs", type=int, default=3, help="fresh processes per measurement")
+    parser.add_argument("--max-ready-s", type=float, help="fail when the median time to ready exceeds this")
+    parser.add_argument("--max-import-s", type=float, help="fail when any module import exceeds this")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=os.path.join(ROOT, "benchmarks", "results"))
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--store", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.child:
+        run_child(args)
+    else:
+        run(args)
@@ -1,15 +1,24 @@
 import fitz, os, re
+from app.doc_store import DocumentStore, file_hash
 
-os.makedirs("text_clean", exist_ok=True)
+INPUT_PDF = "data/mastering_rag.pdf"  # <-- Use original PDF
+EXTRACTOR = "text"
 
-doc = fitz.open("data/mastering_rag.pdf")  # <-- Use original PDF
-all_text = ""
+doc_name = os.path.basename(INPUT_PDF)
+source_hash = file_hash(INPUT_PDF)
+store = DocumentStore()
 
-for i, page in enumerate(doc):
-    text = page.get_text("text")
-    text = re.sub(r"\n\s*\n", "\n\n", text)  # normalize whitespace
-    all_text += text + "\n\n"
+if store.is_current(doc_name, EXTRACTOR, source_hash):
+    print(f"[SKIP] {doc_name} unchanged — document store is up to date")
+else:
+    doc = fitz.open(INPUT_PDF)
+    rows = []
+    for i, page in enumerate(doc):
+        # One row per text block of the PDF text layer (image blocks have type 1)
+        for x0, y0, x1, y1, text, block_no, block_type in page.get_text("blocks"):
+            if block_type == 0:
+                text = re.sub(r"\n\s*\n", "\n\n", text)  # normalize whitespace
+                rows.append((i + 1, block_no, "text", text.strip(), "text_layer"))
 
-open("text_clean/full_document.txt", "w", encoding="utf8").write(all_text)
-
-print("[DONE] Text extracted → text_clean/full_document.txt")
+    path = store.write(doc_name, EXTRACTOR, source_hash, rows, len(doc))
+    print(f"[DONE] Text extracted → {path}")
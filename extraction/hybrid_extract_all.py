@@ -1,71 +1,211 @@
+# Run from the repository root: python -m extraction.hybrid_extract_all
 import os
 import fitz  # PyMuPDF
-from paddleocr import PaddleOCR
 import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm import tqdm
+from extraction.page_classifier import classify_page
+from extraction.page_render import render_page
+from app.doc_store import DocumentStore, file_hash
 
 # === Configuration ===
 INPUT_PDF = "input/mastering_rag.pdf"
 OUTPUT_DIR = "data/hybrid_output"
-CLEAN_TEXT_PATH = "input/clean_text.txt"
+CHECKPOINT_DIR = os.path.join(OUTPUT_DIR, "pages")
+CLEAN_TEXT_PATH = "input/clean_text.txt"  # flat export of the store, form feed between pages
+EXTRACTOR = "hybrid"
+NUM_WORKERS = int(os.getenv("OCR_WORKERS", os.cpu_count() or 1))
 
-# Initialize PaddleOCR (CPU mode)
-ocr = PaddleOCR(use_angle_cls=True, lang="en", use_gpu=False, show_log=False)
+# Per-process state: every worker holds its own OCR engine and PDF handle
+ocr = None
+doc = None
 
-# Ensure output folder exists
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+def worker_threads(workers):
+    """CPU threads per OCR process: the cores are shared out, never cores² threads across the pool."""
+    return max(1, (os.cpu_count() or 1) // max(workers, 1))
 
-def extract_text_from_page(image_path):
-    """Run full-page OCR on a given image."""
-    result = ocr.ocr(image_path)
+def limit_threads(workers):
+    """
+    Cap the OpenMP/BLAS pools at each worker's share of the cores. The runtimes read these
+    once, when paddle is first imported, so this runs in the parent before any OCR process
+    exists (workers inherit the environment) and paddleocr is only imported in init_worker.
+    """
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(worker_threads(workers))
+
+def init_worker(pdf_path=INPUT_PDF, workers=1):
+    """Create this process's PaddleOCR instance (CPU mode, its share of the cores) and open the PDF once."""
+    from paddleocr import PaddleOCR
+
+    global ocr, doc
+    threads = worker_threads(workers)
+    ocr = PaddleOCR(use_angle_cls=True, lang="en", use_gpu=False, show_log=False, cpu_threads=threads)
+    doc = fitz.open(pdf_path)
+
+def checkpoint_path(page_num):
+    return os.path.join(CHECKPOINT_DIR, f"page_{page_num+1}.json")
+
+def save_checkpoint(page_num, text, method):
+    """Write one page result atomically so a crash never leaves a half-written file."""
+    path = checkpoint_path(page_num)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"page": page_num + 1, "method": method, "text": text}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def load_checkpoint(page_num):
+    try:
+        with open(checkpoint_path(page_num), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def extract_text_from_page(image):
+    """Run full-page OCR on a given in-memory page image."""
+    result = ocr.ocr(image)
     lines = []
     if result and result[0]:
         for line in result[0]:
             lines.append(line[1][0])
     return " ".join(lines)
 
-def hybrid_extract():
-    """Main extraction logic combining structure + full-page OCR."""
-    doc = fitz.open(INPUT_PDF)
-    all_text = []
-
-    for page_num in tqdm(range(len(doc)), desc="Extracting Pages", unit="page"):
-        try:
-            # Render the page to an image
-            page = doc[page_num]
-            pix = page.get_pixmap(dpi=300)
-            page_img_path = os.path.join(OUTPUT_DIR, f"page_{page_num+1}.png")
-            pix.save(page_img_path)
-
-            # --- Step 1: Try PaddleOCR Structure (Layout-aware) ---
-            structure_res = ocr.ocr(page_img_path, cls=True)
-
-            if structure_res and len(structure_res[0]) > 0:
-                text_segments = [line[1][0] for line in structure_res[0]]
-                combined_text = " ".join(text_segments)
-                all_text.append(combined_text)
-                print(f"[✔] Structured OCR extracted page {page_num+1}")
-            else:
-                # --- Step 2: Fallback to Full-Page OCR ---
-                fallback_text = extract_text_from_page(page_img_path)
-                if fallback_text.strip():
-                    all_text.append(fallback_text)
-                    print(f"[🩵] Fallback OCR used for page {page_num+1}")
-                else:
-                    print(f"[⚠️] No text found on page {page_num+1}")
-
-        except Exception as e:
-            print(f"[⚠️] Error processing page {page_num+1}: {e}")
+def process_page(page_num):
+    """OCR a single page and checkpoint its text. Runs inside a worker process."""
+    # Render the page straight into memory (PNG is only written when SAVE_PAGE_IMAGES=1)
+    image = render_page(doc[page_num], dpi=300, debug_path=os.path.join(OUTPUT_DIR, f"page_{page_num+1}.png"))
+
+    # --- Step 1: Try PaddleOCR Structure (Layout-aware) ---
+    structure_res = ocr.ocr(image, cls=True)
+
+    if structure_res and structure_res[0]:
+        text_segments = [line[1][0] for line in structure_res[0]]
+        text, method = " ".join(text_segments), "structured"
+    else:
+        # --- Step 2: Fallback to Full-Page OCR ---
+        text, method = extract_text_from_page(image), "fallback"
+        if not text.strip():
+            method = "empty"
+
+    save_checkpoint(page_num, text, method)
+    return page_num, method
+
+def run_page(page_num):
+    """Error-isolating wrapper: a failing page is reported, not checkpointed, and retried next run."""
+    try:
+        return process_page(page_num)
+    except Exception as e:
+        return page_num, f"error: {e}"
+
+def report_page(page_num, method):
+    if method == "structured":
+        print(f"[✔] Structured OCR extracted page {page_num+1}")
+    elif method == "fallback":
+        print(f"[🩵] Fallback OCR used for page {page_num+1}")
+    elif method == "empty":
+        print(f"[⚠️] No text found on page {page_num+1}")
+    else:
+        print(f"[⚠️] Error processing page {page_num+1}: {method[len('error: '):]}")
+
+def reset_checkpoints_for(source_hash):
+    """Checkpoints are per page number only: drop them when they came from a different PDF."""
+    marker = os.path.join(CHECKPOINT_DIR, "source.json")
+    try:
+        with open(marker, "r", encoding="utf-8") as f:
+            previous = json.load(f).get("source_hash")
+    except (OSError, ValueError):
+        previous = None
+    if previous == source_hash:
+        return
+    # Checkpoints from before the marker existed are assumed to belong to this PDF
+    if previous is not None:
+        stale = [name for name in os.listdir(CHECKPOINT_DIR) if name.startswith("page_") and name.endswith(".json")]
+        for name in stale:
+            os.remove(os.path.join(CHECKPOINT_DIR, name))
+        print(f"♻️ Source PDF changed — discarded {len(stale)} page checkpoint(s)")
+    with open(marker, "w", encoding="utf-8") as f:
+        json.dump({"source_hash": source_hash}, f)
+
+def pending_pages(page_count):
+    """Pages without a valid checkpoint — the only ones a rerun has to process."""
+    return [p for p in range(page_count) if load_checkpoint(p) is None]
+
+def route_pages(pdf, pages):
+    """
+    Classify pages from their text layer. Pages with a usable text layer are
+    checkpointed right away; only scanned / image-heavy pages are returned for OCR.
+    """
+    ocr_pages = []
+    routes = {"text": 0, "ocr": 0}
+    for page_num in pages:
+        score = classify_page(pdf[page_num])
+        routes[score["route"]] += 1
+        if score["route"] == "text":
+            save_checkpoint(page_num, score["text"], "text_layer")
+        else:
+            ocr_pages.append(page_num)
+    return ocr_pages, routes
+
+def hybrid_extract(workers=NUM_WORKERS):
+    """
+    Unified extraction: take the PDF text layer wherever it is usable and send only
+    scanned or image-heavy pages through PaddleOCR, spread over a process pool.
+    """
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    doc_name = os.path.basename(INPUT_PDF)
+    source_hash = file_hash(INPUT_PDF)
+    store = DocumentStore()
+    if store.is_current(doc_name, EXTRACTOR, source_hash):
+        print(f"✅ {doc_name} unchanged since the last extraction — document store is up to date")
+        return
+    reset_checkpoints_for(source_hash)
+
+    with fitz.open(INPUT_PDF) as pdf:
+        page_count = len(pdf)
+        todo = pending_pages(page_count)
+        print(f"📑 {page_count - len(todo)}/{page_count} pages already checkpointed, {len(todo)} to process")
+        todo, routes = route_pages(pdf, todo)
+
+    print(f"🔀 Routing: {routes['text']} page(s) via text layer, {routes['ocr']} page(s) via OCR")
+    if todo and workers > 1:
+        print(f"🧵 {workers} OCR processes × {worker_threads(workers)} CPU thread(s) each")
+
+    if todo:
+        limit_threads(workers)
+        if workers <= 1:
+            init_worker(INPUT_PDF, 1)
+            results = (run_page(p) for p in todo)
+            for page_num, method in tqdm(results, total=len(todo), desc="Extracting Pages", unit="page"):
+                report_page(page_num, method)
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(INPUT_PDF, workers)) as pool:
+                futures = [pool.submit(run_page, p) for p in todo]
+                for future in tqdm(as_completed(futures), total=len(futures), desc="Extracting Pages", unit="page"):
+                    report_page(*future.result())
+
+    # Assemble the document from checkpoints: one row per page, in page order.
+    # Failed pages are left out (and the document marked incomplete so a rerun retries them).
+    rows = []
+    missing = 0
+    methods = {}
+    for page_num in range(page_count):
+        record = load_checkpoint(page_num)
+        if record is None:
+            missing += 1
             continue
+        methods[record["method"]] = methods.get(record["method"], 0) + 1
+        rows.append((page_num + 1, 0, "page", record["text"].strip(), record["method"]))
 
-    # Save combined clean text
-    os.makedirs(os.path.dirname(CLEAN_TEXT_PATH), exist_ok=True)
-    with open(CLEAN_TEXT_PATH, "w", encoding="utf-8") as f:
-        f.write("\n".join(all_text))
+    store_path = store.write(doc_name, EXTRACTOR, source_hash, rows, page_count, complete=not missing)
+    # Flat copy for tools that read a text file (benchmarks, embedder checks)
+    store.export_text(doc_name, CLEAN_TEXT_PATH, EXTRACTOR)
 
     print(f"\n✅ Hybrid extraction completed successfully!")
-    print(f"📄 Text saved to: {CLEAN_TEXT_PATH}")
-    print(f"🧩 Total pages processed: {len(doc)}")
+    print(f"🗃️ Document store: {store_path}")
+    print(f"📄 Text exported to: {CLEAN_TEXT_PATH}")
+    print(f"🧩 Total pages processed: {page_count}")
+    print("📊 Pages per extraction path: " + ", ".join(f"{m}={n}" for m, n in sorted(methods.items())))
+    if missing:
+        print(f"[⚠️] {missing} page(s) failed and will be retried on the next run")
 
 if __name__ == "__main__":
     hybrid_extract()
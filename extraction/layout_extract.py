@@ -1,48 +1,47 @@
+# Run from the repository root: python -m extraction.layout_extract
 import os
 import fitz
 from paddleocr import PPStructure, save_structure_res
-import cv2
+from extraction.page_render import render_batches, SAVE_PAGE_IMAGES
+from app.doc_store import DocumentStore, file_hash, layout_rows
 
 INPUT_PDF = "input/mastering_rag.pdf"
 OUTPUT_DIR = "data/structure_output"
-FINAL_TEXT = "data/extracted_text.txt"
+EXTRACTOR = "layout"
+BATCH_SIZE = int(os.getenv("LAYOUT_BATCH_SIZE", "4"))
+# Per-page crops and result files are for debugging only; results stay in memory otherwise
+SAVE_STRUCTURE_RES = os.getenv("SAVE_STRUCTURE_RES", "0") == "1"
 
-def extract():
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
+def analyze_batch(table_engine, batch):
+    """Run the layout engine over a small batch of in-memory page images."""
+    return [(page_num, table_engine(img)) for page_num, img in batch]
 
+def extract():
+    doc_name = os.path.basename(INPUT_PDF)
+    source_hash = file_hash(INPUT_PDF)
+    store = DocumentStore()
+    if store.is_current(doc_name, EXTRACTOR, source_hash):
+        print(f"✅ {doc_name} unchanged since the last layout extraction — nothing to do")
+        return
+
+    if SAVE_PAGE_IMAGES or SAVE_STRUCTURE_RES:
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
     table_engine = PPStructure(show_log=False, lang="en")
     doc = fitz.open(INPUT_PDF)
-    all_text = []
-
-    for page_num in range(len(doc)):
-        page = doc[page_num]
-        pix = page.get_pixmap(dpi=180)
-        img_path = f"{OUTPUT_DIR}/page_{page_num+1}.png"
-        pix.save(img_path)
-
-        img = cv2.imread(img_path)
-        result = table_engine(img)
-
-        save_structure_res(result, OUTPUT_DIR, f"page_{page_num+1}")
-
-        for block in result:
-            if block["type"] == "text":
-                lines = [line.get("text", "").strip() for line in block["res"]]
-                all_text.append(" ".join(lines))
-
-            elif block["type"] == "table" and "res" in block:
-                table_rows = []
-                for row in block["res"]:
-                    row_text = [cell.get("text", "").strip() for cell in row]
-                    table_rows.append(" | ".join(row_text))
-                all_text.append("\n".join(table_rows))
-
-        print(f"[✔] Processed Page {page_num+1}/{len(doc)}")
-
-    with open(FINAL_TEXT, "w", encoding="utf-8") as f:
-        f.write("\n\n".join(all_text))
-
-    print("\n✅ Extraction Complete →", FINAL_TEXT)
+    rows = []
+    debug_dir = OUTPUT_DIR if SAVE_PAGE_IMAGES else None
+
+    # Pages go straight from the pixmap buffer to PPStructure — no PNG round trip
+    for batch in render_batches(doc, range(len(doc)), dpi=180, batch_size=BATCH_SIZE, debug_dir=debug_dir):
+        for page_num, result in analyze_batch(table_engine, batch):
+            if SAVE_STRUCTURE_RES:
+                save_structure_res(result, OUTPUT_DIR, f"page_{page_num+1}")
+            # Every block is kept with its layout type (text, title, table, figure, ...)
+            rows.extend(layout_rows(page_num + 1, result))
+            print(f"[✔] Processed Page {page_num+1}/{len(doc)}")
+
+    path = store.write(doc_name, EXTRACTOR, source_hash, rows, len(doc))
+    print("\n✅ Extraction Complete →", path)
 
 if __name__ == "__main__":
     extract()
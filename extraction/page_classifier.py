@@ -0,0 +1,80 @@
+"""
+Text-layer-first page classifier
+--------------------------------
+Scores each PDF page from its embedded text layer so OCR only runs on pages
+that actually need it (scans, image-heavy slides, broken font encodings).
+"""
+
+import re
+import unicodedata
+
+# === Thresholds ===
+MIN_TEXT_CHARS = 50          # fewer usable characters than this → treat as scanned
+MAX_GARBAGE_RATIO = 0.10     # share of unreadable glyphs that marks a broken text layer
+IMAGE_HEAVY_COVERAGE = 0.60  # page area covered by images
+IMAGE_HEAVY_MAX_CHARS = 400  # ...combined with only a caption's worth of text
+
+
+def normalize_text(text: str) -> str:
+    """Same whitespace normalization as extract_text.py."""
+    return re.sub(r"\n\s*\n", "\n\n", text)
+
+
+def garbage_ratio(text: str) -> float:
+    """Share of non-whitespace characters that are replacement, private-use or control glyphs."""
+    chars = [c for c in text if not c.isspace()]
+    if not chars:
+        return 0.0
+    bad = 0
+    for c in chars:
+        category = unicodedata.category(c)
+        if c == "�" or category in ("Co", "Cc", "Cn", "Cs"):
+            bad += 1
+    return bad / len(chars)
+
+
+def image_coverage(page) -> float:
+    """Fraction of the page area covered by embedded images (clipped to the page)."""
+    page_rect = page.rect
+    page_area = page_rect.width * page_rect.height
+    if page_area <= 0:
+        return 0.0
+    covered = 0.0
+    for info in page.get_image_info():
+        x0, y0, x1, y1 = info["bbox"]
+        x0, y0 = max(x0, page_rect.x0), max(y0, page_rect.y0)
+        x1, y1 = min(x1, page_rect.x1), min(y1, page_rect.y1)
+        if x1 > x0 and y1 > y0:
+            covered += (x1 - x0) * (y1 - y0)
+    return min(covered / page_area, 1.0)
+
+
+def classify_page(page):
+    """
+    Score a PyMuPDF page and decide how to extract it.
+
+    Returns a dict with the page's text layer and scores; ``route`` is
+    ``"text"`` when the embedded text can be used as-is, ``"ocr"`` otherwise.
+    """
+    text = normalize_text(page.get_text("text"))
+    char_count = len(text.strip())
+    garbage = garbage_ratio(text)
+    coverage = image_coverage(page)
+
+    if char_count < MIN_TEXT_CHARS:
+        route, reason = "ocr", "no text layer"
+    elif garbage > MAX_GARBAGE_RATIO:
+        route, reason = "ocr", "garbled text layer"
+    elif coverage > IMAGE_HEAVY_COVERAGE and char_count < IMAGE_HEAVY_MAX_CHARS:
+        route, reason = "ocr", "image-heavy page"
+    else:
+        route, reason = "text", "text layer ok"
+
+    return {
+        "route": route,
+        "reason": reason,
+        "text": text,
+        "char_count": char_count,
+        "garbage_ratio": garbage,
+        "image_coverage": coverage,
+    }
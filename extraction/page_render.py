@@ -0,0 +1,48 @@
+"""
+In-memory page rendering
+------------------------
+Turns PyMuPDF pixmaps into NumPy images for PaddleOCR / PPStructure without a
+PNG round trip through disk. Page images are only written when explicitly
+requested for debugging (SAVE_PAGE_IMAGES=1).
+"""
+
+import os
+import numpy as np
+
+SAVE_PAGE_IMAGES = os.getenv("SAVE_PAGE_IMAGES", "0") == "1"
+
+
+def pixmap_to_array(pix):
+    """
+    View the pixmap buffer as an HxWxC uint8 array and return it in BGR order,
+    the layout cv2.imread() produced and Paddle's models expect.
+
+    The buffer view itself is zero-copy; the channel swap makes the single
+    contiguous in-memory copy the OCR engines need.
+    """
+    buf = pix.samples_mv if hasattr(pix, "samples_mv") else pix.samples
+    rgb = np.frombuffer(buf, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    if pix.n == 1:
+        return np.ascontiguousarray(np.repeat(rgb, 3, axis=2))
+    return np.ascontiguousarray(rgb[:, :, 2::-1])
+
+
+def render_page(page, dpi, debug_path=None):
+    """Render one page to a BGR array; optionally keep a PNG copy for debugging."""
+    pix = page.get_pixmap(dpi=dpi, alpha=False)
+    if SAVE_PAGE_IMAGES and debug_path:
+        pix.save(debug_path)
+    return pixmap_to_array(pix)
+
+
+def render_batches(doc, page_nums, dpi, batch_size, debug_dir=None):
+    """Yield lists of (page_num, image) so only ``batch_size`` rendered pages live in memory at once."""
+    batch = []
+    for page_num in page_nums:
+        debug_path = os.path.join(debug_dir, f"page_{page_num+1}.png") if debug_dir else None
+        batch.append((page_num, render_page(doc[page_num], dpi, debug_path)))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,72 @@
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+import numpy as np  # noqa: E402
+import answer_cache  # noqa: E402
+from answer_cache import SemanticAnswerCache  # noqa: E402
+
+QUESTION = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+PARAPHRASE = np.array([0.99, 0.05, 0.0], dtype=np.float32)
+OTHER = np.array([0.0, 1.0, 0.0], dtype=np.float32)
+
+
+def write_manifest(path, version, mtime):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"version": version}, f)
+    os.utime(path, (mtime, mtime))
+
+
+def make_cache(tmp_path, **kw):
+    manifest = tmp_path / "manifest.json"
+    if not manifest.exists():
+        write_manifest(manifest, "v1", 1_000)
+    return SemanticAnswerCache("test", cache_dir=str(tmp_path), manifest_path=str(manifest), **kw)
+
+
+def test_hit_needs_similar_question_and_same_chunks(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.store("What is RAG?", QUESTION, ["c1", "c2"], "an answer")
+    assert cache.lookup(PARAPHRASE, ["c2", "c1"]) == "an answer"
+    assert cache.lookup(OTHER, ["c1", "c2"]) is None
+    assert cache.lookup(QUESTION, ["c1", "c3"]) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_entries_expire_after_ttl(tmp_path, monkeypatch):
+    cache = make_cache(tmp_path, ttl=60)
+    now = 1_000_000.0
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now)
+    cache.store("What is RAG?", QUESTION, ["c1"], "an answer")
+    now += 59
+    assert cache.lookup(QUESTION, ["c1"]) == "an answer"
+    now += 2
+    assert cache.lookup(QUESTION, ["c1"]) is None
+
+
+def test_store_change_invalidates(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.store("What is RAG?", QUESTION, ["c1"], "an answer")
+    write_manifest(tmp_path / "manifest.json", "v1", 2_000)  # touched, same content
+    assert cache.lookup(QUESTION, ["c1"]) == "an answer"
+    write_manifest(tmp_path / "manifest.json", "v2", 3_000)
+    assert cache.lookup(QUESTION, ["c1"]) is None
+    assert cache.stats()["entries"] == 0
+    # Another process opening the cache sees the same version and keeps new entries
+    cache.store("What is RAG?", QUESTION, ["c1"], "a new answer")
+    assert make_cache(tmp_path).lookup(QUESTION, ["c1"]) == "a new answer"
+
+
+def test_least_recently_used_evicted(tmp_path, monkeypatch):
+    cache = make_cache(tmp_path, max_entries=2)
+    clock = iter(range(1_000_000, 1_000_100))
+    monkeypatch.setattr(answer_cache.time, "time", lambda: float(next(clock)))
+    cache.store("a", QUESTION, ["a"], "A")
+    cache.store("b", QUESTION, ["b"], "B")
+    assert cache.lookup(QUESTION, ["a"]) == "A"  # b is now the least recently used
+    cache.store("c", QUESTION, ["c"], "C")
+    assert cache.lookup(QUESTION, ["b"]) is None
+    assert cache.lookup(QUESTION, ["a"]) == "A"
+    assert cache.lookup(QUESTION, ["c"]) == "C"
@@ -0,0 +1,20 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from chunker import paragraph_units  # noqa: E402
+
+
+def sections(text):
+    return [u["heading"] for u in paragraph_units(1, 0, text) if u["heading"]]
+
+
+def test_acronyms_inside_a_sentence_are_not_headings():
+    units = paragraph_units(1, 0, "We compared the BM25 RAG LLM pipeline against dense retrieval. It won.")
+    assert [u["text"] for u in units] == ["We compared the BM25 RAG LLM pipeline against dense retrieval.", "It won."]
+    assert sections("Our CPU GPU TPU numbers and the HNSW IVF PQ indexes are in Table 2.") == []
+
+
+def test_upper_case_line_is_a_heading():
+    assert sections("Intro text here.\n01 INTRODUCTION TO LLMS\nLarge models are big.") == ["01 INTRODUCTION TO LLMS"]
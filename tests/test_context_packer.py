@@ -0,0 +1,52 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from context_packer import ContextPacker, merge_text  # noqa: E402
+
+FIRST = "Retrieval finds the chunks. The overlapping sentence is repeated here."
+SECOND = "The overlapping sentence is repeated here. Generation then writes the answer."
+JOINED = "Retrieval finds the chunks. The overlapping sentence is repeated here. Generation then writes the answer."
+OTHER = "An unrelated passage about tokenizers and token budgets."
+
+
+def test_merge_text():
+    assert merge_text(FIRST, SECOND) == JOINED
+    assert merge_text(SECOND, FIRST) == JOINED
+    assert merge_text(JOINED, SECOND) == JOINED
+    assert merge_text(FIRST, OTHER) is None
+    assert merge_text("ends with beta", "beta starts this") is None  # overlap under MIN_OVERLAP_CHARS
+
+
+def test_pack_merges_overlaps_and_keeps_rank_order():
+    packer = ContextPacker(budget=1000)
+    context, info = packer.pack([OTHER, SECOND, FIRST, JOINED])
+    assert context == OTHER + "\n\n" + JOINED
+    assert info["spans"] == 2 and info["chunks_used"] == 4
+    assert info["chars_saved"] == len(FIRST) + len(SECOND) + len(JOINED) - len(JOINED)
+
+
+def test_bridging_chunk_joins_two_spans_with_combined_citation():
+    middle = FIRST.split(". ")[1]
+    bridge = "Retrieval finds the chunks. " + middle + " Generation"
+    packer = ContextPacker(budget=1000)
+    context, info = packer.pack(
+        ["Retrieval finds the chunks.", SECOND, bridge],
+        metadatas=[{"source": "guide.txt", "page_start": 4, "page_end": 4},
+                   {"source": "guide.txt", "page_start": 5, "page_end": 5}, None])
+    assert info["spans"] == 1
+    assert context == "[guide.txt p. 4–5]\n" + JOINED
+    assert info["citations"] == ["guide.txt p. 4–5"]
+
+
+def test_budget_skips_chunks_that_do_not_fit():
+    big, small = "x" * 400, "y" * 40  # 100 and 10 estimated tokens
+    packer = ContextPacker(budget=60)
+    context, info = packer.pack([small, big, small.replace("y", "z")])
+    assert context == small + "\n\n" + "z" * 40
+    assert info["chunks_dropped"] == 1 and info["tokens"] <= 60
+
+    # The best chunk alone over budget is truncated rather than dropped
+    context, info = packer.pack([big])
+    assert context == "x" * 240 and info["tokens"] == 60
@@ -0,0 +1,37 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from doc_store import DocumentStore, PAGE_BREAK, file_hash  # noqa: E402
+
+ROWS = [(3, 0, "text", "Last page.", "ocr"),
+        (1, 1, "text", "Body text.", "text"),
+        (1, 0, "title", "Getting  Started", "text"),
+        (1, 2, "figure", "OCR noise from a figure", "ocr")]
+
+
+def test_is_current_follows_hash_and_completeness(tmp_path):
+    source = tmp_path / "guide.pdf"
+    source.write_bytes(b"%PDF- one")
+    store = DocumentStore(str(tmp_path / "store"))
+    source_hash = file_hash(str(source))
+    assert not store.is_current("guide.pdf", "text", source_hash)
+
+    store.write("guide.pdf", "text", source_hash, ROWS, page_count=4, complete=False)
+    assert not store.is_current("guide.pdf", "text", source_hash)  # partial runs are redone
+    store.write("guide.pdf", "text", source_hash, ROWS, page_count=4)
+    assert store.is_current("guide.pdf", "text", source_hash)
+    assert not store.is_current("guide.pdf", "hybrid", source_hash)
+
+    source.write_bytes(b"%PDF- two")
+    assert not store.is_current("guide.pdf", "text", file_hash(str(source)))
+
+
+def test_iter_text_orders_pages_and_keeps_page_breaks(tmp_path):
+    store = DocumentStore(str(tmp_path))
+    store.write("guide.pdf", "text", "h", ROWS, page_count=4)
+    store.write("guide.pdf", "layout", "h", ROWS[:1], page_count=4)
+    assert store.preferred(["layout", "text"]) == [("guide.pdf", "layout")]
+    assert list(store.iter_text("guide.pdf", "text")) == [
+        "# Getting Started", "\n\nBody text.", PAGE_BREAK, PAGE_BREAK, "Last page.", PAGE_BREAK]
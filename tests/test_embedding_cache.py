@@ -0,0 +1,46 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+import numpy as np  # noqa: E402
+from embedding_cache import EmbeddingCache  # noqa: E402
+
+DIM = 4
+TEN_ROWS_MB = 10 * DIM * 4 / (1024 * 1024)
+
+
+def fake_encode(calls):
+    def encode(texts):
+        calls.append(list(texts))
+        return np.array([[len(t), i, 0, 1] for i, t in enumerate(texts)], dtype=np.float32)
+    return encode
+
+
+def test_only_misses_are_encoded_and_survive_reopen(tmp_path):
+    calls = []
+    cache = EmbeddingCache("test/model", cache_dir=str(tmp_path))
+    first = cache.encode(["a", "bb", "a"], fake_encode(calls))
+    assert calls == [["a", "bb"]]
+    assert np.array_equal(first[0], first[2])
+
+    reopened = EmbeddingCache("test/model", cache_dir=str(tmp_path))
+    again = reopened.encode(["bb", "ccc"], fake_encode(calls))
+    assert calls[-1] == ["ccc"]
+    assert np.array_equal(again[0], first[1])
+    assert reopened.stats()["hits"] == 1
+
+
+def test_least_recently_used_rows_are_evicted(tmp_path):
+    cache = EmbeddingCache("test-model", cache_dir=str(tmp_path), max_mb=TEN_ROWS_MB)
+    for i in range(10):
+        cache.put_many([f"t{i}"], np.full((1, DIM), i, dtype=np.float32))
+    assert cache.capacity == 10
+    cache.get_many(["t0"])  # t1 is now the least recently used
+    cache.put_many(["t10"], np.full((1, DIM), 10, dtype=np.float32))
+
+    t0, t1, t10 = cache.get_many(["t0", "t1", "t10"])
+    assert t1 is None
+    assert np.array_equal(t0, np.zeros(DIM)) and np.array_equal(t10, np.full(DIM, 10))
+    assert cache.stats()["evictions"] == 1
+    assert cache.capacity == 10
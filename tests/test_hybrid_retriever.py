@@ -0,0 +1,54 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+import numpy as np  # noqa: E402
+from hybrid_retriever import HybridRetriever, reciprocal_rank_fusion, RRF_K  # noqa: E402
+from lexical_index import LexicalIndex, lexical_index_path, tokenize  # noqa: E402
+from vector_index import LocalIndex  # noqa: E402
+
+DOCS = {
+    "c0": "Chunks are embedded with a sentence transformer model",
+    "c1": "The gpt-4 model answers from the retrieved context",
+    "c2": "Reciprocal rank fusion merges the BM25 and vector rankings",
+    "c3": "Chunks overlap so that sentences are not cut in half",
+}
+
+
+def test_tokenize_keeps_identifiers_and_their_parts():
+    assert tokenize("Use GPT-4 or v1.2!") == ["use", "gpt-4", "gpt", "4", "or", "v1.2", "v1", "2"]
+
+
+def test_bm25_ranks_rare_terms_and_follows_upserts(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical.sqlite"))
+    index.add(list(DOCS), list(DOCS.values()))
+    assert index.search("gpt-4 context")[0][0] == "c1"
+    assert [doc_id for doc_id, _ in index.search("chunks")] in (["c0", "c3"], ["c3", "c0"])
+
+    index.add(["c1"], ["Nothing about language models here"])
+    assert index.search("gpt-4") == []
+    index.delete(["c0"])
+    assert [doc_id for doc_id, _ in index.search("chunks")] == ["c3"]
+    assert index.count() == 3
+
+
+def test_rrf_sums_reciprocal_ranks():
+    fused = dict(reciprocal_rank_fusion([["a", "b"], ["b", "c"]]))
+    assert fused["b"] == 1 / (RRF_K + 2) + 1 / (RRF_K + 1)
+    assert fused["a"] == 1 / (RRF_K + 1)
+    assert max(fused, key=fused.get) == "b"
+
+
+def test_hybrid_query_fuses_both_searches(tmp_path):
+    vectors = np.eye(len(DOCS), 8, dtype=np.float32)
+    collection = LocalIndex(str(tmp_path / "docs_local"), "docs", create=True, dtype="float32")
+    collection.upsert(list(DOCS), list(DOCS.values()), vectors, [{"n": i} for i in range(len(DOCS))])
+    LexicalIndex(lexical_index_path("docs", str(tmp_path))).add(list(DOCS), list(DOCS.values()))
+
+    retriever = HybridRetriever(collection, vectorstore_dir=str(tmp_path), fetch_k=2)
+    # The vector side ranks c0 first, BM25 only knows c2: both come back, with text and metadata
+    result = retriever.query("bm25 fusion", n_results=2, query_embedding=vectors[0] + 0.1 * vectors[3])
+    assert set(result["ids"][0]) == {"c0", "c2"}
+    assert result["documents"][0] == [DOCS[i] for i in result["ids"][0]]
+    assert result["metadatas"][0][result["ids"][0].index("c2")] == {"n": 2}
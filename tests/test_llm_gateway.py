@@ -0,0 +1,76 @@
+import os
+import sys
+import asyncio
+from contextlib import closing
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "app"), os.path.join(ROOT, "benchmarks")]
+
+import pytest  # noqa: E402
+from fake_openai_server import start_fake_server  # noqa: E402
+from llm_gateway import LLMGateway  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "Context:\nThe gateway retries rate limits.\n\nQuestion:\nWhat is retried?"}]
+
+
+@pytest.fixture
+def fake_server():
+    servers = []
+
+    def start(error_every=0):
+        server, url = start_fake_server(ttft=0, token_delay=0, error_every=error_every)
+        servers.append(server)
+        return url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def gateway(url, **kwargs):
+    return LLMGateway(base_url=url, api_key="test", model="stub-model", rpm=0, **kwargs)
+
+
+def test_rate_limited_requests_are_retried(fake_server):
+    client = gateway(fake_server(error_every=2))
+    # Every second server request is a 429: calls 2 and 3 each need one retry
+    answers = [client.complete(MESSAGES) for _ in range(3)]
+    assert all(answers)
+    usage = client.usage.snapshot()["stub-model"]
+    assert usage["requests"] == 3 and usage["retries"] == 2 and usage["errors"] == 0
+
+
+def test_stream_reports_server_usage(fake_server):
+    client = gateway(fake_server())
+    answer = "".join(client.stream(MESSAGES))
+    usage = client.usage.snapshot()["stub-model"]
+    assert usage["completion_tokens"] == len(answer.split(" "))
+
+
+def test_stream_without_usage_is_estimated(fake_server):
+    client = gateway(fake_server())
+    answer = "".join(client.stream(MESSAGES, stream_options={"include_usage": False}))
+    usage = client.usage.snapshot()["stub-model"]
+    assert usage["completion_tokens"] == -(-len(answer) // 4)
+    assert usage["prompt_tokens"] > 0
+
+
+def test_abandoned_stream_releases_its_slot(fake_server):
+    client = gateway(fake_server(), max_concurrency=1)
+    for _ in range(3):
+        with closing(client.stream(MESSAGES)) as tokens:
+            next(tokens)
+    assert client.complete(MESSAGES)
+    assert client.usage.snapshot()["stub-model"]["requests"] == 4
+
+
+def test_async_stream_and_complete(fake_server):
+    client = gateway(fake_server(), max_concurrency=1)
+
+    async def run():
+        tokens = client.astream(MESSAGES)
+        await tokens.__anext__()
+        await tokens.aclose()
+        return await client.acomplete(MESSAGES)
+
+    assert asyncio.run(run())
@@ -0,0 +1,43 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+import numpy as np  # noqa: E402
+from near_dedup import NearDuplicateFilter  # noqa: E402
+
+PASSAGE = ("Retrieval augmented generation grounds the answers of a language model in documents "
+           "fetched from an index at query time, so the model can cite sources it was never trained on "
+           "and the index can be refreshed without retraining anything at all")
+
+
+def fixed_signatures(dedup, signatures):
+    """Make dedup.signature return the given rows, by text."""
+    dedup.signature = lambda text: np.array(signatures[text], dtype=np.uint32)
+
+
+def test_near_duplicates_collapse_into_first_occurrence():
+    dedup = NearDuplicateFilter()
+    chunks = [(PASSAGE, {"n": 0}),
+              (PASSAGE.replace("at all", "at all."), {"n": 1}),
+              ("Chunking splits documents into overlapping windows before they are embedded", {"n": 2}),
+              (PASSAGE.upper(), {"n": 3})]
+    assert [m["n"] for _, m in dedup.filter(chunks)] == [0, 2]
+    assert dedup.clusters == {0: 2}
+    assert dedup.stats()["removed"] == 2
+
+
+def test_bucket_keeps_later_chunks_that_share_a_band():
+    # B shares band 0 with A but is a different chunk; C is a near-duplicate of B that
+    # only agrees with it on band 0, so it is found only if that bucket lists B too
+    a = [0] * 16
+    b = [0] * 8 + [1] * 8
+    c = [0] * 8 + [1] * 7 + [2]
+    dedup = NearDuplicateFilter(num_perm=16, bands=2)
+    fixed_signatures(dedup, {"a": a, "b": b, "c": c})
+    assert [dedup.check(t) for t in "abc"] == [None, None, 1]
+
+    full = NearDuplicateFilter(num_perm=16, bands=2, bucket_size=1)
+    fixed_signatures(full, {"a": a, "b": b, "c": c})
+    assert [full.check(t) for t in "abc"] == [None, None, None]
+    assert full.stats()["full_buckets"] == 2
@@ -0,0 +1,55 @@
+import os
+import sys
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+import pytest  # noqa: E402
+from query_service import BadRequest, MAX_N_RESULTS, parse_query, service  # noqa: E402
+
+
+@pytest.mark.parametrize("body", [
+    [],
+    {},
+    {"question": "   "},
+    {"question": 42},
+    {"question": "q", "n_results": 0},
+    {"question": "q", "n_results": MAX_N_RESULTS + 1},
+    {"question": "q", "n_results": True},
+    {"question": "q", "n_results": "5"},
+    {"question": "q", "generate": "yes"},
+    {"question": "q", "pages": [3]},
+    {"question": "q", "pages": [1, "2"]},
+    {"question": "q", "pages": [True, 2]},
+    {"question": "q", "section": 7},
+    {"question": "q", "shards": "a"},
+    {"question": "q", "shards": ["a", 1]},
+])
+def test_parse_query_rejects(body):
+    with pytest.raises(BadRequest):
+        parse_query(body)
+
+
+def test_parse_query_defaults_and_filters():
+    assert parse_query({"question": " What is RAG? "}) == {
+        "question": "What is RAG?", "n_results": 5, "generate": True, "where": None, "shards": None}
+    parsed = parse_query({"question": "q", "n_results": 3, "generate": False, "pages": [2, 4], "section": "Intro"})
+    assert parsed["where"] == {"$and": [{"page_start": {"$lte": 4}}, {"page_end": {"$gte": 2}}, {"section": "Intro"}]}
+
+
+def test_loader_failure_reaches_status(monkeypatch):
+    def load():
+        raise RuntimeError("index missing")
+
+    monkeypatch.setattr(service, "load", load)
+    monkeypatch.setitem(service.status, "error", None)
+
+    async def run():
+        await service.start()
+        await asyncio.gather(service._load_task, return_exceptions=True)
+        await asyncio.sleep(0)  # done callbacks run on the next loop iteration
+        await service.batcher.stop()
+
+    asyncio.run(run())
+    assert service.status["error"] == "index missing"
+    assert not service.ready
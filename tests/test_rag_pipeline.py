@@ -0,0 +1,72 @@
+import os
+import sys
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+import numpy as np  # noqa: E402
+from chunker import StructureChunker  # noqa: E402
+from rag_pipeline import IndexWriter, load_manifest  # noqa: E402
+
+
+class _NoCache:
+    def report(self):
+        pass
+
+
+class CountingEmbedder:
+    """Deterministic stand-in for embedder.Embedder that records what it was asked to embed."""
+
+    model_name = "counting-8"
+    backend = "test"
+    cache = _NoCache()
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, batch_size=None):
+        self.calls.extend(texts)
+        out = np.zeros((len(texts), 8), dtype=np.float32)
+        for row, text in enumerate(texts):
+            out[row, zlib.crc32(text.encode("utf-8")) % 8] = 1.0
+        return out
+
+    def chroma_function(self):
+        return None
+
+
+def ingest(tmp_path, embedder, chunks):
+    writer = IndexWriter("docs", embedder, StructureChunker(None), str(tmp_path), backend="local", batch_size=2)
+    for i, chunk in enumerate(chunks):
+        writer.add(chunk, {"source": "guide.txt", "n": i})
+    version = writer.finish()
+    return writer, version
+
+
+def test_only_new_chunks_are_embedded_and_stale_ones_deleted(tmp_path):
+    embedder = CountingEmbedder()
+    _, first = ingest(tmp_path, embedder, ["alpha", "beta", "gamma", "alpha"])
+    assert sorted(embedder.calls) == ["alpha", "beta", "gamma"]
+
+    embedder.calls.clear()
+    writer, second = ingest(tmp_path, embedder, ["gamma", "alpha", "delta"])
+    assert embedder.calls == ["delta"]
+    assert writer.deleted == 1 and writer.collection.count() == 3
+    assert second != first
+    # Unchanged chunks that moved keep their vectors but get the new metadata
+    moved = writer.collection.get(ids=[i for i in writer.seen], include=["documents", "metadatas"])
+    assert dict(zip(moved["documents"], (m["n"] for m in moved["metadatas"])))["gamma"] == 0
+
+    embedder.calls.clear()
+    writer, third = ingest(tmp_path, embedder, ["gamma", "alpha", "delta"])
+    assert embedder.calls == [] and third == second
+    assert writer.lexical.count() == 3
+
+
+def test_fingerprint_change_forces_full_rebuild(tmp_path):
+    ingest(tmp_path, CountingEmbedder(), ["alpha", "beta"])
+    other = CountingEmbedder()
+    other.model_name = "counting-8-v2"
+    writer, _ = ingest(tmp_path, other, ["alpha", "beta"])
+    assert writer.full_rebuild and sorted(other.calls) == ["alpha", "beta"]
+    assert load_manifest(str(tmp_path), "docs")["fingerprint"]["model"] == "counting-8-v2"
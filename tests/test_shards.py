@@ -0,0 +1,60 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+import numpy as np  # noqa: E402
+from lexical_index import LexicalIndex, lexical_index_path  # noqa: E402
+from shards import ShardRegistry, open_collection  # noqa: E402
+from vector_index import LocalIndex  # noqa: E402
+
+
+def vectors(n, dim=8, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def build_shards(tmp_path, data, layout):
+    """layout: shard → chunk numbers; returns the saved registry."""
+    registry = ShardRegistry(str(tmp_path))
+    registry.configure("hash", num_shards=len(layout))
+    for shard, rows in layout.items():
+        name = registry.collection_name(shard)
+        ids = [f"c{i}" for i in rows]
+        docs = [f"chunk number {i}" for i in rows]
+        LocalIndex(str(tmp_path / f"{name}_local"), name, create=True, dtype="float32").upsert(
+            ids, docs, data[rows], [{"n": i} for i in rows])
+        LexicalIndex(lexical_index_path(name, str(tmp_path))).add(ids, docs)
+        registry.record(shard, f"{shard}-v1", len(rows), ["guide.txt"])
+    registry.save()
+    return registry
+
+
+def test_fan_out_matches_a_single_index(tmp_path):
+    data = vectors(20)
+    # c5 is stored in both shards and must come back once
+    build_shards(tmp_path, data, {"h00": list(range(0, 10)), "h01": list(range(5, 20))})
+    single = LocalIndex(str(tmp_path / "single"), "single", create=True, dtype="float32")
+    single.upsert([f"c{i}" for i in range(20)], [f"chunk number {i}" for i in range(20)], data,
+                  [{"n": i} for i in range(20)])
+
+    collection = open_collection(vectorstore_dir=str(tmp_path), backend="local")
+    query = data[5:6] + 0.01
+    sharded = collection.query(query_embeddings=query.tolist(), n_results=6)
+    expected = single.query(query_embeddings=query, n_results=6)
+    assert sharded["ids"] == expected["ids"]
+    assert np.allclose(sharded["distances"], expected["distances"], atol=1e-5)
+    lexical_ids = [doc_id for doc_id, _ in collection.lexical.search("number", k=30)]
+    assert sorted(lexical_ids) == sorted(f"c{i}" for i in range(20))
+
+    only = collection.subset(["h00"]).query(query_embeddings=query.tolist(), n_results=20)
+    assert set(only["ids"][0]) == {f"c{i}" for i in range(10)}
+
+
+def test_registry_version_and_layout_changes(tmp_path):
+    registry = build_shards(tmp_path, vectors(4), {"h00": [0, 1], "h01": [2, 3]})
+    version = ShardRegistry(str(tmp_path)).data["version"]
+    registry.record("h01", "h01-v2", 2, ["guide.txt"])
+    registry.save()
+    assert ShardRegistry(str(tmp_path)).data["version"] != version
+    assert not registry.configure("hash", num_shards=2)
+    assert registry.configure("document")
@@ -0,0 +1,81 @@
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+import numpy as np  # noqa: E402
+from vector_index import LocalIndex, open_index  # noqa: E402
+
+
+def vectors(n, dim=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def write_index(path, quant, n=50):
+    index = LocalIndex(str(path), "test", create=True, quant=quant, dtype="float32")
+    index.upsert([f"v{i}" for i in range(n)], [f"doc {i}" for i in range(n)], vectors(n), [{"n": i} for i in range(n)])
+    return index
+
+
+def test_default_open_keeps_stored_quantization(tmp_path):
+    path = tmp_path / "test_local"
+    written = write_index(path, "int8")
+    codes = np.array(written._codes)
+
+    reopened = open_index("local", "test", vectorstore_dir=str(tmp_path))
+    assert reopened.quant == "int8"
+    assert np.array_equal(np.array(reopened._codes), codes)
+    with open(path / "meta.json", "r", encoding="utf-8") as f:
+        assert json.load(f)["quant"] == "int8"
+    assert reopened.query(query_embeddings=vectors(1), n_results=1)["ids"] == [["v0"]]
+
+
+def test_explicit_quant_reencodes(tmp_path):
+    path = tmp_path / "test_local"
+    write_index(path, "int8")
+    reopened = LocalIndex(str(path), "test", quant="binary")
+    assert reopened.quant == "binary"
+    assert not os.path.exists(path / "scales.bin")
+    assert LocalIndex(str(path), "test").quant == "binary"
+
+
+def test_upsert_delete_and_where(tmp_path):
+    index = write_index(tmp_path / "test_local", None, n=10)
+    data = vectors(10)
+    index.upsert(["v3"], ["doc 3 again"], data[3:4], [{"n": 30}])
+    assert index.count() == 10
+    assert index.get(ids=["v3"])["documents"] == ["doc 3 again"]
+
+    index.delete(["v4"])
+    assert index.count() == 9
+    assert "v4" not in index.query(query_embeddings=data[4:5], n_results=10)["ids"][0]
+
+    hits = index.query(query_embeddings=data[3:4], n_results=5, where={"n": 30})
+    assert hits["ids"] == [["v3"]]
+    assert hits["distances"][0][0] < 1e-4
+
+
+def test_reused_row_does_not_inherit_old_score(tmp_path):
+    index = write_index(tmp_path / "test_local", None, n=10)
+    data = vectors(10)
+    snapshot_of = index._snapshot
+
+    def racing_snapshot():
+        snapshot = snapshot_of()
+        search = snapshot.search
+
+        def search_then_mutate(query, rows, k):
+            result = search(query, rows, k)
+            # v0's row is freed and taken by a new chunk between the scan and naming the hits
+            index.delete(["v0"])
+            index.upsert(["new"], ["new doc"], -data[0:1], [{"n": -1}])
+            return result
+
+        snapshot.search = search_then_mutate
+        return snapshot
+
+    index._snapshot = racing_snapshot
+    hits = index.query(query_embeddings=data[0:1], n_results=3)
+    assert "new" not in hits["ids"][0]
+    assert "v0" not in hits["ids"][0]